@@ -0,0 +1,76 @@
+import sys
+import json
+from typing import Optional, Sequence
+
+import click
+
+from .cases import CASES  # registers the cases
+from .runner import compare, load_results, run_benchmarks
+
+
+@click.group()
+def cli() -> None:
+    """
+    Benchmarks for the calcurse_load hooks, run against synthetic data in temporary directories
+    """
+
+
+@cli.command()
+@click.option(
+    "--scale",
+    help="Number of records to generate, can be passed more than once",
+    type=int,
+    multiple=True,
+    default=[1000, 10000],
+    show_default=True,
+)
+@click.option(
+    "--repeat", help="Times to run each case", type=int, default=3, show_default=True
+)
+@click.option(
+    "--only",
+    help="Only run this case, can be passed more than once",
+    type=click.Choice(list(CASES)),
+    multiple=True,
+)
+@click.option(
+    "--output",
+    help="Write the results as JSON to this file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+)
+def run(
+    scale: Sequence[int], repeat: int, only: Sequence[str], output: Optional[str]
+) -> None:
+    """
+    Run the benchmarks
+    """
+    results = run_benchmarks(list(only) or list(CASES), scale, repeat)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+@cli.command(name="compare")
+@click.argument("BASE", type=click.Path(exists=True, dir_okay=False))
+@click.argument("NEW", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--threshold",
+    help="Fail if a case is this much slower than BASE (0.1 is 10%)",
+    type=float,
+    default=0.1,
+    show_default=True,
+)
+def compare_cmd(base: str, new: str, threshold: float) -> None:
+    """
+    Compare the median times in two results files, exits with a
+    non-zero code if any case regressed
+    """
+    regressions = compare(load_results(base), load_results(new), threshold)
+    if regressions:
+        click.echo(f"Regressed: {', '.join(regressions)}", err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
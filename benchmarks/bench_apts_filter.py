@@ -0,0 +1,54 @@
+"""
+Compares filtering the gcal events out of a synthetic appointments file
+line by line in text mode (the previous implementation) against the
+mmap-based read_lines_without_suffix
+
+python3 -m benchmarks.bench_apts_filter [n_lines]
+"""
+
+import sys
+import time
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from calcurse_load.ext.manifest import sha1_lines
+from calcurse_load.ext.utils import yield_lines, read_lines_without_suffix
+
+from .generators import apts_lines
+
+
+def text_filter(path: Path) -> Tuple[List[str], str]:
+    lines = list(yield_lines(path))
+    return [line for line in lines if not line.endswith("[gcal]")], sha1_lines(lines)
+
+
+def measure(
+    name: str, func: Callable[[], Tuple[List[str], str]]
+) -> Tuple[List[str], str]:
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {elapsed:>7.3f}s  peak allocations {peak / 2**20:>7.1f}MiB")
+    return result
+
+
+def main(n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        apts = Path(tmp) / "apts"
+        apts.write_text(
+            "".join(f"{line}\n" for line in apts_lines(n, gcal_fraction=0.8))
+        )
+        print(f"{n} lines, {apts.stat().st_size / 2**20:.1f}MiB")
+        expected = measure("text mode", lambda: text_filter(apts))
+        got = measure("mmap", lambda: read_lines_without_suffix(apts, b"[gcal]"))
+        assert got == expected
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
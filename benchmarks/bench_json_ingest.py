@@ -0,0 +1,61 @@
+"""
+Compares peak memory and time of loading a synthetic gcal export with
+json.load against the streaming readers in calcurse_load.ext.utils, and
+the size and load time of the binary format (gcal_index.binary)
+
+python3 -m benchmarks.bench_json_ingest [n_events]
+"""
+
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, List
+
+from calcurse_load.ext.utils import yield_json
+from gcal_index.binary import BINARY_FORMAT, BinaryExport, read_binary
+
+from .generators import write_gcal_export
+
+
+def measure(name: str, func: Callable[[], int]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<20} {count:>8} events {elapsed:>8.2f}s peak {peak / 2**20:>8.1f}MiB")
+
+
+def main(n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        [array_path] = write_gcal_export(Path(tmp), n, fmt="json")
+        [ndjson_path] = write_gcal_export(Path(tmp), n, fmt="ndjson")
+        [binary_path] = write_gcal_export(Path(tmp), n, fmt=BINARY_FORMAT)
+        print(
+            f"JSON array: {array_path.stat().st_size / 2**20:.1f}MiB, NDJSON: {ndjson_path.stat().st_size / 2**20:.1f}MiB, binary: {binary_path.stat().st_size / 2**20:.1f}MiB"
+        )
+
+        def load_whole() -> int:
+            with array_path.open() as f:
+                events: List[Any] = json.load(f)
+            return sum(1 for _ in events)
+
+        measure("json.load", load_whole)
+        measure("streamed array", lambda: sum(1 for _ in yield_json(array_path)))
+        measure("streamed ndjson", lambda: sum(1 for _ in yield_json(ndjson_path)))
+        measure("binary", lambda: sum(1 for _ in read_binary(str(binary_path))))
+
+        def headers_only() -> int:
+            # e.g. skipping cached events, or ones outside a time range
+            with BinaryExport(str(binary_path)) as export:
+                return sum(1 for _ in export.records())
+
+        measure("binary headers", headers_only)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
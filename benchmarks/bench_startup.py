@@ -0,0 +1,33 @@
+"""
+Checks how long importing everything for '--pre-load todotxt' takes when
+the daemon isn't running (see calcurse_load.client), against a budget.
+Exits with 1 if the fastest run is over it
+
+python3 -m benchmarks.bench_startup [runs]
+"""
+
+import sys
+import tempfile
+from typing import List
+
+from calcurse_load.client import _import_profile
+
+# how long importing everything for a hook is allowed to take, in microseconds
+STARTUP_BUDGET_US = 250_000
+
+
+def main(runs: int) -> int:
+    totals: List[int] = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            total_us, _ = _import_profile(["--pre-load", "todotxt"], tmp)
+        totals.append(total_us)
+    best = min(totals)
+    print(
+        f"imports: best {best / 1000:.1f}ms, worst {max(totals) / 1000:.1f}ms, budget {STARTUP_BUDGET_US / 1000:.1f}ms"
+    )
+    return 0 if best < STARTUP_BUDGET_US else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,50 @@
+"""
+Compares formatting epoch timestamps with a datetime per event (the
+previous implementation) against the table-based formatter
+
+python3 benchmarks/bench_timestamps.py [n_events]
+"""
+
+import sys
+import time
+import random
+from datetime import datetime
+from typing import List, Optional
+
+from calcurse_load.ext.timestamps import LocalTimestampFormatter
+
+
+def pad(i: int) -> str:
+    return str(i).zfill(2)
+
+
+def datetime_timestamp(epochtime: Optional[int]) -> str:
+    if epochtime is None:
+        return ""
+    dt = datetime.fromtimestamp(epochtime)
+    dt = dt.astimezone()
+    return f"{pad(dt.month)}/{pad(dt.day)}/{dt.year} @ {pad(dt.hour)}:{pad(dt.minute)}"
+
+
+def main(n: int) -> None:
+    rand = random.Random(0)
+    # roughly 20 years of events
+    epochs: List[Optional[int]] = [
+        rand.randint(946684800, 946684800 + 20 * 365 * 86400) for _ in range(n)
+    ]
+
+    start = time.perf_counter()
+    expected = [datetime_timestamp(t) for t in epochs]
+    per_event = time.perf_counter() - start
+
+    start = time.perf_counter()
+    got = LocalTimestampFormatter().format_many(epochs)
+    batch = time.perf_counter() - start
+
+    assert got == expected
+    print(f"datetime per event: {per_event:.3f}s")
+    print(f"batch formatter:    {batch:.3f}s ({per_event / batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
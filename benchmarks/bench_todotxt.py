@@ -0,0 +1,95 @@
+"""
+Compares parsing/converting a todo.txt file line by line with a dataclass
+per todo (the previous implementation) against the single-pass parser
+
+python3 -m benchmarks.bench_todotxt [n_lines]
+"""
+
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from calcurse_load.ext.todotxt import parse_todotxt, parse_calcurse
+
+from .generators import todotxt_lines
+
+
+@dataclass
+class OldTodoTxtTodo:
+    priority: str
+    text: str
+
+    def convert(self) -> "OldCalcurseTodo":
+        priority: int = {"(A)": 1, "(B)": 4, "(C)": 7}.get(self.priority, 0)
+        return OldCalcurseTodo(priority, self.text)
+
+    @classmethod
+    def parse_line(cls, line: str) -> "OldTodoTxtTodo":
+        prio, text = re.match(r"^(\([ABC]\))?(.*)", line.strip()).groups()  # type: ignore[union-attr]
+        if prio is None:
+            prio = ""
+        return cls(priority=prio, text=text.strip())
+
+
+@dataclass
+class OldCalcurseTodo:
+    priority: int
+    text: str
+
+    @classmethod
+    def parse_line(cls, line: str) -> "OldCalcurseTodo":
+        prio, text = re.match(r"^(\[-?\d+\])(.*)", line.strip()).groups()  # type: ignore[union-attr]
+        return cls(priority=int(prio.strip("[]")), text=text.strip())
+
+    @property
+    def line(self) -> str:
+        return f"[{self.priority}] {self.text}"
+
+
+def old_pre_load(buf: str) -> str:
+    todos = [
+        OldTodoTxtTodo.parse_line(line) for line in buf.splitlines() if line.strip()
+    ]
+    return "".join(f"{t.convert().line}\n" for t in todos)
+
+
+def new_pre_load(buf: str) -> str:
+    return "".join(f"{t.calcurse_line}\n" for _, t in parse_todotxt(buf))
+
+
+def old_calcurse(buf: str) -> int:
+    return len(
+        [OldCalcurseTodo.parse_line(line) for line in buf.splitlines() if line.strip()]
+    )
+
+
+def new_calcurse(buf: str) -> int:
+    return len(list(parse_calcurse(buf)))
+
+
+def best_of(func: Callable[[str], object], arg: str, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(n: int) -> None:
+    todotxt = "".join(f"{line}\n" for line in todotxt_lines(n))
+    calcurse = new_pre_load(todotxt)
+    for name, old, new, buf in [
+        ("todo.txt -> calcurse", old_pre_load, new_pre_load, todotxt),
+        ("parse calcurse todos", old_calcurse, new_calcurse, calcurse),
+    ]:
+        old_t, new_t = best_of(old, buf), best_of(new, buf)
+        print(
+            f"{name}: {n} lines, previous {old_t:.3f}s, single-pass {new_t:.3f}s ({old_t / new_t:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
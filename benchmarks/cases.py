@@ -0,0 +1,268 @@
+"""
+The benchmark cases, each registered with @case sets up its inputs in
+a workspace at some scale, and returns what to time
+"""
+
+import os
+import json
+import shutil
+import logging
+from datetime import datetime
+from itertools import count
+from typing import List, TYPE_CHECKING, cast
+
+from calcurse_load.ext.gcal import WORKERS_ENV, create_calcurse_event, gcal_ext
+from calcurse_load.ext.manifest import NOTES_FILE
+from calcurse_load.ext.notes import NoteStore
+from calcurse_load.ext.timestamps import get_formatter
+from calcurse_load.ext.todosync import TodoSnapshot
+from calcurse_load.ext.todotxt import TodoTxtTodo, todotxt_ext
+from gcal_index.binary import BINARY_FORMAT, write_binary
+
+from .generators import apts_lines, gcal_events, todotxt_lines, write_gcal_export
+from .runner import CASES, Case, SkipCase, Workspace, case
+
+__all__ = ["CASES"]
+
+if TYPE_CHECKING:
+    from gcal_index.__main__ import GcalAppointmentData
+
+logger = logging.getLogger(__name__)
+
+
+@case("create_calcurse_event")
+def _create_calcurse_event(ws: Workspace, scale: int) -> Case:
+    events = [cast("GcalAppointmentData", e) for e in gcal_events(scale)]
+    formatter = get_formatter()
+    notes: List[NoteStore] = []
+
+    def reset() -> None:
+        notes[:] = [NoteStore(ws.config.calcurse_dir / "notes")]
+
+    def run() -> None:
+        for event in events:
+            create_calcurse_event(event, notes[0], logger, formatter)
+
+    return Case(run, reset)
+
+
+def _gcal_workspace(ws: Workspace, scale: int, fmt: str = "json") -> gcal_ext:
+    write_gcal_export(ws.config.calcurse_load_dir / "gcal", scale, files=4, fmt=fmt)
+    return gcal_ext(config=ws.config)
+
+
+def _write_apts(ws: Workspace, scale: int) -> None:
+    text = "".join(f"{line}\n" for line in apts_lines(max(scale // 10, 1)))
+    (ws.config.calcurse_dir / "apts").write_text(text)
+
+
+def _gcal_cold(ws: Workspace, scale: int, fmt: str) -> Case:
+    ext = _gcal_workspace(ws, scale, fmt)
+
+    def reset() -> None:
+        # as if this was the first run, with no manifest or notes
+        ext.manifest_path.unlink(missing_ok=True)
+        (ext.state_dir / NOTES_FILE).unlink(missing_ok=True)
+        shutil.rmtree(ws.config.calcurse_dir / "notes", ignore_errors=True)
+        _write_apts(ws, scale)
+
+    return Case(ext.pre_load, reset, ext)
+
+
+@case("gcal.pre_load[cold]")
+def _gcal_cold_json(ws: Workspace, scale: int) -> Case:
+    return _gcal_cold(ws, scale, "json")
+
+
+@case("gcal.pre_load[cold,workers=4]")
+def _gcal_cold_workers(ws: Workspace, scale: int) -> Case:
+    cold = _gcal_cold(ws, scale, "json")
+
+    def run() -> None:
+        os.environ[WORKERS_ENV] = "4"
+        try:
+            cold.run()
+        finally:
+            del os.environ[WORKERS_ENV]
+
+    return cold._replace(run=run)
+
+
+@case("gcal.pre_load[cold,binary]")
+def _gcal_cold_binary(ws: Workspace, scale: int) -> Case:
+    return _gcal_cold(ws, scale, BINARY_FORMAT)
+
+
+@case("gcal.pre_load[warm]")
+def _gcal_warm(ws: Workspace, scale: int) -> Case:
+    ext = _gcal_workspace(ws, scale)
+    _write_apts(ws, scale)
+    ext.pre_load()
+    # nothing changed since the last run
+    return Case(ext.pre_load, ext=ext)
+
+
+@case("gcal.pre_load[changed]")
+def _gcal_changed(ws: Workspace, scale: int) -> Case:
+    ext = _gcal_workspace(ws, scale)
+    _write_apts(ws, scale)
+    ext.pre_load()
+    seeds = count(1)
+    gcal_dir = ws.config.calcurse_load_dir / "gcal"
+
+    def reset() -> None:
+        # one of the four export files changed since the last run
+        [changed] = write_gcal_export(
+            gcal_dir / "tmp", max(scale // 4, 1), seed=next(seeds)
+        )
+        changed.replace(gcal_dir / "export0.json")
+
+    return Case(ext.pre_load, reset, ext)
+
+
+def _gcal_appended(ws: Workspace, scale: int, fmt: str) -> Case:
+    gcal_dir = ws.config.calcurse_load_dir / "gcal"
+    write_gcal_export(gcal_dir, scale, files=4, fmt=fmt)
+    ext = gcal_ext(config=ws.config)
+    _write_apts(ws, scale)
+    ext.pre_load()
+    export = gcal_dir / f"export0.{fmt}"
+    events = list(gcal_events(scale))[: -(-scale // 4)]
+    new_events = count()
+
+    def reset() -> None:
+        # the export was re-written with one new event
+        event = next(gcal_events(1, seed=next(new_events)))
+        events.append({**event, "event_id": f"new{len(events)}"})
+        if fmt == BINARY_FORMAT:
+            with export.open("wb") as b:
+                write_binary(events, b)
+            return
+        with export.open("w") as f:
+            if fmt == "ndjson":
+                f.writelines(json.dumps(e) + "\n" for e in events)
+            else:
+                json.dump(events, f)
+
+    return Case(ext.pre_load, reset, ext)
+
+
+@case("gcal.pre_load[appended]")
+def _gcal_appended_json(ws: Workspace, scale: int) -> Case:
+    return _gcal_appended(ws, scale, "json")
+
+
+@case("gcal.pre_load[appended,ndjson]")
+def _gcal_appended_ndjson(ws: Workspace, scale: int) -> Case:
+    return _gcal_appended(ws, scale, "ndjson")
+
+
+@case("gcal.pre_load[appended,binary]")
+def _gcal_appended_binary(ws: Workspace, scale: int) -> Case:
+    return _gcal_appended(ws, scale, BINARY_FORMAT)
+
+
+def _todotxt_workspace(ws: Workspace, scale: int) -> todotxt_ext:
+    ws.todo_file.write_text("".join(f"{line}\n" for line in todotxt_lines(scale)))
+    return todotxt_ext(config=ws.config)
+
+
+@case("todotxt.pre_load")
+def _todotxt_pre_load(ws: Workspace, scale: int) -> Case:
+    ext = _todotxt_workspace(ws, scale)
+
+    def reset() -> None:
+        (ws.config.calcurse_dir / "todo").unlink(missing_ok=True)
+
+    return Case(ext.pre_load, reset, ext)
+
+
+def _todotxt_post_save(ws: Workspace, scale: int, calcurse_todo: List[str]) -> Case:
+    """
+    Sets up todo.txt and the snapshot from pre_load, then each
+    repeat restores them and saves 'calcurse_todo' as the calcurse todo file
+    """
+    ext = _todotxt_workspace(ws, scale)
+    ext.pre_load()
+    todo_txt = ws.todo_file.read_bytes()
+    snapshot = ext.snapshot_path.read_bytes()
+    calcurse_text = "".join(f"{line}\n" for line in calcurse_todo)
+
+    def reset() -> None:
+        ws.todo_file.write_bytes(todo_txt)
+        ext.snapshot_path.write_bytes(snapshot)
+        # so the snapshot matches the restored todo.txt
+        snap = TodoSnapshot.load(ext.snapshot_path, ws.todo_file)
+        assert snap is not None
+        snap.set_todo_file(ws.todo_file)
+        snap.save()
+        (ws.config.calcurse_dir / "todo").write_text(calcurse_text)
+
+    return Case(ext.post_save, reset, ext)
+
+
+@case("todotxt.post_save[append]")
+def _todotxt_append(ws: Workspace, scale: int) -> Case:
+    lines = [
+        TodoTxtTodo.parse_line(line).calcurse_line for line in todotxt_lines(scale)
+    ]
+    lines.extend(f"[0] new todo {i}" for i in range(max(scale // 100, 1)))
+    return _todotxt_post_save(ws, scale, lines)
+
+
+@case("todotxt.post_save[modify]")
+def _todotxt_modify(ws: Workspace, scale: int) -> Case:
+    lines = [
+        TodoTxtTodo.parse_line(line).calcurse_line for line in todotxt_lines(scale)
+    ]
+    # complete every 100th todo in calcurse
+    for i in range(0, len(lines), 100):
+        if not lines[i].startswith("[-"):
+            lines[i] = "[-" + lines[i][1:]
+    return _todotxt_post_save(ws, scale, lines)
+
+
+@case("gcal_index.event_to_dict")
+def _event_to_dict(ws: Workspace, scale: int) -> Case:
+    try:
+        from gcsa.event import Event  # type: ignore[import]
+
+        import gcal_index.__main__ as gcal_index
+        from gcal_index.description_cache import DescriptionCache
+    except ImportError as e:
+        raise SkipCase(str(e))
+
+    events = []
+    for data in gcal_events(scale):
+        text = data["description"]["text"]
+        if data["description"]["links"]:
+            # google returns the description as HTML when it has links
+            text = text + "".join(
+                f'<br><a href="{link}">{link}</a>'
+                for link in data["description"]["links"]
+            )
+        events.append(
+            Event(
+                data["summary"],
+                start=datetime.fromtimestamp(data["start"]),
+                end=(
+                    datetime.fromtimestamp(data["end"])
+                    if data["end"] is not None
+                    else None
+                ),
+                event_id=data["event_id"],
+                description=text,
+                location=data["location"],
+                attendees=[a["email"] for a in data["attendees"]],
+                htmlLink=data["event_link"],
+            )
+        )
+
+    def reset() -> None:
+        gcal_index.description_cache = DescriptionCache()
+
+    def run() -> None:
+        for e in events:
+            gcal_index.event_to_dict(e)
+
+    return Case(run, reset)
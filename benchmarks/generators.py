@@ -0,0 +1,159 @@
+"""
+Deterministic generators for synthetic benchmark inputs: gcal JSON exports,
+calcurse appointment files, and todo.txt/calcurse todo files
+
+Everything is generated from a seeded random.Random, so the same
+(n, seed) always generates the same data
+"""
+
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from gcal_index.binary import BINARY_FORMAT, write_binary
+
+Json = Dict[str, Any]
+
+# 2000-01-01
+START = 946684800
+YEAR = 365 * 86400
+
+
+def _date(rand: random.Random) -> str:
+    return f"{rand.randint(1, 12):02d}/{rand.randint(1, 28):02d}/{rand.randint(2000, 2024)}"
+
+
+def gcal_events(n: int, seed: int = 0) -> Iterator[Json]:
+    """
+    Events in the format gcal_index exports, spread over 20 years, with
+    a mix of short/long descriptions, links, attendees and all day events
+
+    >>> [e["event_id"] for e in gcal_events(2)]
+    ['event00000000', 'event00000001']
+    >>> list(gcal_events(5)) == list(gcal_events(5))
+    True
+    """
+    rand = random.Random(seed)
+    for i in range(n):
+        start = START + rand.randint(0, 20 * YEAR) // 60 * 60
+        all_day = rand.random() < 0.1
+        if all_day:
+            start = start // 86400 * 86400
+        end = (
+            None
+            if rand.random() < 0.02
+            else start + rand.choice([15, 30, 60, 120]) * 60
+        )
+        links = (
+            [f"https://example.com/{i}/{j}" for j in range(rand.randint(1, 3))]
+            if rand.random() < 0.3
+            else []
+        )
+        yield {
+            "summary": f"Meeting {i}",
+            "start": start,
+            "end": end,
+            "event_id": f"event{i:08d}",
+            "description": {
+                "text": f"Agenda for meeting {i}\n"
+                + "Some notes. " * rand.randint(0, 40),
+                "links": links,
+            },
+            "location": rand.choice([None, "Room 1", "Room 2", "Online"]),
+            "recurrence": [],
+            "attendees": [
+                {"email": f"person{j}@example.com", "response_status": "accepted"}
+                for j in range(rand.randint(0, 6))
+            ],
+            "event_link": f"https://www.google.com/calendar/event?eid={i}",
+        }
+
+
+def write_gcal_export(
+    gcal_dir: Path, n: int, files: int = 1, fmt: str = "json", seed: int = 0
+) -> List[Path]:
+    """
+    Write n events split across 'files' exports in gcal_dir, returns the paths.
+    fmt is one of gcal_index.export.FORMATS: JSON arrays, newline delimited
+    JSON, or the binary format
+    """
+    gcal_dir.mkdir(parents=True, exist_ok=True)
+    events = list(gcal_events(n, seed=seed))
+    per_file = -(-n // files) if n else 0
+    paths: List[Path] = []
+    for f in range(files):
+        chunk = events[f * per_file : (f + 1) * per_file]
+        path = gcal_dir / f"export{f}.{fmt}"
+        if fmt == BINARY_FORMAT:
+            with path.open("wb") as b:
+                write_binary(chunk, b)
+            paths.append(path)
+            continue
+        with path.open("w") as fp:
+            if fmt == "ndjson":
+                for event in chunk:
+                    fp.write(json.dumps(event))
+                    fp.write("\n")
+            else:
+                json.dump(chunk, fp)
+        paths.append(path)
+    return paths
+
+
+def apts_lines(n: int, seed: int = 0, gcal_fraction: float = 0.0) -> List[str]:
+    """
+    Lines in a calcurse appointments file: appointments, all day and recurring
+    events. 'gcal_fraction' of them look like events written by the gcal extension
+
+    >>> apts_lines(3)
+    ['07/25/2013 @ 01:30 -> 07/25/2013 @ 01:45 |Call 0', '05/16/2011 [1] |All day thing 1', '03/10/2004 [1] |All day thing 2']
+    """
+    rand = random.Random(seed)
+    lines: List[str] = []
+    for i in range(n):
+        date, hour = _date(rand), rand.randint(0, 22)
+        kind = rand.random()
+        if kind < gcal_fraction:
+            lines.append(
+                f"{date} @ {hour:02d}:00 -> {date} @ {hour + 1:02d}:00>{i:040x} |Meeting {i} [gcal]"
+            )
+        elif rand.random() < 0.3:
+            lines.append(f"{date} [1] |All day thing {i}")
+        elif rand.random() < 0.1:
+            lines.append(
+                f"{date} @ {hour:02d}:00 -> {date} @ {hour:02d}:30 {{1W}} |Weekly {i}"
+            )
+        else:
+            lines.append(f"{date} @ {hour:02d}:30 -> {date} @ {hour:02d}:45 |Call {i}")
+    return lines
+
+
+def todotxt_lines(n: int, seed: int = 0) -> List[str]:
+    """
+    Lines in a todo.txt file, with a mix of priorities, completed
+    todos, creation/completion dates, projects and contexts
+
+    >>> todotxt_lines(3, seed=2)
+    ['2021-01-01 todo number 0 +project0', '2021-01-01 todo number 1', '(D) todo number 2']
+    """
+    rand = random.Random(seed)
+    lines: List[str] = []
+    for i in range(n):
+        parts = []
+        done = rand.random() < 0.1
+        if done:
+            parts.append("x")
+        if rand.random() < 0.5:
+            parts.append(rand.choice(["(A)", "(B)", "(C)", "(D)"]))
+        if done:
+            parts.append("2021-02-02")
+        if rand.random() < 0.5:
+            parts.append("2021-01-01")
+        parts.append(f"todo number {i}")
+        if rand.random() < 0.3:
+            parts.append(f"+project{i % 20}")
+        if rand.random() < 0.3:
+            parts.append(f"@context{i % 5}")
+        lines.append(" ".join(parts))
+    return lines
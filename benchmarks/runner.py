@@ -0,0 +1,183 @@
+"""
+Runs benchmark cases in temporary calcurse/calcurse_load directories,
+and saves/compares machine-readable results
+"""
+
+import os
+import json
+import time
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from calcurse_load.calcurse import Configuration
+from calcurse_load.ext.abstract import Extension
+
+Json = Dict[str, Any]
+
+RESULTS_VERSION = 1
+
+
+class Workspace(NamedTuple):
+    root: Path
+    config: Configuration
+    todo_file: Path
+
+
+class Case(NamedTuple):
+    # the code being timed
+    run: Callable[[], None]
+    # called before each repeat, not timed
+    reset: Callable[[], None] = lambda: None
+    # if this runs an extension, its timers/counters are included in the results
+    ext: Optional[Extension] = None
+
+
+class SkipCase(Exception):
+    """Raised while setting up a case which can't run here (e.g. a missing optional dependency)"""
+
+
+CaseSetup = Callable[[Workspace, int], Case]
+
+CASES: Dict[str, CaseSetup] = {}
+
+
+def case(name: str) -> Callable[[CaseSetup], CaseSetup]:
+    """Register a function which sets up a benchmark case at some scale"""
+
+    def _register(func: CaseSetup) -> CaseSetup:
+        CASES[name] = func
+        return func
+
+    return _register
+
+
+def make_workspace(root: Path) -> Workspace:
+    """
+    Create the calcurse/calcurse_load directories in root, and point
+    $TODOTXT_FILE (which the todotxt extension reads) at root/todo.txt
+    """
+    config = Configuration(
+        calcurse_dir=root / "calcurse",
+        calcurse_load_dir=root / "calcurse_load",
+        calcurse_hooks_dir=root / "hooks",
+    )
+    for d in config:
+        d.mkdir(parents=True)
+    todo_file = root / "todo.txt"
+    todo_file.touch()
+    os.environ["TODOTXT_FILE"] = str(todo_file)
+    return Workspace(root, config, todo_file)
+
+
+def _median(values: Sequence[float]) -> float:
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def run_case(name: str, scale: int, repeat: int) -> Optional[Json]:
+    """Run a case 'repeat' times, returns None if it was skipped"""
+    with tempfile.TemporaryDirectory(prefix="calcurse_load_bench.") as tmp:
+        ws = make_workspace(Path(tmp))
+        try:
+            bench = CASES[name](ws, scale)
+        except SkipCase as e:
+            print(f"skipping {name}: {e}")
+            return None
+        times: List[float] = []
+        for _ in range(repeat):
+            bench.reset()
+            if bench.ext is not None:
+                bench.ext.metrics.reset()
+            start = time.perf_counter()
+            bench.run()
+            times.append(time.perf_counter() - start)
+        result: Json = {
+            "name": name,
+            "scale": scale,
+            "times": [round(t, 6) for t in times],
+            "min": round(min(times), 6),
+            "median": round(_median(times), 6),
+        }
+        if bench.ext is not None:
+            # from the last repeat
+            result["steps"] = {
+                k: round(v, 6) for k, v in bench.ext.metrics.timers.items()
+            }
+            result["counters"] = dict(bench.ext.metrics.counters)
+        return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            capture_output=True,
+            universal_newlines=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names: Sequence[str], scales: Sequence[int], repeat: int) -> Json:
+    results: List[Json] = []
+    for name in names:
+        for scale in scales:
+            result = run_case(name, scale, repeat)
+            if result is None:
+                break
+            print(
+                f"{name:<32} {scale:>9}  min {result['min'] * 1000:>10.1f}ms  median {result['median'] * 1000:>10.1f}ms"
+            )
+            results.append(result)
+    return {
+        "version": RESULTS_VERSION,
+        "created": int(time.time()),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def load_results(path: str) -> Json:
+    with open(path) as f:
+        data: Json = json.load(f)
+    if data.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path} has unknown results version {data.get('version')}")
+    return data
+
+
+def compare(base: Json, new: Json, threshold: float) -> List[str]:
+    """
+    Print the ratio of the median times for each case in both results,
+    returns the cases which are slower than base by more than threshold
+
+    >>> base = {"results": [{"name": "a", "scale": 10, "median": 1.0}, {"name": "b", "scale": 10, "median": 1.0}]}
+    >>> new = {"results": [{"name": "a", "scale": 10, "median": 1.5}, {"name": "b", "scale": 10, "median": 0.5}]}
+    >>> compare(base, new, threshold=0.1)
+    a                                       10      1000.0ms ->     1500.0ms  1.50x
+    b                                       10      1000.0ms ->      500.0ms  0.50x
+    ['a@10']
+    """
+    baseline = {(r["name"], r["scale"]): r for r in base["results"]}
+    regressions: List[str] = []
+    for r in new["results"]:
+        b = baseline.get((r["name"], r["scale"]))
+        if b is None:
+            continue
+        ratio = r["median"] / b["median"] if b["median"] else float("inf")
+        print(
+            f"{r['name']:<32} {r['scale']:>9}  {b['median'] * 1000:>10.1f}ms -> {r['median'] * 1000:>10.1f}ms  {ratio:.2f}x"
+        )
+        if ratio > 1 + threshold:
+            regressions.append(f"{r['name']}@{r['scale']}")
+    return regressions
@@ -1,35 +1,16 @@
-from typing import Sequence
-from functools import lru_cache
+from typing import Optional, Sequence
 
 import click
 
-from .ext.all import EXTENSION_NAMES, get_extension
+from .ext.all import EXTENSION_NAMES, load_extension
 from .ext.abstract import Extension
-from .calcurse import get_configuration
-
 
 CHOICES = list(EXTENSION_NAMES)
 CHOICES.append("custom.module.name.Extension")
 
-config = get_configuration()
-
-
-@lru_cache(maxsize=None)
-def _load_extension(name: str) -> Extension:
-    if name in CHOICES:
-        return get_extension(name)(config=config)
-    else:
-        import importlib
-
-        module_name, class_name = name.rsplit(".", 1)
-        module = importlib.import_module(module_name)
-        extclass = getattr(module, class_name)
-        assert issubclass(
-            extclass, Extension
-        ), f"{extclass} is not a subclass of Extension"
-        ext = extclass(config=config)
-        assert isinstance(ext, Extension), f"{ext} is not an instance of Extension"
-        return ext
+# kept for backwards compatibility, loading is deferred
+# until an extension is requested
+_load_extension = load_extension
 
 
 @click.command()
@@ -49,21 +30,95 @@ def _load_extension(name: str) -> Extension:
     type=click.UNPROCESSED,
     callback=lambda ctx, param, value: [_load_extension(v) for v in value],
 )
+@click.option(
+    "--all-enabled",
+    help="Execute the preload/postsave action for each enabled extension (the *.enabled hooks, or the names in $CALCURSE_LOAD_DIR/extensions), concurrently if they don't modify the same files",
+    type=click.Choice(["pre-load", "post-save"]),
+    default=None,
+)
+@click.option(
+    "--stats",
+    help="Print a summary of the timers/counters recorded for previous runs (with $CALCURSE_LOAD_METRICS set)",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--restore-gcal-archive",
+    help="Copy the gcal events archived for being outside the retention window back into the appointments file",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--serve",
+    help="Run a daemon which runs extensions for the hooks (see calcurse_load.client)",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--watch",
+    help="Rebuild the pre-load output of the --pre-load extensions (or the enabled extensions) in the background whenever their inputs change, so the pre-load hook only has to swap the files in",
+    is_flag=True,
+    default=False,
+)
 def cli(
     pre_load: Sequence[Extension],
     post_save: Sequence[Extension],
+    all_enabled: Optional[str],
+    stats: bool,
+    restore_gcal_archive: bool,
+    serve: bool,
+    watch: bool,
 ) -> None:
     """
     A CLI for loading data for calcurse
     """
+    if stats:
+        from .calcurse import get_configuration
+        from .metrics import METRICS_FILE, read_records, summarize
+
+        path = get_configuration().calcurse_load_dir / METRICS_FILE
+        click.echo(summarize(read_records(path)))
+        return
+    if restore_gcal_archive:
+        from .calcurse import get_configuration
+        from .ext.gcal import gcal_ext
+
+        restored = gcal_ext(config=get_configuration()).restore_archive()
+        click.echo(f"Restored {restored} archived gcal events")
+        return
+    if serve:
+        from .server import serve as run_server
+
+        run_server(load_extension=_load_extension)
+        return
+    if watch:
+        from .calcurse import get_configuration
+        from .ext.all import enabled_extension_names
+        from .staging import watch as watch_inputs, watch_interval
+
+        extensions = list(pre_load) or [
+            _load_extension(name)
+            for name in enabled_extension_names(get_configuration())
+        ]
+        if not extensions:
+            click.echo("No extensions to watch", err=True)
+            exit(1)
+        watch_inputs(extensions, watch_interval())
+        return
+    if all_enabled is not None:
+        from .calcurse import get_configuration
+        from .runner import run_enabled
+
+        run_enabled(get_configuration(), _load_extension, all_enabled)
+        return
     if not pre_load and not post_save:
         click.echo("No extensions specified", err=True)
         click.echo(click.get_current_context().get_help())
         exit(1)
     for ext in pre_load:
-        ext.pre_load()
+        ext.run("pre-load")
     for ext in post_save:
-        ext.post_save()
+        ext.run("post-save")
 
 
 if __name__ == "__main__":
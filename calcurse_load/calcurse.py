@@ -8,6 +8,7 @@ from functools import lru_cache
 class Configuration(NamedTuple):
     calcurse_dir: Path
     calcurse_load_dir: Path
+    calcurse_hooks_dir: Path
 
 
 @lru_cache(1)
@@ -23,6 +24,17 @@ def get_configuration() -> Configuration:
     calcurse_load_dir: Path = xdg_data / "calcurse_load"
     if "CALCURSE_LOAD_DIR" in os.environ:
         calcurse_load_dir = Path(os.environ["CALCURSE_LOAD_DIR"])
+    calcurse_hooks_dir: Path = (
+        Path(
+            os.environ.get(
+                "XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"), ".config")
+            )
+        )
+        / "calcurse"
+        / "hooks"
+    )
+    if "CALCURSE_HOOKS_DIR" in os.environ:
+        calcurse_hooks_dir = Path(os.environ["CALCURSE_HOOKS_DIR"])
     if not calcurse_dir.exists():
         warnings.warn(
             "Calcurse data directory at {} doesn't exist.".format(str(calcurse_dir))
@@ -32,4 +44,5 @@ def get_configuration() -> Configuration:
     return Configuration(
         calcurse_dir=calcurse_dir,
         calcurse_load_dir=calcurse_load_dir,
+        calcurse_hooks_dir=calcurse_hooks_dir,
     )
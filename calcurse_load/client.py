@@ -0,0 +1,187 @@
+"""
+A minimal client for the 'calcurse_load --serve' daemon, for the hooks to call
+
+This only imports from the standard library, so it starts quickly. If the
+daemon isn't running, it falls back to running the extensions in this
+process, which still avoids importing click and the other extensions
+
+Calcurse waits for the hooks, so check '--pre-load todotxt' (without a
+daemon) doesn't import click or the gcal extension. How long the imports
+take is checked by benchmarks/bench_startup.py
+
+>>> import tempfile
+>>> with tempfile.TemporaryDirectory() as tmp:
+...     _, modules = _import_profile(["--pre-load", "todotxt"], tmp)
+>>> "click" in modules, "calcurse_load.ext.gcal" in modules
+(False, False)
+"""
+
+import os
+import sys
+import json
+import socket
+from tempfile import gettempdir
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+Json = Dict[str, Any]
+
+# the environment the extensions read their configuration from, sent
+# with each request so the daemon runs it like the client would
+REQUEST_ENV_PREFIXES = ("CALCURSE_", "XDG_")
+REQUEST_ENV = ("HOME", "TZ", "TODOTXT_FILE", "TODO_DIR")
+
+# seconds to wait for the daemon to accept the connection, and to run the request
+CONNECT_TIMEOUT = 1.0
+DEFAULT_TIMEOUT = 60.0
+
+
+def socket_path() -> str:
+    """
+    $CALCURSE_LOAD_SOCKET, else calcurse_load-<uid>.sock in $XDG_RUNTIME_DIR or the temp dir
+    """
+    if "CALCURSE_LOAD_SOCKET" in os.environ:
+        return os.environ["CALCURSE_LOAD_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or gettempdir()
+    return os.path.join(runtime_dir, f"calcurse_load-{os.getuid()}.sock")
+
+
+def parse_args(argv: List[str]) -> Optional[Json]:
+    """
+    Parse the --pre-load/--post-save/--all-enabled options, same as
+    the calcurse_load CLI, into a request for the daemon
+
+    >>> parse_args(["--pre-load", "gcal", "--pre-load=todotxt", "--post-save", "todotxt"])
+    {'pre_load': ['gcal', 'todotxt'], 'post_save': ['todotxt'], 'all_enabled': None}
+    >>> parse_args(["--all-enabled", "pre-load"])["all_enabled"]
+    'pre-load'
+    >>> parse_args(["--something-else"]) is None
+    True
+    """
+    request: Json = {"pre_load": [], "post_save": [], "all_enabled": None}
+    args = iter(argv)
+    for arg in args:
+        opt, eq, value = arg.partition("=")
+        if not eq:
+            value = next(args, "")
+        if not value:
+            return None
+        if opt == "--pre-load":
+            request["pre_load"].append(value)
+        elif opt == "--post-save":
+            request["post_save"].append(value)
+        elif opt == "--all-enabled" and value in ("pre-load", "post-save"):
+            request["all_enabled"] = value
+        else:
+            return None
+    return request
+
+
+def request_env(environ: Mapping[str, str]) -> Dict[str, str]:
+    """
+    The variables in environ which are sent with a request
+
+    >>> request_env({"CALCURSE_DIR": "/cal", "XDG_DATA_HOME": "/data", "PATH": "/bin", "TODO_DIR": "/todo"})
+    {'CALCURSE_DIR': '/cal', 'XDG_DATA_HOME': '/data', 'TODO_DIR': '/todo'}
+    """
+    return {
+        k: v
+        for k, v in environ.items()
+        if k.startswith(REQUEST_ENV_PREFIXES) or k in REQUEST_ENV
+    }
+
+
+def request_timeout() -> float:
+    """
+    $CALCURSE_LOAD_TIMEOUT, how many seconds to wait for the daemon to run a request
+    """
+    return float(os.environ.get("CALCURSE_LOAD_TIMEOUT") or DEFAULT_TIMEOUT)
+
+
+def send_request(request: Json, path: Optional[str] = None) -> Json:
+    """
+    Send a request to the daemon, raises OSError if it isn't running,
+    or socket.timeout if it doesn't respond in time
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path or socket_path())
+        sock.settimeout(request_timeout())
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as resp:
+            line = resp.readline()
+    if not line:
+        raise ConnectionError("calcurse_load daemon closed the connection")
+    response: Json = json.loads(line)
+    return response
+
+
+def main(argv: List[str]) -> int:
+    request = parse_args(argv)
+    if request is not None:
+        request["cwd"] = os.getcwd()
+        request["env"] = request_env(os.environ)
+        try:
+            response = send_request(request)
+        except OSError:
+            # daemon isn't running (or timed out, socket.timeout is
+            # an OSError), run the request in this process
+            from .ext.all import load_extension
+            from .runner import run_request
+
+            response = run_request(request, load_extension)
+        if not response["ok"]:
+            print(f"calcurse_load: {response['error']}", file=sys.stderr)
+            return 1
+        return 0
+
+    # not options the client handles (e.g. --help), run the CLI
+    from .__main__ import cli
+
+    # exits with the CLI's exit code
+    cli.main(args=argv, prog_name="calcurse_load")
+
+
+def _import_profile(argv: List[str], tmp_dir: str) -> Tuple[int, Set[str]]:
+    """
+    Run the client in a new interpreter with 'python -X importtime', with the
+    calcurse directories in tmp_dir. Returns the total time spent importing
+    modules (after interpreter startup), and the names of the imported modules
+    """
+    import subprocess
+
+    env = dict(os.environ)
+    todo_file = os.path.join(tmp_dir, "todo.txt")
+    with open(todo_file, "w") as f:
+        f.write("(A) something\n")
+    env.update(
+        CALCURSE_DIR=tmp_dir,
+        CALCURSE_LOAD_DIR=os.path.join(tmp_dir, "calcurse_load"),
+        CALCURSE_LOAD_SOCKET=os.path.join(tmp_dir, "no_daemon.sock"),
+        TODOTXT_FILE=todo_file,
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "calcurse_load.client", *argv],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    total, modules, after_site = 0, set(), False
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip())
+        # only count top-level imports after the interpreter has started
+        top_level = not name[1:].startswith(" ")
+        if top_level and after_site:
+            total += int(cumulative)
+        if top_level and name.strip() == "site":
+            after_site = True
+    return total, modules
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,21 +1,77 @@
 import typing
+from pathlib import Path
+from typing import Any, ClassVar, Dict, FrozenSet, Optional
 from abc import ABC, abstractmethod
-from ..log import logger
+from .manifest import stat_key
+from ..log import get_logger
+from ..metrics import Metrics
 
 if typing.TYPE_CHECKING:
     from ..calcurse import Configuration
 
 
 class Extension(ABC):
+    # the files in the calcurse directory this extension modifies, used to decide
+    # which extensions can run concurrently. None means it could modify anything
+    files: ClassVar[Optional[FrozenSet[str]]] = None
+    # files in state_dir which describe what pre-load last wrote (e.g. the snapshot
+    # post-save diffs against), swapped in with a staged build (see calcurse_load.staging)
+    state_files: ClassVar[FrozenSet[str]] = frozenset()
+
     def __init__(self, config: "Configuration") -> None:  # type: ignore[no-untyped-def]
         self.config: Configuration = config
-        self.logger = logger
+        # set while staging (see calcurse_load.staging): where the state files are
+        # written instead, and the calcurse directory calcurse is reading
+        self.staged_state_dir: Optional[Path] = None
+        self.live_calcurse_dir: Optional[Path] = None
+        self.logger = get_logger()
+        # timers/counters for the current run, see run()
+        self.metrics = Metrics()
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self.config})"
 
     __str__ = __repr__
 
+    @property
+    def state_dir(self) -> Path:
+        if self.staged_state_dir is not None:
+            return self.staged_state_dir
+        return self.config.calcurse_load_dir
+
+    def run(self, phase: str) -> None:
+        """
+        Run the pre-load/post-save action, recording how long it took
+        and anything in self.metrics in the metrics history
+        """
+        from ..metrics import run_phase
+
+        run_phase(self, phase)
+
+    def input_keys(self) -> Dict[str, Any]:
+        """
+        Fingerprints of everything the output of pre-load depends on, 'calcurse_load --watch'
+        stages a new build when these change. The stat() of the calcurse files by default
+        """
+        return {
+            name: stat_key(self.config.calcurse_dir / name)
+            for name in sorted(self.files or ())
+            if name != "notes"
+        }
+
+    def pre_load_or_swap(self) -> None:
+        """
+        Swap in the output staged by 'calcurse_load --watch' if it
+        was built from the current inputs, else run pre_load
+        """
+        from ..staging import swap_staged
+
+        if swap_staged(self):
+            self.logger.info(f"{type(self).__name__}: swapped in staged pre-load")
+            self.metrics.count("swapped")
+        else:
+            self.pre_load()
+
     @abstractmethod
     def pre_load(self) -> None:
         raise NotImplementedError
@@ -1,6 +1,10 @@
-from typing import Type
+from functools import lru_cache
+from typing import List, Type, TYPE_CHECKING
 from .abstract import Extension
 
+if TYPE_CHECKING:
+    from ..calcurse import Configuration
+
 EXTENSION_NAMES = {"gcal", "todotxt"}
 
 
@@ -15,3 +19,68 @@ def get_extension(name: str) -> Type[Extension]:
         return todotxt_ext
     else:
         raise ValueError(f"Unknown extension: {name}")
+
+
+@lru_cache(maxsize=None)
+def load_extension(name: str) -> Extension:
+    """
+    Load and instantiate an extension, either one of EXTENSION_NAMES or
+    the fully qualified path to an Extension subclass (module name + class name)
+
+    >>> load_extension("gcla")
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown extension 'gcla', expected one of gcal, todotxt or a module.ClassName path
+    """
+    from ..calcurse import get_configuration
+
+    if name not in EXTENSION_NAMES and "." not in name:
+        raise ValueError(
+            f"Unknown extension '{name}', expected one of {', '.join(sorted(EXTENSION_NAMES))} or a module.ClassName path"
+        )
+    config = get_configuration()
+    if name in EXTENSION_NAMES:
+        return get_extension(name)(config=config)
+    else:
+        import importlib
+
+        module_name, class_name = name.rsplit(".", 1)
+        module = importlib.import_module(module_name)
+        extclass = getattr(module, class_name)
+        assert issubclass(
+            extclass, Extension
+        ), f"{extclass} is not a subclass of Extension"
+        ext = extclass(config=config)
+        assert isinstance(ext, Extension), f"{ext} is not an instance of Extension"
+        return ext
+
+
+def forget_loaded() -> None:
+    """
+    Forget the loaded extensions and the configuration, so the next
+    load_extension resolves them again. The daemon (see calcurse_load.server)
+    calls this for each request, so it doesn't keep using stale paths
+    """
+    from ..calcurse import get_configuration
+
+    get_configuration.cache_clear()
+    load_extension.cache_clear()
+
+
+def enabled_extension_names(config: "Configuration") -> List[str]:
+    """
+    If $CALCURSE_LOAD_DIR/extensions exists, the extension names listed in
+    that file (one per line), else the names of the '*.enabled' files in
+    the calcurse hooks directory (e.g. gcal.enabled -> gcal)
+    """
+    extensions_file = config.calcurse_load_dir / "extensions"
+    if extensions_file.exists():
+        names = [
+            line.strip()
+            for line in extensions_file.read_text().splitlines()
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+        return names
+    if not config.calcurse_hooks_dir.is_dir():
+        return []
+    return sorted(p.stem for p in config.calcurse_hooks_dir.glob("*.enabled"))
@@ -0,0 +1,81 @@
+"""
+Parsing/sorting for lines in the calcurse appointments file
+
+Appointments look like:
+    MM/DD/YYYY @ HH:MM -> MM/DD/YYYY @ HH:MM>notehash |description
+and events (all day) look like:
+    MM/DD/YYYY [1] |description
+"""
+
+import heapq
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# (year, month, day, minute of the day), all-day events use -1
+# as the minute, so they sort before any appointments that day
+SortKey = Tuple[int, int, int, int]
+
+# lines that can't be parsed are placed at the end of the file
+UNPARSEABLE: SortKey = (10000, 0, 0, 0)
+
+
+def sort_key(line: str) -> SortKey:
+    """
+    Create a sort key from an appointment/event line, by slicing the
+    fixed-width date/time fields instead of parsing with strptime
+
+    >>> sort_key("01/02/2021 @ 10:30 -> 01/02/2021 @ 11:00 |something")
+    (2021, 1, 2, 630)
+    >>> sort_key("03/04/2020 [1] |all day event")
+    (2020, 3, 4, -1)
+    >>> sort_key("03/04/2020 {1W} [1] |recurring event")
+    (2020, 3, 4, -1)
+    >>> sort_key("not an appointment")
+    (10000, 0, 0, 0)
+    """
+    if len(line) < 10 or line[2] != "/" or line[5] != "/":
+        return UNPARSEABLE
+    try:
+        month, day, year = int(line[0:2]), int(line[3:5]), int(line[6:10])
+        if line[10:13] == " @ ":
+            return year, month, day, int(line[13:15]) * 60 + int(line[16:18])
+    except ValueError:
+        return UNPARSEABLE
+    return year, month, day, -1
+
+
+def is_sorted(keys: Iterable[SortKey]) -> bool:
+    """
+    >>> is_sorted([(2020, 1, 1, -1), (2020, 1, 1, 5), (2021, 1, 1, 0)])
+    True
+    >>> is_sorted([(2021, 1, 1, 0), (2020, 1, 1, 5)])
+    False
+    """
+    prev: Optional[SortKey] = None
+    for key in keys:
+        if prev is not None and key < prev:
+            return False
+        prev = key
+    return True
+
+
+def sort_lines(lines: List[str]) -> List[str]:
+    """
+    Sort lines by date/time; if they're already sorted (the common
+    case for the appointments file calcurse writes), returns them as is
+    """
+    keyed = [(sort_key(line), line) for line in lines]
+    if is_sorted(k for k, _ in keyed):
+        return lines
+    keyed.sort(key=lambda kl: kl[0])
+    return [line for _, line in keyed]
+
+
+def merge_sorted(*sorted_lines: Iterable[str]) -> Iterator[str]:
+    """
+    k-way merge of already sorted runs of appointment lines. For lines
+    with the same date/time, lines from earlier iterables come first
+
+    >>> list(merge_sorted(["01/01/2020 [1] |a", "03/01/2020 [1] |c"], ["02/01/2020 [1] |b"]))
+    ['01/01/2020 [1] |a', '02/01/2020 [1] |b', '03/01/2020 [1] |c']
+    """
+    return heapq.merge(*sorted_lines, key=sort_key)
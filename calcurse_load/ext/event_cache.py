@@ -0,0 +1,191 @@
+"""
+A cache of the calcurse lines created from gcal events, kept between runs
+
+The line created for an event only changes if the event or the local timezone
+changes, so for each JSON file this maps a fingerprint of the JSON text of each
+event to the line (which includes the note hash) and the event key (see
+gcal.event_key). When a JSON file changes, events which were already in it
+don't have to be converted again, and lines in newline-delimited JSON files
+don't even have to be decoded
+
+It also keeps the lines derived from the whole file (with the hash of the
+file they were derived from), so a JSON file that hasn't changed isn't read at
+all. Those are the cached lines in the common case, so they're only stored
+separately if some events aren't cached (e.g. expanded recurring events)
+
+Each JSON file has its own cache file, which is replaced each time that JSON
+file is re-derived, so events which are no longer in the latest export are
+evicted. Cache files are stored with marshal, as packed arrays which are fast
+to load, and are ignored if written in a different timezone or by a different version
+"""
+
+import os
+import marshal
+import hashlib
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, cast
+
+from .manifest import timezone_key
+
+# bumped whenever the lines created from events change, see MANIFEST_VERSION
+CACHE_VERSION = 3
+
+# (calcurse line, event key)
+CachedEvent = Tuple[str, int]
+# the lines derived from a JSON file, and their event keys
+DerivedLines = Tuple[List[str], Sequence[int]]
+
+
+def fingerprint(text: str) -> int:
+    """
+    >>> fingerprint('{"a": 1}') == fingerprint('{"a": 1}')
+    True
+    >>> fingerprint('{"a": 1}') == fingerprint('{"a": 2}')
+    False
+    """
+    # sha1 is the fastest of the hashlib hashes for short inputs
+    return int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], "big")
+
+
+class CachedEvents(NamedTuple):
+    # fingerprint -> index in lines/keys. This doesn't create an object per
+    # event, which would make each garbage collection slower
+    positions: Dict[int, int]
+    lines: List[str]
+    keys: Sequence[int]
+
+    def get(self, fp: int) -> Optional[CachedEvent]:
+        i = self.positions.get(fp)
+        if i is None:
+            return None
+        return self.lines[i], self.keys[i]
+
+
+class EventCache:
+    """
+    >>> import tempfile
+    >>> cache = EventCache(Path(tempfile.mkdtemp()) / "gcal_cache")
+    >>> cache.save("a.json", "sha", [fingerprint("{}")], ["line"], [2**64 - 1])
+    >>> cache.load("a.json").get(fingerprint("{}"))
+    ('line', 18446744073709551615)
+    >>> lines, keys = cache.load_derived("a.json", "sha")
+    >>> lines, list(keys)
+    (['line'], [18446744073709551615])
+    >>> cache.load_derived("a.json", "modified") is None
+    True
+    >>> cache.forget_missing(["b.json"])
+    1
+    >>> cache.load("a.json").get(fingerprint("{}")) is None
+    True
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self.tz = timezone_key()
+
+    def cache_file(self, json_path: str) -> Path:
+        name = hashlib.sha1(json_path.encode()).hexdigest()[:16]
+        return self.cache_dir / f"{name}.cache"
+
+    def _read(self, json_path: str) -> Optional[Tuple[Any, ...]]:
+        """
+        The contents of the cache file for a JSON file, None if it doesn't exist, is
+        corrupt, or was written by a different version or in a different timezone
+        """
+        try:
+            with self.cache_file(json_path).open("rb") as f:
+                data = marshal.load(f)
+            version, tz, path = data[:3]
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if (
+            version != (CACHE_VERSION, marshal.version)
+            or tz != self.tz
+            or path != json_path
+        ):
+            return None
+        return cast(Tuple[Any, ...], data)
+
+    def load(self, json_path: str) -> CachedEvents:
+        """Load the cached events for a JSON file, empty if there aren't any"""
+        data = self._read(json_path)
+        if data is None:
+            return CachedEvents({}, [], [])
+        _, _, _, _, fingerprints, lines, keys, _ = data
+        index = {fp: i for i, fp in enumerate(array("Q", fingerprints))}
+        return CachedEvents(index, lines, array("Q", keys))
+
+    def load_derived(self, json_path: str, sha1: str) -> Optional[DerivedLines]:
+        """
+        The lines (and event keys) derived from the JSON file, if it was
+        derived from a file with this hash
+        """
+        data = self._read(json_path)
+        if data is None:
+            return None
+        _, _, _, source, _, lines, keys, derived = data
+        if source != sha1:
+            return None
+        if derived is not None:
+            lines, keys = derived
+        return lines, array("Q", keys)
+
+    def save(
+        self,
+        json_path: str,
+        sha1: str,
+        fingerprints: Sequence[int],
+        lines: List[str],
+        keys: Sequence[int],
+        derived: Optional[DerivedLines] = None,
+    ) -> None:
+        """
+        Replace the cached events for a JSON file (with hash sha1). derived is
+        the lines derived from the file, if they're not the same as the cached lines
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_file(json_path)
+        # a unique name, so concurrent runs (e.g. staging) don't write the same file
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                marshal.dump(
+                    (
+                        (CACHE_VERSION, marshal.version),
+                        self.tz,
+                        json_path,
+                        sha1,
+                        array("Q", fingerprints).tobytes(),
+                        lines,
+                        array("Q", keys).tobytes(),
+                        (
+                            None
+                            if derived is None
+                            else (derived[0], array("Q", derived[1]).tobytes())
+                        ),
+                    ),
+                    f,
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def forget_missing(self, json_files: List[str]) -> int:
+        """
+        Remove the cache files for any JSON files which no longer exist,
+        returns the number removed
+        """
+        keep = {self.cache_file(p).name for p in json_files}
+        removed = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            if name.endswith(".cache") and name not in keep:
+                os.unlink(self.cache_dir / name)
+                removed += 1
+        return removed
@@ -1,16 +1,56 @@
 from __future__ import annotations
-import json
+import os
 import glob
+import json
+import time
 import hashlib
 import logging
-import io
-from functools import partial
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextlib import ExitStack
+from itertools import chain
 from pathlib import Path
-from datetime import datetime
-from typing import List, Iterator, Optional, TYPE_CHECKING
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+    Union,
+)
 
 from .abstract import Extension
-from .utils import yield_lines
+from .utils import (
+    chunked,
+    yield_lines,
+    yield_json_raw,
+    write_if_changed,
+    read_lines_without_suffix,
+)
+from .apts import merge_sorted, sort_lines
+from .timestamps import LocalTimestampFormatter, get_formatter
+from .manifest import (
+    NOTES_FILE,
+    GcalManifest,
+    sha1_file,
+    sha1_lines,
+    stat_key,
+    timezone_key,
+)
+from .notes import NoteStore, note_hash, referenced_notes, referenced_notes_in_file
+from .event_cache import CachedEvent, DerivedLines, EventCache, fingerprint
+from .recurrence import add_exceptions, calcurse_recurrence, expand_recurrence
+from .retention import GcalArchive, Window
+from ..log import get_logger
+from gcal_index.binary import BINARY_FORMAT, BinaryExport
 
 if TYPE_CHECKING:
     from gcal_index.__main__ import GcalAppointmentData
@@ -21,25 +61,9 @@ if TYPE_CHECKING:
 CalcurseLine = str
 
 
-def pad(i: int) -> str:
-    return str(i).zfill(2)
-
-
-def create_calcurse_timestamp(epochtime: Optional[int]) -> str:
-    """
-    Create a string that represents the time in Calcurses timestamp format
-    """
-    if epochtime is None:
-        return ""
-    dt = datetime.fromtimestamp(epochtime)
-    # localize to the current timezone
-    dt = dt.astimezone()
-    return f"{pad(dt.month)}/{pad(dt.day)}/{dt.year} @ {pad(dt.hour)}:{pad(dt.minute)}"
-
-
-def create_calcurse_note(event_data: GcalAppointmentData, notes_dir: Path) -> str:
+def create_calcurse_note(event_data: GcalAppointmentData, notes: NoteStore) -> str:
     """
-    Creates the notes file if it doesn't already exist.
+    Queues the notes file to be written if it doesn't already exist.
 
     Notes file contains the Google Calendar description, a link
     to the event, and any other metadata.
@@ -53,92 +77,792 @@ def create_calcurse_note(event_data: GcalAppointmentData, notes_dir: Path) -> st
         note_info.append(event_data["description"]["text"])
     if len(event_data["description"]["links"]) > 0:
         note_info.append("\n".join([a["email"] for a in event_data["attendees"]]))
-    note = "\n".join(note_info)
-    sha = hashlib.sha1(note.encode()).hexdigest()
-    with (notes_dir / sha).open("w") as nf:
-        nf.write(note)
-    return sha
+    return notes.add("\n".join(note_info))
 
 
 def create_calcurse_event(
-    event_data: GcalAppointmentData, notes_dir: Path, logger: logging.Logger
+    event_data: GcalAppointmentData,
+    notes: NoteStore,
+    logger: logging.Logger,
+    formatter: Optional[LocalTimestampFormatter] = None,
+    recurrence: Optional[str] = None,
 ) -> Optional[CalcurseLine]:
     """
     Takes the exported Google Calendar info, and creates
     a corresponding Calcurse 'apts' line, and note
+
+    'recurrence' is a calcurse recurrence (see recurrence.calcurse_recurrence)
     """
     if event_data["start"] is None:
         logger.warning(f"Event {event_data} has no start time")
         return None
-    note_hash: str = create_calcurse_note(event_data, notes_dir)
-    start_str = create_calcurse_timestamp(event_data["start"])
-    end_str = create_calcurse_timestamp(event_data["end"])
+    note_sha: str = create_calcurse_note(event_data, notes)
+    if formatter is None:
+        formatter = get_formatter()
+    start_str = formatter.format(event_data["start"])
+    end_str = "" if event_data["end"] is None else formatter.format(event_data["end"])
     if end_str == "":
-        return f"{start_str} -> {start_str}>{note_hash} |{event_data['summary']} [gcal]"
-    else:
-        return f"{start_str} -> {end_str}>{note_hash} |{event_data['summary']} [gcal]"
+        end_str = start_str
+    if recurrence is not None:
+        # the same spacing calcurse writes recurring appointments with
+        return f"{start_str} -> {end_str} {recurrence} >{note_sha} |{event_data['summary']} [gcal]"
+    return f"{start_str} -> {end_str}>{note_sha} |{event_data['summary']} [gcal]"
+
+
+GCAL_SUFFIX = b"[gcal]"
+
+
+# number of processes to convert events with, conversion is done
+# in this process if this isn't set (or is 1)
+WORKERS_ENV = "CALCURSE_LOAD_GCAL_WORKERS"
+# events sent to a worker process at a time
+CHUNK_SIZE = 2000
+# recurring events which calcurse can't represent are expanded
+# into their occurrences up to this many days from now
+EXPAND_DAYS = 365
+
+
+def event_key(event_data: GcalAppointmentData) -> int:
+    """
+    A 64-bit key which identifies an event across exports; a hash of its
+    event_id, or if it doesn't have one, of its start/end/summary
+
+    >>> ev = {"event_id": "abc", "start": 0, "end": 60, "summary": "Meeting"}
+    >>> event_key(ev) == event_key({**ev, "summary": "Renamed"})
+    True
+    >>> event_key({**ev, "event_id": None}) == event_key({**ev, "event_id": None, "summary": "Renamed"})
+    False
+    """
+    event_id = event_data.get("event_id")
+    if event_id:
+        return _key(f"id:{event_id}")
+    return _key(f"{event_data['start']}|{event_data['end']}|{event_data['summary']}")
+
+
+def occurrence_key(recurring_event_id: str, start: int) -> int:
+    """
+    The key of the line for one occurrence of an expanded recurring event
+
+    >>> occurrence_key("abc", 0) == occurrence_key("abc", 0)
+    True
+    >>> occurrence_key("abc", 0) == event_key({"event_id": "abc"})
+    False
+    """
+    return _key(f"occurrence:{recurring_event_id}:{start}")
+
+
+def _key(ident: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(ident.encode(), digest_size=8).digest(), "big"
+    )
+
+
+class InstanceException(NamedTuple):
+    """A moved or cancelled occurrence of a recurring event"""
+
+    # event_key of the recurring event
+    recurring: int
+    # occurrence_key of the occurrence, if the recurring event was expanded
+    occurrence: int
+    # the calcurse date the occurrence was originally on
+    date: str
+
+
+class ConvertedEvent(NamedTuple):
+    # the lines created for an event, and their keys (see event_key); none
+    # if the event has no start time, or one per occurrence if its recurrence
+    # was expanded
+    lines: List[Tuple[CalcurseLine, int]]
+    exception: Optional[InstanceException] = None
+    # expanded occurrences depend on the current time, and exceptions on the
+    # recurring event, so only the other events are cached
+    cacheable: bool = True
 
 
-def is_google_event(appointment_line: CalcurseLine) -> bool:
-    return appointment_line.endswith("[gcal]")
+def convert_event(
+    event_data: GcalAppointmentData,
+    notes: NoteStore,
+    logger: logging.Logger,
+    formatter: LocalTimestampFormatter,
+    horizon: int,
+) -> ConvertedEvent:
+    """
+    Create the calcurse lines for an event. A recurring event is one recurring
+    line if calcurse can represent its recurrence, else a line for each
+    occurrence up to 'horizon'. A moved or cancelled occurrence of a recurring
+    event is also returned as an exception to its recurring event
+
+    >>> from datetime import datetime
+    >>> start = int(datetime(2021, 1, 4, 10).timestamp())
+    >>> ev = {"summary": "ev", "start": start, "end": start + 3600, "event_id": "1",
+    ...     "description": {"text": None, "links": []}, "location": None, "recurrence": ["RRULE:FREQ=WEEKLY"],
+    ...     "attendees": [], "event_link": None}
+    >>> notes = NoteStore(Path(os.devnull), index=set())
+    >>> convert_event(ev, notes, get_logger(), get_formatter(), start).lines[0][0]
+    '01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 {1W} >828e64e13e3fc71511c7785f33117be2da9e4fb7 |ev [gcal]'
+    >>> ev["recurrence"] = ["RRULE:FREQ=WEEKLY;BYDAY=MO,TU"]
+    >>> [line for line, _ in convert_event(ev, notes, get_logger(), get_formatter(), start + 86400).lines]
+    ['01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00>828e64e13e3fc71511c7785f33117be2da9e4fb7 |ev [gcal]', '01/05/2021 @ 10:00 -> 01/05/2021 @ 11:00>828e64e13e3fc71511c7785f33117be2da9e4fb7 |ev [gcal]']
+    >>> [line for line, _ in convert_event(ev, notes, get_logger(), get_formatter(), start - 86400).lines]
+    ['01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00>828e64e13e3fc71511c7785f33117be2da9e4fb7 |ev [gcal]']
+    >>> cancelled = {**ev, "start": None, "end": None, "event_id": "1_x", "recurring_event_id": "1", "original_start": start}
+    >>> convert_event(cancelled, notes, get_logger(), get_formatter(), start).exception.date
+    '01/04/2021'
+    """
+    exception: Optional[InstanceException] = None
+    recurring_event_id = event_data.get("recurring_event_id")
+    original_start = event_data.get("original_start")
+    if recurring_event_id and original_start is not None:
+        exception = InstanceException(
+            _key(f"id:{recurring_event_id}"),
+            occurrence_key(recurring_event_id, original_start),
+            formatter.format(original_start)[:10],
+        )
+        if event_data["start"] is None:
+            # a cancelled occurrence
+            return ConvertedEvent([], exception, cacheable=False)
+    start = event_data["start"]
+    recurrence = event_data.get("recurrence")
+    if recurrence and start is not None:
+        tzid = event_data.get("timezone")
+        rec = calcurse_recurrence(recurrence, start, tzid)
+        if rec is not None:
+            line = create_calcurse_event(event_data, notes, logger, formatter, rec)
+            assert line is not None
+            return ConvertedEvent(
+                [(line, event_key(event_data))], exception, exception is None
+            )
+        occurrences = expand_recurrence(recurrence, start, horizon, tzid)
+        if occurrences == []:
+            # nothing before the horizon (e.g. the event starts after it), so add
+            # its first occurrence, it's expanded once a later run gets closer
+            line = create_calcurse_event(event_data, notes, logger, formatter)
+            assert line is not None
+            return ConvertedEvent(
+                [(line, occurrence_key(event_data["event_id"], start))],
+                exception,
+                cacheable=False,
+            )
+        if occurrences is not None:
+            lines: List[Tuple[CalcurseLine, int]] = []
+            end = event_data["end"]
+            for occurrence_start in occurrences:
+                occurrence = event_data.copy()
+                occurrence["start"] = occurrence_start
+                if end is not None:
+                    occurrence["end"] = end - start + occurrence_start
+                line = create_calcurse_event(occurrence, notes, logger, formatter)
+                assert line is not None
+                lines.append(
+                    (line, occurrence_key(event_data["event_id"], occurrence_start))
+                )
+            return ConvertedEvent(lines, exception, cacheable=False)
+        logger.warning(
+            f"Could not convert the recurrence {recurrence} of {event_data['summary']}, only adding its first occurrence"
+        )
+    line = create_calcurse_event(event_data, notes, logger, formatter)
+    return ConvertedEvent(
+        [] if line is None else [(line, event_key(event_data))],
+        exception,
+        exception is None,
+    )
+
+
+def convert_events(
+    events: Iterable[GcalAppointmentData],
+    notes: NoteStore,
+    logger: logging.Logger,
+    formatter: LocalTimestampFormatter,
+) -> List[ConvertedEvent]:
+    """
+    Create calcurse lines for the events, with the
+    key (see event_key) of the event each line was created from
+    """
+    horizon = int(time.time()) + EXPAND_DAYS * 86400
+    return [
+        convert_event(event_data, notes, logger, formatter, horizon)
+        for event_data in events
+    ]
+
+
+def apply_exceptions(
+    lines: List[CalcurseLine],
+    keys: Sequence[int],
+    exceptions: Iterable[InstanceException],
+) -> Tuple[List[CalcurseLine], List[int]]:
+    """
+    Add the dates of moved/cancelled occurrences to their recurring events, or
+    if the recurring event was expanded, remove the line for that occurrence
+
+    >>> line = "01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 {1W} |ev [gcal]"
+    >>> apply_exceptions([line, "expanded"], [1, 2], [InstanceException(1, 2, "01/11/2021")])
+    (['01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 {1W !01/11/2021} |ev [gcal]'], [1])
+    """
+    dates: Dict[int, List[str]] = {}
+    occurrences: Set[int] = set()
+    for exception in exceptions:
+        dates.setdefault(exception.recurring, []).append(exception.date)
+        occurrences.add(exception.occurrence)
+    kept_lines: List[CalcurseLine] = []
+    kept_keys: List[int] = []
+    for line, key in zip(lines, keys):
+        if key in occurrences:
+            continue
+        if key in dates:
+            line = add_exceptions(line, dates[key])
+        kept_lines.append(line)
+        kept_keys.append(key)
+    return kept_lines, kept_keys
+
+
+def convert_chunk(
+    events: List[GcalAppointmentData],
+) -> Tuple[List[ConvertedEvent], Dict[str, str]]:
+    """
+    Convert events in a worker process, returns the lines/keys and
+    the notes (hash -> contents) they reference, for the parent to write
+
+    >>> convert_chunk([{"summary": "ev", "start": None, "end": None, "event_id": "1",
+    ...     "description": {"text": None, "links": []}, "location": None, "recurrence": [],
+    ...     "attendees": [], "event_link": None}])
+    ([ConvertedEvent(lines=[], exception=None, cacheable=True)], {})
+    """
+    # the parent checks which notes already exist
+    notes = NoteStore(Path(os.devnull), index=set())
+    converted = convert_events(events, notes, get_logger(), get_formatter())
+    return converted, notes.pending
+
+
+def dedupe(
+    files: Iterable[Tuple[List[CalcurseLine], Sequence[int]]],
+) -> Tuple[List[Tuple[List[CalcurseLine], List[int]]], int]:
+    """
+    Remove any events whose key was already seen in a previous file (or
+    earlier in the same file), returns the lines (and keys) kept for each
+    file and the number of duplicates removed
+
+    Only the 8-byte keys are kept in memory, not the events/lines
+
+    >>> dedupe([(["a", "b"], [1, 2]), (["old a", "c", "c"], [1, 3, 3])])
+    ([(['a', 'b'], [1, 2]), (['c'], [3])], 2)
+    """
+    seen: Set[int] = set()
+    kept_files: List[Tuple[List[CalcurseLine], List[int]]] = []
+    removed = 0
+    for lines, keys in files:
+        kept: List[CalcurseLine] = []
+        kept_keys: List[int] = []
+        for line, key in zip(lines, keys):
+            if key in seen:
+                removed += 1
+                continue
+            seen.add(key)
+            kept.append(line)
+            kept_keys.append(key)
+        kept_files.append((kept, kept_keys))
+    return kept_files, removed
+
+
+def read_export(
+    path: str, lookup: Callable[[int], Optional[CachedEvent]]
+) -> Iterator[Tuple[int, Optional[CachedEvent], Optional[GcalAppointmentData]]]:
+    """
+    The fingerprint of each event in an export, with its cached line/key (from
+    lookup) or, if it isn't cached, the event. Cached events in newline-delimited
+    JSON and binary exports (which store the fingerprint) aren't decoded
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as f:
+    ...     _ = f.write('{"summary": "a"}\\n{"summary": "b"}\\n')
+    ...     f.flush()
+    ...     cached = {fingerprint('{"summary": "a"}'): ("a line", 1)}
+    ...     [item[1:] for item in read_export(f.name, cached.get)]
+    [(('a line', 1), None), (None, {'summary': 'b'})]
+    """
+    if path.endswith(f".{BINARY_FORMAT}"):
+        with BinaryExport(path) as export:
+            for record in export.records():
+                cached = lookup(record.fingerprint)
+                event = export.decode(record) if cached is None else None
+                yield record.fingerprint, cached, event
+        return
+    for text, event_data in yield_json_raw(path):
+        fp = fingerprint(text)
+        cached = lookup(fp)
+        if cached is None and event_data is None:
+            event_data = json.loads(text)
+        yield fp, cached, event_data
+
+
+def newest_first(paths: Iterable[str]) -> List[str]:
+    """Sort paths by modification time, most recently modified first"""
+
+    def mtime(path: str) -> int:
+        key = stat_key(path)
+        return 0 if key is None else key[0]
+
+    return sorted(paths, key=lambda p: (mtime(p), p), reverse=True)
+
+
+def gcal_workers() -> int:
+    try:
+        return max(1, int(os.environ.get(WORKERS_ENV, "1")))
+    except ValueError:
+        return 1
+
+
+# events restored from the archive aren't managed by the extension anymore
+ARCHIVE_SUFFIX = "[gcal-archive]"
+
+
+def restored_line(appointment_line: CalcurseLine) -> CalcurseLine:
+    """
+    >>> restored_line("01/02/2020 [1] |old [gcal]")
+    '01/02/2020 [1] |old [gcal-archive]'
+    """
+    return appointment_line[: -len("[gcal]")] + ARCHIVE_SUFFIX
 
 
 class gcal_ext(Extension):
-    def load_json_events(self) -> Iterator[GcalAppointmentData]:
-        json_files: List[str] = glob.glob(
-            str(self.config.calcurse_load_dir / "gcal" / "*.json")
+    files = frozenset({"apts", "notes"})
+    state_files = frozenset(
+        {"gcal_manifest.json", NOTES_FILE, "gcal_cache", "gcal_archive.json.gz"}
+    )
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.state_dir / "gcal_manifest.json"
+
+    @property
+    def cache_dir(self) -> Path:
+        return self.state_dir / "gcal_cache"
+
+    @property
+    def archive_path(self) -> Path:
+        return self.state_dir / "gcal_archive.json.gz"
+
+    def json_files(self) -> List[str]:
+        gcal_dir = self.config.calcurse_load_dir / "gcal"
+        return sorted(
+            glob.glob(str(gcal_dir / "*.json"))
+            + glob.glob(str(gcal_dir / "*.ndjson"))
+            + glob.glob(str(gcal_dir / f"*.{BINARY_FORMAT}"))
         )
+
+    def input_keys(self) -> Dict[str, Any]:
+        keys = super().input_keys()
+        for path in self.json_files():
+            keys[path] = stat_key(path)
+        window = Window.from_env()
+        keys["window"] = None if window is None else window.key
+        keys["timezone"] = timezone_key()
+        return keys
+
+    def load_gcal_apts(
+        self,
+        manifest: GcalManifest,
+        notes: NoteStore,
+        window: Optional[Window] = None,
+    ) -> Tuple[List[CalcurseLine], bool]:
+        """
+        Creates calcurse lines for each JSON file, re-using the lines from
+        the event cache for any files that haven't changed (see the manifest)
+
+        Events in more than one file (e.g. a meeting on two calendars, or
+        an old export next to a new one) are de-duplicated by event_key,
+        keeping the event from the most recently modified file. If there is
+        a retention window, events outside it are archived instead (see
+        archive_events). Only the notes for the events which are kept are written
+
+        Returns the lines, and whether or not any file had to be re-derived
+        (or the window changed)
+        """
+        json_files: List[str] = self.json_files()
         if not json_files:
             self.logger.warning(
                 "No json files found in '{}'".format(str(self.config.calcurse_load_dir))
             )
-        else:
-            for event_json_path in json_files:
-                with open(event_json_path, "r") as json_f:
-                    yield from json.load(json_f)
+        manifest.forget_missing(json_files)
+        workers = gcal_workers()
+        # notes for derived events are collected here, and only those
+        # referenced by an event which isn't a duplicate are queued
+        derived_notes = NoteStore(notes.notes_dir, index=notes.index)
+        cache = EventCache(self.cache_dir)
+        window_key = None if window is None else window.key
+        changed = manifest.window != window_key
+        manifest.window = window_key
+        with ExitStack() as stack:
+            pools: List[Executor] = []
+
+            def derive(
+                path: str, sha1: str, check_notes: bool = False
+            ) -> Tuple[List[CalcurseLine], List[int]]:
+                self.logger.info(f"Deriving events from {path}")
+                if workers > 1 and not pools:
+                    pools.append(stack.enter_context(self.process_pool(workers)))
+                return self.convert_file(
+                    path,
+                    sha1,
+                    cache,
+                    derived_notes,
+                    pools[0] if pools else None,
+                    workers,
+                    check_notes,
+                )
 
-    def load_calcurse_apts(self) -> Iterator[CalcurseLine]:
+            paths: List[str] = []
+            files: List[Tuple[List[CalcurseLine], Sequence[int]]] = []
+            for event_json_path in newest_first(json_files):
+                cached: Optional[DerivedLines] = None
+                if manifest.unchanged(event_json_path):
+                    cached = cache.load_derived(
+                        event_json_path, manifest.files[event_json_path]["sha1"]
+                    )
+                if cached is None:
+                    key = stat_key(event_json_path)
+                    if key is None:
+                        continue
+                    changed = True
+                    self.metrics.count("json_files_derived")
+                    self.metrics.count("json_bytes", key[1])
+                    sha1 = sha1_file(event_json_path)
+                    cached = derive(event_json_path, sha1)
+                    manifest.set_file(event_json_path, key, sha1)
+                paths.append(event_json_path)
+                files.append(cached)
+
+            deduped, duplicates = dedupe(files)
+            if duplicates:
+                self.logger.info(f"Removed {duplicates} duplicate events")
+                self.metrics.count("duplicates", duplicates)
+            kept_files: List[List[CalcurseLine]] = []
+            outside: List[Tuple[CalcurseLine, int]] = []
+            for lines, keys in deduped:
+                if window is None:
+                    kept_files.append(lines)
+                    continue
+                kept, file_outside = window.partition(lines, keys)
+                kept_files.append(kept)
+                outside.extend(file_outside)
+            if window is not None:
+                self.metrics.count("outside_window", len(outside))
+                self.archive_events(manifest, outside, derived_notes)
+            referenced = referenced_notes(chain.from_iterable(kept_files))
+            notes.queue(
+                {
+                    sha: note
+                    for sha, note in derived_notes.pending.items()
+                    if sha in referenced
+                }
+            )
+            # notes may have been removed since the lines were cached
+            missing = {sha for sha in referenced if sha not in notes}
+            for event_json_path, kept in zip(paths, kept_files):
+                if not missing:
+                    break
+                file_missing = missing & referenced_notes(kept)
+                if file_missing:
+                    self.logger.info(f"Notes missing for {event_json_path}")
+                    changed = True
+                    derived_notes.pending.clear()
+                    derive(
+                        event_json_path,
+                        manifest.files[event_json_path]["sha1"],
+                        check_notes=True,
+                    )
+                    notes.queue(
+                        {
+                            sha: note
+                            for sha, note in derived_notes.pending.items()
+                            if sha in file_missing
+                        }
+                    )
+                    missing -= file_missing
+        cache.forget_missing(json_files)
+        return list(chain.from_iterable(kept_files)), changed
+
+    def archive_events(
+        self,
+        manifest: GcalManifest,
+        events: List[Tuple[CalcurseLine, int]],
+        derived_notes: NoteStore,
+    ) -> None:
         """
-        Loads in the calcurse appointments file, removing any google appointments
+        Add the events outside the retention window to the archive, with their
+        notes (which the notes garbage collection removes once no appointment
+        references them). The archive is only read/written if these are
+        different from the last run
         """
-        for apt in yield_lines(self.config.calcurse_dir / "apts"):
-            if not is_google_event(apt):
-                yield apt
+        sha1 = sha1_lines([line for line, _ in events])
+        if sha1 == manifest.archived:
+            return
+
+        def read_note(sha: str) -> Optional[str]:
+            note = derived_notes.pending.get(sha)
+            if note is not None:
+                return note
+            try:
+                return (derived_notes.notes_dir / sha).read_text()
+            except OSError:
+                return None
+
+        archive = GcalArchive.load(self.archive_path)
+        added = archive.add(events, read_note)
+        if added:
+            self.logger.info(f"Archived {added} events outside the retention window")
+            archive.save()
+        self.metrics.count("archived", added)
+        manifest.archived = sha1
+
+    def restore_archive(self) -> int:
+        """
+        Copy the archived events (and their notes) back into the appointments
+        file. They're tagged with ARCHIVE_SUFFIX instead of [gcal], so they
+        are kept as regular appointments instead of being replaced by the
+        next pre-load. Events which were already restored are skipped
+
+        Returns the number of events restored
+        """
+        archive = GcalArchive.load(self.archive_path)
+        apts_path = self.config.calcurse_dir / "apts"
+        existing: List[CalcurseLine] = (
+            list(yield_lines(apts_path)) if apts_path.exists() else []
+        )
+        present = set(existing)
+        restored = [
+            line
+            for line in map(restored_line, archive.events.values())
+            if line not in present
+        ]
+        if not restored:
+            return 0
+        notes = NoteStore(self.config.calcurse_dir / "notes")
+        notes.queue(
+            {
+                sha: archive.notes[sha]
+                for sha in referenced_notes(restored)
+                if sha in archive.notes
+            }
+        )
+        # write notes first, so the appointments never reference missing notes
+        notes.flush()
+        events = merge_sorted(sort_lines(existing), sort_lines(restored))
+        write_if_changed(apts_path, "".join(f"{event}\n" for event in events))
+        return len(restored)
+
+    def process_pool(self, workers: int) -> Executor:
+        from multiprocessing import get_context
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.logger.info(f"Converting events with {workers} processes")
+        # this may be running in a thread (see runner.run_enabled), which isn't safe to fork
+        return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+    def convert_file(
+        self,
+        path: str,
+        sha1: str,
+        cache: EventCache,
+        notes: NoteStore,
+        pool: Optional[Executor],
+        workers: int,
+        check_notes: bool = False,
+    ) -> Tuple[List[CalcurseLine], List[int]]:
+        """
+        Create the calcurse lines (and event keys) for a JSON file, in the order
+        the events are in the file
+
+        Events which are in the cache are neither converted nor, for
+        newline-delimited JSON, decoded. Their notes are assumed to exist
+        unless check_notes is set (see load_gcal_apts). The others are
+        converted in chunks, in this process or across the pool. At most two
+        chunks per worker are in flight, so the file is never read into memory at once
+
+        Moved/cancelled occurrences of recurring events are applied to the
+        recurring events (see apply_exceptions) once the whole file is converted.
+        The cache is saved with the lines, and sha1 (the hash of the file)
+        """
+        formatter = get_formatter()
+        lines: List[CalcurseLine] = []
+        keys: List[int] = []
+        cached_events = cache.load(path)
+
+        def lookup(fp: int) -> Optional[CachedEvent]:
+            cached = cached_events.get(fp)
+            if cached is not None and check_notes:
+                sha = note_hash(cached[0])
+                if sha is not None and sha not in notes:
+                    return None
+            return cached
+
+        # the fingerprint of each line, and the indexes of any which aren't cached
+        fingerprints: List[int] = []
+        uncacheable: Set[int] = set()
+        exceptions: List[InstanceException] = []
+        # the fingerprint and cached event for each item in a chunk, and
+        # the conversion of the items that weren't cached
+        in_flight: Deque[
+            Tuple[
+                List[Tuple[int, Optional[CachedEvent]]],
+                Union[
+                    List[ConvertedEvent],
+                    Future[Tuple[List[ConvertedEvent], Dict[str, str]]],
+                ],
+            ]
+        ] = deque()
+
+        def collect() -> None:
+            chunk, result = in_flight.popleft()
+            if isinstance(result, Future):
+                result, pending = result.result()
+                notes.queue(pending)
+            converted = iter(result)
+            for fp, cached in chunk:
+                if cached is not None:
+                    fingerprints.append(fp)
+                    lines.append(cached[0])
+                    keys.append(cached[1])
+                    continue
+                event = next(converted)
+                if event.exception is not None:
+                    exceptions.append(event.exception)
+                for line, key in event.lines:
+                    if event.cacheable:
+                        fingerprints.append(fp)
+                    else:
+                        uncacheable.add(len(lines))
+                    lines.append(line)
+                    keys.append(key)
+
+        for items in chunked(read_export(path, lookup), CHUNK_SIZE):
+            chunk: List[Tuple[int, Optional[CachedEvent]]] = []
+            misses: List[GcalAppointmentData] = []
+            for fp, cached, event_data in items:
+                if cached is None:
+                    assert event_data is not None
+                    misses.append(event_data)
+                chunk.append((fp, cached))
+            self.metrics.count("cache_hits", len(chunk) - len(misses))
+            if pool is None or not misses:
+                in_flight.append(
+                    (chunk, convert_events(misses, notes, self.logger, formatter))
+                )
+            else:
+                in_flight.append((chunk, pool.submit(convert_chunk, misses)))
+            if len(in_flight) >= 2 * workers:
+                collect()
+        while in_flight:
+            collect()
+        if not uncacheable and not exceptions:
+            cache.save(path, sha1, fingerprints, lines, keys)
+            return lines, keys
+        derived = (
+            apply_exceptions(lines, keys, exceptions) if exceptions else (lines, keys)
+        )
+        cache.save(
+            path,
+            sha1,
+            fingerprints,
+            [line for i, line in enumerate(lines) if i not in uncacheable],
+            [key for i, key in enumerate(keys) if i not in uncacheable],
+            derived,
+        )
+        return derived
 
     def pre_load(self) -> None:
         """
         - read in and filter out google events
         - create google events from JSON
         - write back both event types
+
+        If none of the JSON files or the appointments file changed since the
+        last run (according to the manifest), this does nothing
         """
         self.logger.warn("gcal: running pre-load hook")
 
-        filtered_apts: List[CalcurseLine] = list(self.load_calcurse_apts())
-        self.logger.info(f"Found {len(filtered_apts)} non-gcal events")
-        calcurse_func = partial(
-            create_calcurse_event,
-            notes_dir=self.config.calcurse_dir / "notes",
-            logger=self.logger,
-        )
-        google_apts: List[CalcurseLine] = [
-            ev for ev in map(calcurse_func, self.load_json_events()) if ev is not None
-        ]
+        apts_path = self.config.calcurse_dir / "apts"
+        window = Window.from_env()
+        with self.metrics.timer("read"):
+            manifest = GcalManifest.load(self.manifest_path)
+            if manifest.is_fresh(self.json_files(), apts_path) and manifest.window == (
+                None if window is None else window.key
+            ):
+                self.logger.info("gcal: inputs unchanged since last pre-load, skipping")
+                self.metrics.count("skipped")
+                return
+
+            # the google events are skipped without being decoded, and the hash of
+            # the file is the same as sha1_lines for an apts file we wrote
+            filtered_apts, apts_sha1 = read_lines_without_suffix(apts_path, GCAL_SUFFIX)
+            self.logger.info(f"Found {len(filtered_apts)} non-gcal events")
+            # sorting the appointments file may re-order these, so hash in sorted order
+            non_gcal_sha1 = sha1_lines(sorted(filtered_apts))
+        self.metrics.count("apts", len(filtered_apts))
+
+        notes = NoteStore(self.config.calcurse_dir / "notes")
+        # reading the JSON is streamed, so this includes reading any changed files
+        with self.metrics.timer("convert"):
+            google_apts, changed = self.load_gcal_apts(manifest, notes, window)
+        self.metrics.count("events", len(google_apts))
+        if not changed and manifest.apts_unchanged(non_gcal_sha1, apts_sha1):
+            self.logger.info("gcal: appointments file already up to date")
+            manifest.set_apts(apts_path, apts_sha1, non_gcal_sha1)
+            manifest.save()
+            return
+
         self.logger.info(
             f"Writing {len(google_apts)} gcal events to calcurse appointments file"
         )
 
-        events = filtered_apts + google_apts
-        try:
-            events.sort(key=lambda x: datetime.strptime(x[:10], "%m/%d/%Y"))
-        except Exception as e:
-            self.logger.error(f"Error sorting events: {e}")
+        # the existing appointments are typically already sorted, so
+        # sorting both and merging is linear in the common case
+        with self.metrics.timer("sort"):
+            events: List[CalcurseLine] = list(
+                merge_sorted(sort_lines(filtered_apts), sort_lines(google_apts))
+            )
 
-        buf = io.StringIO()
-        for event in events:
-            buf.write(event)
-            buf.write("\n")
+        with self.metrics.timer("write"):
+            # write notes first, so the appointments never reference missing notes
+            written = notes.flush()
+            self.logger.info(f"Wrote {written} new notes")
+            self.metrics.count("notes_written", written)
+            self.metrics.count("bytes_written", notes.bytes_written)
+            events_sha1 = sha1_lines(events)
+            if events_sha1 != apts_sha1:
+                text = "".join(f"{event}\n" for event in events)
+                if write_if_changed(apts_path, text):
+                    self.metrics.count("bytes_written", len(text.encode()))
+        with self.metrics.timer("gc"):
+            self.update_notes(manifest, notes, events, google_apts)
+        manifest.set_apts(apts_path, events_sha1, non_gcal_sha1)
+        manifest.save()
 
-        (self.config.calcurse_dir / "apts").write_text(buf.getvalue())
+    def update_notes(
+        self,
+        manifest: GcalManifest,
+        notes: NoteStore,
+        events: List[CalcurseLine],
+        google_apts: List[CalcurseLine],
+    ) -> None:
+        """
+        Remove any notes previously created by this extension which are no
+        longer referenced by any appointment or todo
+        """
+        referenced = referenced_notes(events)
+        referenced |= referenced_notes_in_file(self.config.calcurse_dir / "todo")
+        gcal_notes = referenced_notes(google_apts)
+        kept: Set[str] = set()
+        if self.live_calcurse_dir is not None:
+            # staging, calcurse may still be showing the appointments these
+            # replace, so keep those notes until a later run
+            live_apts = self.live_calcurse_dir / "apts"
+            kept = referenced_notes_in_file(live_apts) & manifest.notes
+            referenced |= kept
+        removed = notes.collect_garbage(manifest.notes - gcal_notes, referenced)
+        if removed:
+            self.logger.info(f"Removed {removed} orphaned gcal notes")
+            self.metrics.count("notes_removed", removed)
+        manifest.notes = gcal_notes | kept
 
     def post_save(self) -> None:
         self.logger.warn("gcal: doesn't have a post-save hook!")
@@ -0,0 +1,240 @@
+"""
+A persisted fingerprint of the inputs/outputs of the gcal pre-load hook
+
+Stores the mtime/size/content hash of each gcal JSON file, a hash of the
+non-gcal section of the appointments file, and a fingerprint of the
+appointments file that was last written. If none of those changed, the
+pre-load can be skipped entirely, and if only some JSON files changed, only
+those are re-derived (the lines derived from the others are kept in the
+event cache, see event_cache.EventCache)
+
+This is kept small, so checking whether anything changed is loading a short
+JSON file and a few stat() calls. The hashes of the notes the extension
+created are only needed once the appointments are re-written, so those are
+stored in a separate file (NOTES_FILE), which is only loaded if they're used
+"""
+
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union, Any
+
+Json = Dict[str, Any]
+
+# bumped whenever the lines created from events change (e.g. recurring
+# events becoming calcurse recurrences), so every JSON file is re-derived
+MANIFEST_VERSION = 5
+
+NOTES_FILE = "gcal_notes.json"
+
+# (st_mtime_ns, st_size)
+StatKey = Tuple[int, int]
+
+
+def stat_key(path: Union[str, Path]) -> Optional[StatKey]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def sha1_file(path: Union[str, Path]) -> str:
+    hsh = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            hsh.update(chunk)
+    return hsh.hexdigest()
+
+
+def sha1_lines(lines: List[str]) -> str:
+    """
+    >>> sha1_lines(["a", "b"]) == sha1_lines(["a", "b"])
+    True
+    >>> sha1_lines(["a", "b"]) == sha1_lines(["ab"])
+    False
+    """
+    hsh = hashlib.sha1()
+    for line in lines:
+        hsh.update(line.encode())
+        hsh.update(b"\n")
+    return hsh.hexdigest()
+
+
+def timezone_key() -> str:
+    """
+    The rendered calcurse lines depend on the local timezone, so
+    if that changes, everything in the manifest is invalid
+    """
+    return "|".join(
+        [
+            os.environ.get("TZ", ""),
+            str(time.timezone),
+            str(time.altzone),
+            ",".join(time.tzname),
+        ]
+    )
+
+
+class GcalManifest:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.tz: str = timezone_key()
+        # json file path -> {"mtime_ns", "size", "sha1"}
+        self.files: Dict[str, Json] = {}
+        # {"mtime_ns", "size", "sha1", "non_gcal_sha1"}
+        self.apts: Optional[Json] = None
+        # the retention window (see retention.Window.key) the appointments
+        # were written with, and the hash of the events outside it which were archived
+        self.window: Optional[str] = None
+        self.archived: Optional[str] = None
+        self._notes: Optional[Set[str]] = None
+
+    @property
+    def notes_path(self) -> Path:
+        return self.path.with_name(NOTES_FILE)
+
+    @property
+    def notes(self) -> Set[str]:
+        """
+        The hashes of the notes created by the gcal extension, loaded when
+        first used. These don't depend on the version/timezone of the manifest
+
+        >>> import tempfile
+        >>> m = GcalManifest(Path(tempfile.mkdtemp()) / "manifest.json")
+        >>> m.notes.add("a" * 40)
+        >>> m.save()
+        >>> GcalManifest.load(m.path).notes == {"a" * 40}
+        True
+        """
+        if self._notes is None:
+            try:
+                with self.notes_path.open("r") as f:
+                    notes = json.load(f)
+            except (OSError, ValueError):
+                notes = []
+            self._notes = set(notes) if isinstance(notes, list) else set()
+        return self._notes
+
+    @notes.setter
+    def notes(self, notes: Set[str]) -> None:
+        self._notes = notes
+
+    @classmethod
+    def load(cls, path: Path) -> "GcalManifest":
+        """
+        Load the manifest from disk; returns an empty manifest if it doesn't
+        exist, is corrupt, was created by a different version or in a different timezone
+        """
+        manifest = cls(path)
+        try:
+            with path.open("r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != MANIFEST_VERSION
+            or data.get("tz") != manifest.tz
+        ):
+            return manifest
+        manifest.files = data.get("files", {})
+        manifest.apts = data.get("apts")
+        manifest.window = data.get("window")
+        manifest.archived = data.get("archived")
+        return manifest
+
+    def save(self) -> None:
+        # the notes first, so the manifest never claims to be up to date without them
+        if self._notes is not None:
+            tmp = self.notes_path.with_name(self.notes_path.name + ".tmp")
+            with tmp.open("w") as f:
+                json.dump(sorted(self._notes), f)
+            os.replace(tmp, self.notes_path)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "tz": self.tz,
+                    "files": self.files,
+                    "apts": self.apts,
+                    "window": self.window,
+                    "archived": self.archived,
+                },
+                f,
+            )
+        os.replace(tmp, self.path)
+
+    def is_fresh(self, json_files: List[str], apts_path: Path) -> bool:
+        """
+        Checks if the JSON files and appointments file are unchanged
+        since the last time the manifest was saved, using only stat() calls
+        """
+        if self.apts is None or set(self.files) != set(json_files):
+            return False
+        for path in json_files:
+            entry = self.files[path]
+            if stat_key(path) != (entry["mtime_ns"], entry["size"]):
+                return False
+        return stat_key(apts_path) == (self.apts["mtime_ns"], self.apts["size"])
+
+    def unchanged(self, path: str) -> bool:
+        """
+        Whether the JSON file has the same contents as when it was last derived.
+        If the file was only touched, the content hash still matches and the
+        stat info is refreshed
+
+        >>> m = GcalManifest(Path("manifest.json"))
+        >>> m.unchanged(__file__)
+        False
+        >>> m.set_file(__file__, (0, 0), sha1_file(__file__))
+        >>> m.unchanged(__file__), m.files[__file__]["mtime_ns"] == stat_key(__file__)[0]
+        (True, True)
+        """
+        entry = self.files.get(path)
+        if entry is None:
+            return False
+        key = stat_key(path)
+        if key is None:
+            return False
+        if key != (entry["mtime_ns"], entry["size"]):
+            if sha1_file(path) != entry["sha1"]:
+                return False
+            entry["mtime_ns"], entry["size"] = key
+        return True
+
+    def set_file(self, path: str, key: StatKey, sha1: str) -> None:
+        self.files[path] = {"mtime_ns": key[0], "size": key[1], "sha1": sha1}
+
+    def forget_missing(self, json_files: List[str]) -> None:
+        """Remove any JSON files which no longer exist"""
+        keep = set(json_files)
+        for path in list(self.files):
+            if path not in keep:
+                del self.files[path]
+
+    def apts_unchanged(self, non_gcal_sha1: str, apts_sha1: str) -> bool:
+        """
+        If the non-gcal section of the appointments file is the same, and the
+        appointments file is identical to what was last written, there is nothing to do
+        """
+        return (
+            self.apts is not None
+            and self.apts["non_gcal_sha1"] == non_gcal_sha1
+            and self.apts["sha1"] == apts_sha1
+        )
+
+    def set_apts(self, apts_path: Path, sha1: str, non_gcal_sha1: str) -> None:
+        key = stat_key(apts_path)
+        if key is None:
+            self.apts = None
+            return
+        self.apts = {
+            "mtime_ns": key[0],
+            "size": key[1],
+            "sha1": sha1,
+            "non_gcal_sha1": non_gcal_sha1,
+        }
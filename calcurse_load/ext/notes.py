@@ -0,0 +1,187 @@
+"""
+A content-addressed store for calcurse notes
+
+calcurse names each note file by the SHA1 of its contents, so if a file
+with that name already exists it is by definition correct. This keeps an
+in-memory index of the notes directory (loaded once), only writes notes
+which are missing, and writes those atomically
+"""
+
+import os
+import re
+import mmap
+import hashlib
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+NOTE_HASH = re.compile(r">([0-9a-f]{40})\b")
+NOTE_HASH_BYTES = re.compile(rb">([0-9a-f]{40})\b")
+
+_TMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+
+
+def note_hash(line: str) -> Optional[str]:
+    """
+    Extract the note hash from a calcurse appointment/todo line
+
+    >>> note_hash("01/02/2021 @ 10:00 -> 01/02/2021 @ 11:00>2bc634d750ed006c6908c49251939c21c6bd5113 |ev [gcal]")
+    '2bc634d750ed006c6908c49251939c21c6bd5113'
+    >>> note_hash("[1]>2bc634d750ed006c6908c49251939c21c6bd5113 some todo")
+    '2bc634d750ed006c6908c49251939c21c6bd5113'
+    >>> note_hash("01/02/2021 [1] |no note") is None
+    True
+    """
+    m = NOTE_HASH.search(line)
+    if m is None:
+        return None
+    return m.group(1)
+
+
+def referenced_notes(lines: Iterable[str]) -> Set[str]:
+    return {h for h in map(note_hash, lines) if h is not None}
+
+
+def referenced_notes_in_file(path: Path) -> Set[str]:
+    """
+    The notes referenced by a calcurse apts/todo file. This memory maps the
+    file and searches the bytes, so none of the lines are decoded. Unlike
+    note_hash, this finds every hash on a line, which only keeps more notes
+
+    >>> import tempfile
+    >>> d = Path(tempfile.mkdtemp())
+    >>> _ = (d / "apts").write_text("01/02/2021 [1]>" + "a" * 40 + " |ev\\n01/02/2021 [1] |no note\\n")
+    >>> referenced_notes_in_file(d / "apts") == {"a" * 40}
+    True
+    >>> referenced_notes_in_file(d / "missing")
+    set()
+    """
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        return set()
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return set()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return {sha.decode() for sha in NOTE_HASH_BYTES.findall(mm)}
+
+
+class NoteStore:
+    def __init__(self, notes_dir: Path, index: Optional[Set[str]] = None) -> None:
+        self.notes_dir = notes_dir
+        # if not given, the index is loaded from notes_dir when it's first needed
+        self._index: Optional[Set[str]] = index
+        self._pending: Dict[str, str] = {}
+        # total size of the notes written by flush
+        self.bytes_written = 0
+
+    @property
+    def index(self) -> Set[str]:
+        """The set of note hashes currently in the notes directory"""
+        if self._index is None:
+            try:
+                self._index = set(os.listdir(self.notes_dir))
+            except FileNotFoundError:
+                self._index = set()
+        return self._index
+
+    def __contains__(self, sha: str) -> bool:
+        return sha in self._pending or sha in self.index
+
+    def add(self, note: str) -> str:
+        """
+        Queue a note to be written, if it doesn't already exist. Returns the hash
+        """
+        sha = hashlib.sha1(note.encode()).hexdigest()
+        if sha not in self:
+            self._pending[sha] = note
+        return sha
+
+    @property
+    def pending(self) -> Dict[str, str]:
+        """The notes queued to be written, hash -> contents"""
+        return self._pending
+
+    def queue(self, pending: Dict[str, str]) -> None:
+        """
+        Queue notes which were already hashed (e.g. by a worker process), if they don't already exist
+
+        >>> store = NoteStore(Path("notes"), index={"a" * 40})
+        >>> store.queue({"a" * 40: "exists", "b" * 40: "new"})
+        >>> list(store.pending.values())
+        ['new']
+        """
+        for sha, note in pending.items():
+            if sha not in self:
+                self._pending[sha] = note
+
+    def flush(self) -> int:
+        """
+        Write any queued notes to disk, using a temporary file and
+        a rename, so calcurse never sees a partially written note
+
+        Returns the number of notes written
+
+        >>> import tempfile
+        >>> store = NoteStore(Path(tempfile.mkdtemp()))
+        >>> sha = store.add("a note")
+        >>> store.flush(), (store.notes_dir / sha).read_text()
+        (1, 'a note')
+        >>> os.listdir(store.notes_dir) == [sha]
+        True
+        """
+        if not self._pending:
+            return 0
+        self.notes_dir.mkdir(parents=True, exist_ok=True)
+        written = 0
+        # plain strings, pathlib is a noticeable part of writing thousands of notes
+        notes_dir = os.fspath(self.notes_dir)
+        pid = os.getpid()
+        for sha, note in self._pending.items():
+            # notes are named by their contents, so unlike mkstemp, the
+            # temporary file doesn't need a random name to be unique
+            tmp = os.path.join(notes_dir, f".{sha}.{pid}.tmp")
+            try:
+                fd = os.open(tmp, _TMP_FLAGS, 0o644)
+            except FileExistsError:
+                # left behind by a killed process which had the same pid
+                os.unlink(tmp)
+                fd = os.open(tmp, _TMP_FLAGS, 0o644)
+            data = note.encode()
+            try:
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view) :]
+                finally:
+                    os.close(fd)
+                os.replace(tmp, os.path.join(notes_dir, sha))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self.index.add(sha)
+            self.bytes_written += len(data)
+            written += 1
+        self._pending.clear()
+        return written
+
+    def collect_garbage(self, owned: Iterable[str], referenced: Set[str]) -> int:
+        """
+        Remove any notes in 'owned' (notes this extension created) which
+        are no longer referenced. Notes created by calcurse/other
+        extensions are never removed
+
+        Returns the number of notes removed
+        """
+        removed = 0
+        for sha in owned:
+            if sha in referenced or sha not in self.index:
+                continue
+            try:
+                os.unlink(self.notes_dir / sha)
+            except FileNotFoundError:
+                pass
+            else:
+                removed += 1
+            self.index.discard(sha)
+        return removed
@@ -0,0 +1,299 @@
+"""
+Converts the recurrence rules (RFC 5545 RRULE/EXDATE lines) on Google Calendar
+events to calcurse recurrences, so a recurring event is one line in the
+appointments file instead of a line for each occurrence
+
+calcurse repeats an appointment every N days/weeks/months/years at the same
+local time, optionally until some date, skipping any exception dates. Rules
+which can't be represented like that (e.g. every Monday and Wednesday, the
+second Tuesday of each month, or an event which repeats in a timezone with
+different daylight savings rules) are expanded into their occurrences instead
+"""
+
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+FREQUENCIES = {"DAILY": "D", "WEEKLY": "W", "MONTHLY": "M", "YEARLY": "Y"}
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+# rule parts calcurse can represent, if they agree with the start of the event
+SUPPORTED_PARTS = frozenset(
+    {"FREQ", "INTERVAL", "UNTIL", "COUNT", "BYDAY", "BYMONTHDAY", "BYMONTH", "WKST"}
+)
+
+DAY = 86400
+
+# 'MM/DD/YYYY @ HH:MM -> MM/DD/YYYY @ HH:MM', the recurrence follows this
+TIMES_WIDTH = 40
+
+
+def parse_rrule(line: str) -> Dict[str, str]:
+    """
+    >>> parse_rrule("RRULE:FREQ=WEEKLY;BYDAY=MO;INTERVAL=2")
+    {'FREQ': 'WEEKLY', 'BYDAY': 'MO', 'INTERVAL': '2'}
+    """
+    _, _, value = line.partition(":")
+    parts: Dict[str, str] = {}
+    for part in value.split(";"):
+        name, _, val = part.partition("=")
+        parts[name.upper()] = val
+    return parts
+
+
+def calcurse_date(dt: datetime) -> str:
+    """
+    >>> calcurse_date(datetime(2021, 1, 4, 10))
+    '01/04/2021'
+    """
+    return f"{dt.month:02d}/{dt.day:02d}/{dt.year:04d}"
+
+
+def _zone(tzid: Optional[str]) -> Optional[tzinfo]:
+    if tzid is None:
+        return None
+    try:
+        from zoneinfo import ZoneInfo
+    except ImportError:
+        return None
+    try:
+        return ZoneInfo(tzid)
+    except (KeyError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def _differs_from_local(tzid: str) -> bool:
+    """Whether the timezone has a different UTC offset than the local timezone on any day in the next year"""
+    zone = _zone(tzid)
+    if zone is None:
+        return False
+    now = int(time.time())
+    return any(
+        datetime.fromtimestamp(t, zone).utcoffset()
+        != timedelta(seconds=time.localtime(t).tm_gmtoff)
+        for t in range(now, now + 366 * DAY, DAY)
+    )
+
+
+def event_zone(tzid: Optional[str]) -> Optional[tzinfo]:
+    """
+    The timezone a recurring event repeats in, or None if it repeats
+    at the same local time (the timezone is the same as the local one, or unknown)
+
+    >>> event_zone(None) is None
+    True
+    >>> event_zone("Not/A_Timezone") is None
+    True
+    """
+    if tzid is None or not _differs_from_local(tzid):
+        return None
+    return _zone(tzid)
+
+
+def wall_time(
+    value: str, tzid: Optional[str], zone: Optional[tzinfo] = None
+) -> datetime:
+    """
+    Convert an iCalendar DATE/DATE-TIME (in UTC, the timezone 'tzid', or
+    floating) to a naive datetime in 'zone' (or the local timezone)
+
+    >>> wall_time("20210111", None)
+    datetime.datetime(2021, 1, 11, 0, 0)
+    >>> wall_time("20210111T100000Z", None, timezone.utc)
+    datetime.datetime(2021, 1, 11, 10, 0)
+    >>> wall_time("20210111T100000", "Not/A_Timezone")
+    datetime.datetime(2021, 1, 11, 10, 0)
+    """
+    if len(value) == 8:
+        # dates don't have a timezone
+        return datetime.strptime(value, "%Y%m%d")
+    if value.endswith("Z"):
+        dt = datetime.strptime(value[:-1], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+    else:
+        dt = datetime.strptime(value, "%Y%m%dT%H%M%S")
+        source = _zone(tzid)
+        if source is None:
+            return dt
+        dt = dt.replace(tzinfo=source)
+    return datetime.fromtimestamp(dt.timestamp(), zone).replace(tzinfo=None)
+
+
+def exception_dates(
+    recurrence: List[str], zone: Optional[tzinfo] = None
+) -> List[datetime]:
+    """
+    The EXDATEs in the rules, as naive datetimes in 'zone' (or the local timezone)
+
+    >>> exception_dates(["RRULE:FREQ=DAILY", "EXDATE;VALUE=DATE:20210111,20210112"])
+    [datetime.datetime(2021, 1, 11, 0, 0), datetime.datetime(2021, 1, 12, 0, 0)]
+    """
+    dates: List[datetime] = []
+    for line in recurrence:
+        name, _, values = line.partition(":")
+        params = name.split(";")
+        if params[0].upper() != "EXDATE":
+            continue
+        tzid = next((p[5:] for p in params[1:] if p.upper().startswith("TZID=")), None)
+        for value in values.split(","):
+            dates.append(wall_time(value.strip(), tzid, zone))
+    return dates
+
+
+def _nth_occurrence(first: datetime, freq: str, interval: int, n: int) -> datetime:
+    if freq == "D":
+        return first + timedelta(days=interval * n)
+    if freq == "W":
+        return first + timedelta(weeks=interval * n)
+    months = interval * n * (12 if freq == "Y" else 1)
+    years, month = divmod(first.month - 1 + months, 12)
+    return first.replace(year=first.year + years, month=month + 1)
+
+
+def calcurse_recurrence(
+    recurrence: List[str], start: int, tzid: Optional[str] = None
+) -> Optional[str]:
+    """
+    The calcurse recurrence for an event which starts at 'start' and repeats
+    in the timezone 'tzid', or None if calcurse can't represent the rules
+
+    >>> start = int(datetime(2021, 1, 4, 10).timestamp())  # a Monday
+    >>> calcurse_recurrence(["RRULE:FREQ=WEEKLY;BYDAY=MO"], start)
+    '{1W}'
+    >>> calcurse_recurrence(["RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=3", "EXDATE;VALUE=DATE:20210118"], start)
+    '{2W -> 02/01/2021 !01/18/2021}'
+    >>> calcurse_recurrence(["RRULE:FREQ=MONTHLY;UNTIL=20220104"], start)
+    '{1M -> 01/04/2022}'
+    >>> calcurse_recurrence(["RRULE:FREQ=WEEKLY;BYDAY=MO,WE"], start) is None
+    True
+    >>> calcurse_recurrence(["RRULE:FREQ=MONTHLY;BYDAY=2TU"], start) is None
+    True
+    """
+    rules = [line for line in recurrence if line.upper().startswith("RRULE")]
+    if len(rules) != 1 or any(
+        not line.upper().startswith(("RRULE", "EXDATE")) for line in recurrence
+    ):
+        return None
+    parts = parse_rrule(rules[0])
+    freq = FREQUENCIES.get(parts.get("FREQ", ""))
+    if freq is None or not set(parts) <= SUPPORTED_PARTS:
+        return None
+    if tzid is not None and event_zone(tzid) is not None:
+        return None
+    first = datetime.fromtimestamp(start)
+    try:
+        interval = int(parts.get("INTERVAL", "1"))
+        # calcurse repeats on the same weekday/day of the month/month as the
+        # start, so these are only the same rule if they match the start
+        if "BYDAY" in parts and (
+            freq != "W" or parts["BYDAY"] != WEEKDAYS[first.weekday()]
+        ):
+            return None
+        if "BYMONTHDAY" in parts and (
+            not (freq == "M" or (freq == "Y" and "BYMONTH" in parts))
+            or int(parts["BYMONTHDAY"]) != first.day
+        ):
+            return None
+        if "BYMONTH" in parts and (freq != "Y" or int(parts["BYMONTH"]) != first.month):
+            return None
+        # the rule skips months/years which don't have that day
+        if (freq == "M" and first.day > 28) or (
+            freq == "Y" and (first.month, first.day) == (2, 29)
+        ):
+            return None
+        until: Optional[datetime] = None
+        if "UNTIL" in parts:
+            until = wall_time(parts["UNTIL"], None)
+        elif "COUNT" in parts:
+            count = int(parts["COUNT"])
+            if count < 1:
+                return None
+            until = _nth_occurrence(first, freq, interval, count - 1)
+        exdates = exception_dates(recurrence)
+    except ValueError:
+        return None
+    if interval < 1:
+        return None
+    rec = f"{{{interval}{freq}"
+    if until is not None:
+        rec += f" -> {calcurse_date(until)}"
+    for d in dict.fromkeys(map(calcurse_date, exdates)):
+        rec += f" !{d}"
+    return rec + "}"
+
+
+def expand_recurrence(
+    recurrence: List[str], start: int, horizon: int, tzid: Optional[str] = None
+) -> Optional[List[int]]:
+    """
+    The start of each occurrence of a recurring event up to 'horizon', or
+    None if the rules couldn't be parsed (or python-dateutil isn't installed)
+
+    >>> start = int(datetime(2021, 1, 4, 10).timestamp())  # a Monday
+    >>> [calcurse_date(datetime.fromtimestamp(t)) for t in expand_recurrence(
+    ...     ["RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4", "EXDATE;VALUE=DATE:20210111"], start, start + 365 * DAY)]
+    ['01/04/2021', '01/06/2021', '01/13/2021']
+    """
+    try:
+        from dateutil.rrule import rrulestr, rruleset  # type: ignore[import]
+    except ImportError:
+        return None
+    zone = event_zone(tzid)
+    first = datetime.fromtimestamp(start, zone).replace(tzinfo=None)
+    last = datetime.fromtimestamp(horizon, zone).replace(tzinfo=None)
+    rules = rruleset()
+    try:
+        for line in recurrence:
+            name = line.partition(":")[0].partition(";")[0].upper()
+            if name == "RRULE":
+                parts = parse_rrule(line)
+                if "UNTIL" in parts:
+                    # expanded as naive times, so the UNTIL can't be in UTC
+                    until = wall_time(parts["UNTIL"], None, zone)
+                    parts["UNTIL"] = until.strftime("%Y%m%dT%H%M%S")
+                rule = ";".join(f"{k}={v}" for k, v in parts.items())
+                rules.rrule(rrulestr(rule, dtstart=first))
+            elif name == "RDATE":
+                tzid_param = next(
+                    (
+                        p[5:]
+                        for p in line.partition(":")[0].split(";")[1:]
+                        if p.upper().startswith("TZID=")
+                    ),
+                    None,
+                )
+                for value in line.partition(":")[2].split(","):
+                    rules.rdate(wall_time(value.strip(), tzid_param, zone))
+            elif name != "EXDATE":
+                return None
+        excluded = {d.date() for d in exception_dates(recurrence, zone)}
+        occurrences = rules.between(first, last, inc=True)
+    except (ValueError, TypeError):
+        return None
+    if zone is None:
+        return [int(dt.timestamp()) for dt in occurrences if dt.date() not in excluded]
+    return [
+        int(dt.replace(tzinfo=zone).timestamp())
+        for dt in occurrences
+        if dt.date() not in excluded
+    ]
+
+
+def add_exceptions(line: str, dates: Iterable[str]) -> str:
+    """
+    Add exception dates to a recurring calcurse appointment line,
+    lines which aren't recurring are returned unchanged
+
+    >>> add_exceptions("01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 {1W !01/11/2021} |ev", ["01/18/2021", "01/11/2021"])
+    '01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 {1W !01/11/2021 !01/18/2021} |ev'
+    >>> add_exceptions("01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 |ev", ["01/18/2021"])
+    '01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 |ev'
+    """
+    if line[TIMES_WIDTH : TIMES_WIDTH + 2] != " {":
+        return line
+    end = line.find("}", TIMES_WIDTH)
+    if end == -1:
+        return line
+    existing = set(line[TIMES_WIDTH + 2 : end].split(" !")[1:])
+    added = "".join(f" !{d}" for d in dict.fromkeys(dates) if d not in existing)
+    return line[:end] + added + line[end:]
@@ -0,0 +1,241 @@
+"""
+Retention windows for gcal events, and an archive of the events outside them
+
+By default every exported event is written to the appointments file, so
+calcurse parses decades of past meetings on every launch. If a window is set
+(see Window.from_env), only events which overlap it are written; the others
+are kept in a compressed archive in the calcurse_load data directory, and
+can be copied back into the appointments file with `--restore-gcal-archive`
+"""
+
+import os
+import gzip
+import json
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .apts import UNPARSEABLE, sort_key
+from .notes import note_hash, referenced_notes
+
+# days before/after today to keep gcal events for, unset keeps everything
+PAST_DAYS_ENV = "CALCURSE_LOAD_GCAL_PAST_DAYS"
+FUTURE_DAYS_ENV = "CALCURSE_LOAD_GCAL_FUTURE_DAYS"
+
+ARCHIVE_VERSION = 1
+
+# (year, month, day)
+Day = Tuple[int, int, int]
+
+
+def _env_days(name: str) -> Optional[int]:
+    try:
+        days = int(os.environ[name])
+    except (KeyError, ValueError):
+        return None
+    return days if days >= 0 else None
+
+
+def _day(d: date) -> Day:
+    return d.year, d.month, d.day
+
+
+def _parse_day(text: str) -> Optional[Day]:
+    """
+    >>> _parse_day("01/04/2021")
+    (2021, 1, 4)
+    """
+    try:
+        return int(text[6:10]), int(text[0:2]), int(text[3:5])
+    except ValueError:
+        return None
+
+
+def last_day(line: str) -> Optional[Day]:
+    """
+    The last day a calcurse appointment line is on: the day it ends, or the
+    last day it repeats on. None if it repeats forever (or can't be parsed)
+
+    >>> last_day("01/04/2021 @ 10:00 -> 01/05/2021 @ 11:00>abc |ev [gcal]")
+    (2021, 1, 5)
+    >>> last_day("01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 {1W -> 03/01/2021 !01/11/2021} |ev [gcal]")
+    (2021, 3, 1)
+    >>> last_day("01/04/2021 @ 10:00 -> 01/04/2021 @ 11:00 {1W} |ev [gcal]") is None
+    True
+    >>> last_day("03/04/2020 [1] |all day event")
+    (2020, 3, 4)
+    """
+    if line[10:13] == " @ ":
+        if line[18:22] != " -> ":
+            return None
+        recurrence, end = 40, _parse_day(line[22:32])
+    else:
+        recurrence, end = 10, _parse_day(line[0:10])
+    if line[recurrence : recurrence + 2] == " {":
+        close = line.find("}", recurrence)
+        until = line.find(" -> ", recurrence, close)
+        if until == -1:
+            return None
+        return _parse_day(line[until + 4 : until + 14])
+    return end
+
+
+class Window(NamedTuple):
+    """
+    >>> w = Window((2021, 1, 1), (2021, 12, 31))
+    >>> w.contains("06/01/2021 @ 10:00 -> 06/01/2021 @ 11:00>abc |ev [gcal]")
+    True
+    >>> w.contains("12/31/2020 @ 23:00 -> 01/01/2021 @ 01:00>abc |ev [gcal]")
+    True
+    >>> w.contains("01/01/2022 @ 10:00 -> 01/01/2022 @ 11:00>abc |ev [gcal]")
+    False
+    >>> w.contains("01/04/2016 @ 10:00 -> 01/04/2016 @ 11:00 {1W} |ev [gcal]")
+    True
+    """
+
+    # the first/last days events are kept for, None is unbounded
+    first: Optional[Day]
+    last: Optional[Day]
+
+    @classmethod
+    def from_env(cls, today: Optional[date] = None) -> Optional["Window"]:
+        """
+        >>> os.environ[PAST_DAYS_ENV] = "30"
+        >>> Window.from_env(date(2021, 3, 1))
+        Window(first=(2021, 1, 30), last=None)
+        >>> del os.environ[PAST_DAYS_ENV]
+        >>> Window.from_env() is None
+        True
+        """
+        past, future = _env_days(PAST_DAYS_ENV), _env_days(FUTURE_DAYS_ENV)
+        if past is None and future is None:
+            return None
+        if today is None:
+            today = date.today()
+        return cls(
+            None if past is None else _day(today - timedelta(days=past)),
+            None if future is None else _day(today + timedelta(days=future)),
+        )
+
+    @property
+    def key(self) -> str:
+        """Saved in the manifest, so the appointments are re-written when the window moves"""
+        return json.dumps([self.first, self.last])
+
+    def contains(self, line: str) -> bool:
+        """Whether any part of the appointment is in the window, lines which can't be parsed are kept"""
+        key = sort_key(line)
+        if key == UNPARSEABLE:
+            return True
+        if self.last is not None and key[:3] > self.last:
+            return False
+        if self.first is not None:
+            end = last_day(line)
+            if end is not None and end < self.first:
+                return False
+        return True
+
+    def partition(
+        self, lines: Iterable[str], keys: Iterable[int]
+    ) -> Tuple[List[str], List[Tuple[str, int]]]:
+        """
+        Split lines into those in the window, and those outside
+        it (with their event keys, for the archive)
+
+        >>> Window(None, (2021, 1, 1)).partition(["01/01/2021 [1] |a", "01/02/2021 [1] |b"], [1, 2])
+        (['01/01/2021 [1] |a'], [('01/02/2021 [1] |b', 2)])
+        """
+        kept: List[str] = []
+        outside: List[Tuple[str, int]] = []
+        for line, key in zip(lines, keys):
+            if self.contains(line):
+                kept.append(line)
+            else:
+                outside.append((line, key))
+        return kept, outside
+
+
+class GcalArchive:
+    """
+    The gcal events which were outside the retention window, by event key,
+    and their notes. Stored as gzipped JSON
+
+    >>> import tempfile
+    >>> archive = GcalArchive(Path(tempfile.mkdtemp()) / "gcal_archive.json.gz")
+    >>> archive.add([("01/02/2020 [1]>" + "a" * 40 + " |old [gcal]", 1)], {"a" * 40: "note"}.get)
+    1
+    >>> archive.add([("01/03/2020 [1] |moved [gcal]", 1)], {}.get)
+    1
+    >>> archive.save()
+    >>> GcalArchive.load(archive.path).events
+    {'0000000000000001': '01/03/2020 [1] |moved [gcal]'}
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        # event key (16 hex digits) -> calcurse line
+        self.events: Dict[str, str] = {}
+        # note hash -> contents, for notes referenced by the archived events
+        self.notes: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "GcalArchive":
+        """Load the archive, returns an empty archive if it doesn't exist or is corrupt"""
+        archive = cls(path)
+        try:
+            with gzip.open(path, "rt") as f:
+                data = json.load(f)
+        except (OSError, EOFError, ValueError):
+            return archive
+        if not isinstance(data, dict) or data.get("version") != ARCHIVE_VERSION:
+            return archive
+        archive.events = data["events"]
+        archive.notes = data["notes"]
+        return archive
+
+    def add(
+        self,
+        events: Iterable[Tuple[str, int]],
+        read_note: Callable[[str], Optional[str]],
+    ) -> int:
+        """
+        Add or replace events in the archive, read_note is called for the
+        contents of any notes which aren't already in the archive
+
+        Returns the number of events which were added or changed
+        """
+        changed = 0
+        for line, key in events:
+            hex_key = f"{key:016x}"
+            if self.events.get(hex_key) == line:
+                continue
+            self.events[hex_key] = line
+            changed += 1
+            sha = note_hash(line)
+            if sha is not None and sha not in self.notes:
+                note = read_note(sha)
+                if note is not None:
+                    self.notes[sha] = note
+        return changed
+
+    def save(self) -> None:
+        # drop notes which no archived event references any more
+        referenced = referenced_notes(self.events.values())
+        self.notes = {sha: n for sha, n in self.notes.items() if sha in referenced}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt") as f:
+                json.dump(
+                    {
+                        "version": ARCHIVE_VERSION,
+                        "events": self.events,
+                        "notes": self.notes,
+                    },
+                    f,
+                )
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
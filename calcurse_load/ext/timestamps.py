@@ -0,0 +1,124 @@
+"""
+Fast conversion of epoch timestamps to calcurse 'MM/DD/YYYY @ HH:MM' strings
+in the local timezone
+
+Instead of creating datetime objects for each timestamp, this precomputes a
+table of the UTC offset transitions (e.g. daylight savings) for the local
+timezone, and caches the 'MM/DD/YYYY @ ' prefix for each day, so formatting
+a timestamp is a table lookup, some integer math and a string join
+"""
+
+import time
+from bisect import bisect_right
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .manifest import timezone_key
+
+DAY = 86400
+# transitions are computed for blocks of this many seconds at a time
+BLOCK = 365 * DAY
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+HOURS_MINUTES: Tuple[str, ...] = tuple(
+    f"{h:02d}:{m:02d}" for h in range(24) for m in range(60)
+)
+
+
+def _utc_offset(epochtime: int) -> int:
+    return time.localtime(epochtime).tm_gmtoff
+
+
+class LocalTimestampFormatter:
+    """
+    >>> from datetime import datetime
+    >>> def reference(t):
+    ...     dt = datetime.fromtimestamp(t).astimezone()
+    ...     return dt.strftime("%m/%d/") + str(dt.year) + dt.strftime(" @ %H:%M")
+    >>> fmt = LocalTimestampFormatter()
+    >>> all(fmt.format(t) == reference(t) for t in range(0, 2 * BLOCK, 3607))
+    True
+    >>> fmt.format_many([0, None]) == [reference(0), ""]
+    True
+    """
+
+    def __init__(self) -> None:
+        # block number -> (transition start times, utc offsets)
+        self._blocks: Dict[int, Tuple[List[int], List[int]]] = {}
+        # days since epoch -> 'MM/DD/YYYY @ '
+        self._prefixes: Dict[int, str] = {}
+
+    def _build_block(self, block: int) -> Tuple[List[int], List[int]]:
+        """
+        Find the UTC offset transitions in this block by sampling the offset
+        once a day, and binary searching for the exact second it changed
+        """
+        start = block * BLOCK
+        end = start + BLOCK - 1
+        starts = [start]
+        offsets = [_utc_offset(start)]
+        prev = start
+        for day in range(1, BLOCK // DAY + 1):
+            t = min(start + day * DAY, end)
+            offset = _utc_offset(t)
+            if offset != offsets[-1]:
+                lo, hi = prev, t
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if _utc_offset(mid) == offsets[-1]:
+                        lo = mid
+                    else:
+                        hi = mid
+                starts.append(hi)
+                offsets.append(_utc_offset(hi))
+            prev = t
+        table = (starts, offsets)
+        self._blocks[block] = table
+        return table
+
+    def _day_prefix(self, days: int) -> str:
+        d = date.fromordinal(EPOCH_ORDINAL + days)
+        prefix = f"{d.month:02d}/{d.day:02d}/{d.year} @ "
+        self._prefixes[days] = prefix
+        return prefix
+
+    def format(self, epochtime: int) -> str:
+        table = self._blocks.get(epochtime // BLOCK)
+        if table is None:
+            table = self._build_block(epochtime // BLOCK)
+        starts, offsets = table
+        if len(offsets) == 1:
+            offset = offsets[0]
+        else:
+            offset = offsets[bisect_right(starts, epochtime) - 1]
+        days, seconds = divmod(epochtime + offset, DAY)
+        prefix = self._prefixes.get(days)
+        if prefix is None:
+            prefix = self._day_prefix(days)
+        return prefix + HOURS_MINUTES[seconds // 60]
+
+    def format_many(self, epochtimes: Iterable[Optional[int]]) -> List[str]:
+        """
+        Format a batch of timestamps, None is converted to an empty string
+        """
+        fmt = self.format
+        return ["" if t is None else fmt(t) for t in epochtimes]
+
+
+@lru_cache(maxsize=2)
+def _formatter(tz: str) -> LocalTimestampFormatter:
+    return LocalTimestampFormatter()
+
+
+def get_formatter() -> LocalTimestampFormatter:
+    """
+    Returns a shared formatter for the current timezone; if the timezone
+    changes (e.g. in a long running process), a new one is created
+    """
+    return _formatter(timezone_key())
+
+
+def format_timestamps(epochtimes: Iterable[Optional[int]]) -> List[str]:
+    return get_formatter().format_many(epochtimes)
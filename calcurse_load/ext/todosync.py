@@ -0,0 +1,180 @@
+"""
+Three-way sync between the calcurse todo file and todo.txt
+
+pre-load saves a snapshot of the todo.txt lines it loaded into calcurse,
+keyed by their normalised text. That's the common ancestor: in post-save,
+diffing the calcurse todos against the snapshot gives the changes made in
+calcurse (additions, deletions, priority changes, completions), which are
+applied to todo.txt -- unless todo.txt has also changed that todo since
+the snapshot, in which case todo.txt wins
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .manifest import StatKey, stat_key
+
+SNAPSHOT_VERSION = 2
+
+# normalised text -> (the line in todo.txt, the todo.txt line for the todo as
+# calcurse has it), either is None if the todo isn't in that file
+Base = Dict[str, Tuple[Optional[str], Optional[str]]]
+
+# normalised text -> the new todo.txt line, or None if the todo was removed
+Changes = Dict[str, Optional[str]]
+
+
+def todo_key(text: str) -> str:
+    """
+    Normalise the description of a todo (without priority/completion/dates)
+    so the same todo matches in calcurse and todo.txt
+
+    >>> todo_key("  call   mom ")
+    'call mom'
+    """
+    return " ".join(text.split())
+
+
+def diff(base: Base, current: Dict[str, str]) -> Changes:
+    """
+    The changes made in calcurse since the snapshot was taken
+
+    >>> base = {"a": ("a", "a"), "b": ("(D) b", "b"), "c": ("c", "c"), "e": ("e", None)}
+    >>> diff(base, {"a": "a", "b": "(A) b", "d": "d"})
+    {'b': '(A) b', 'd': 'd', 'c': None}
+
+    A note attached to a todo in calcurse doesn't change it
+
+    >>> from .todotxt import parse_calcurse
+    >>> [todo] = parse_calcurse("[0]>2bc634d750ed006c6908c49251939c21c6bd5113 a")
+    >>> diff(base, {todo_key(todo.convert().description): todo.convert().line})
+    {'b': None, 'c': None}
+    """
+    changes: Changes = {}
+    for key, line in current.items():
+        if key not in base or base[key][1] != line:
+            changes[key] = line
+    for key, (_, loaded) in base.items():
+        if loaded is not None and key not in current:
+            changes[key] = None
+    return changes
+
+
+class MergeResult(NamedTuple):
+    # the todo.txt lines after merging, and their keys
+    lines: List[str]
+    keys: List[str]
+    # lines added at the end of todo.txt
+    appended: List[str]
+    # if any existing lines were changed/removed
+    modified: bool
+    # keys of todos changed in both calcurse and todo.txt, todo.txt wins
+    conflicts: List[str]
+
+
+def merge(
+    lines: List[str], keys: List[str], base: Base, changes: Changes
+) -> MergeResult:
+    """
+    Apply the changes made in calcurse to the current todo.txt lines,
+    keys are the normalised description of each line
+
+    >>> base = {"a": ("a", "a"), "b": ("b", "b"), "c": ("c", "c")}
+    >>> res = merge(["a", "b", "(B) c", "e"], ["a", "b", "c", "e"], base, {"a": None, "c": None, "b": "x b", "d": "d"})
+    >>> res.lines, res.keys, res.modified, res.conflicts
+    (['x b', '(B) c', 'e', 'd'], ['b', 'c', 'e', 'd'], True, ['c'])
+    >>> merge(["a"], ["a"], {}, {"a": "(A) a", "b": "b"})
+    MergeResult(lines=['a', 'b'], keys=['a', 'b'], appended=['b'], modified=False, conflicts=[])
+    """
+    index: Dict[str, int] = {}
+    for n, key in enumerate(keys):
+        index.setdefault(key, n)
+    merged: List[Optional[str]] = list(lines)
+    appended: List[str] = []
+    appended_keys: List[str] = []
+    conflicts: List[str] = []
+    modified = False
+    for key, new in changes.items():
+        i = index.get(key)
+        base_line = base[key][0] if key in base else None
+        if i is None:
+            if base_line is None:
+                # added in calcurse
+                if new is not None:
+                    appended.append(new)
+                    appended_keys.append(key)
+            elif new is not None:
+                # changed in calcurse, but removed from todo.txt
+                conflicts.append(key)
+            continue
+        if base_line is None:
+            # added in both
+            continue
+        if base_line != lines[i]:
+            # changed in todo.txt since the snapshot
+            if new != lines[i]:
+                conflicts.append(key)
+            continue
+        merged[i] = new
+        modified = True
+    result = [line for line in merged if line is not None]
+    result.extend(appended)
+    result_keys = [key for key, line in zip(keys, merged) if line is not None]
+    result_keys.extend(appended_keys)
+    return MergeResult(result, result_keys, appended, modified, conflicts)
+
+
+class TodoSnapshot:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        # the todo.txt file, and its stat info when the snapshot was saved
+        self.todo_file: Optional[str] = None
+        self.stat: Optional[StatKey] = None
+        self.base: Base = {}
+
+    @classmethod
+    def load(cls, path: Path, todo_file: Path) -> Optional["TodoSnapshot"]:
+        """
+        Load the snapshot from disk, returns None if it doesn't exist, is corrupt,
+        was created by a different version or for a different todo.txt file
+        """
+        try:
+            with path.open("r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != SNAPSHOT_VERSION
+            or data.get("todo_file") != str(todo_file)
+        ):
+            return None
+        snapshot = cls(path)
+        snapshot.todo_file = data["todo_file"]
+        snapshot.stat = tuple(data["stat"]) if data.get("stat") else None  # type: ignore[assignment]
+        snapshot.base = {k: (v[0], v[1]) for k, v in data["base"].items()}
+        return snapshot
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w") as f:
+            json.dump(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "todo_file": self.todo_file,
+                    "stat": self.stat,
+                    "base": self.base,
+                },
+                f,
+            )
+        os.replace(tmp, self.path)
+
+    def set_todo_file(self, todo_file: Path) -> None:
+        self.todo_file = str(todo_file)
+        self.stat = stat_key(todo_file)
+
+    def todo_file_unchanged(self) -> bool:
+        """Checks if todo.txt is unchanged since the snapshot, using stat()"""
+        return self.todo_file is not None and stat_key(self.todo_file) == self.stat
@@ -1,108 +1,296 @@
 import os
 import re
 from pathlib import Path
-from typing import Optional, Iterator, List, Set
-from functools import lru_cache
-
-from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from .abstract import Extension
-from .utils import yield_lines
+from .manifest import stat_key
+from .todosync import Base, TodoSnapshot, diff, merge, todo_key
+from .utils import append_lines, write_if_changed
+
+# a line in todo.txt, i.e.: 'x (A) 2021-01-02 2021-01-01 description +project @context'
+# the priority is only parsed for (A)-(C), since calcurse has no equivalent for the others.
+# trailing whitespace is included in the groups, matching lazily is much slower
+TODOTXT_LINE = re.compile(
+    r"^[ \t]*("
+    r"(?:(x)[ \t]+)?"
+    r"(?:\(([ABC])\)[ \t]*)?"
+    r"((?:(\d{4}-\d{2}-\d{2})[ \t]+(?:(\d{4}-\d{2}-\d{2})[ \t]+)?)?(.*))"
+    r")$",
+    re.MULTILINE,
+)
+
+# a line in the calcurse todo file, i.e. '[1] text', completed todos have a negative priority
+# the note reference calcurse puts after the priority isn't part of the todo
+CALCURSE_LINE = re.compile(
+    r"^[ \t]*\[(-?)(\d+)\](?:>[0-9a-f]{40})?[ \t]*(.*)$", re.MULTILINE
+)
+
+PROJECT = re.compile(r"(?:^|\s)\+(\S+)")
+CONTEXT = re.compile(r"(?:^|\s)@(\S+)")
+
+TODOTXT_PRIORITIES = {"": "", "A": "(A)", "B": "(B)", "C": "(C)"}
+TODOTXT_TO_CALCURSE = {"(A)": 1, "(B)": 4, "(C)": 7}
+
+# (done, todo.txt priority) -> the start of the calcurse line
+CALCURSE_PREFIXES: Dict[Tuple[bool, str], str] = {
+    (done, priority): f"[{'-' if done else ''}{TODOTXT_TO_CALCURSE.get(priority, 0)}] "
+    for done in (False, True)
+    for priority in TODOTXT_PRIORITIES.values()
+}
+
+
+def calcurse_to_todotxt_priority(priority: int) -> str:
+    if priority == 0:
+        return ""
+    elif priority < 4:
+        return "(A)"
+    elif priority < 7:
+        return "(B)"
+    else:
+        return "(C)"
 
 
 # parses, converts and reconstructs the TodoTxtTodo format
-@dataclass
 class TodoTxtTodo:
-    priority: str
-    text: str
+    __slots__ = (
+        "priority",
+        "text",
+        "done",
+        "completion_date",
+        "creation_date",
+        "description",
+    )
+
+    def __init__(
+        self,
+        priority: str,
+        text: str,
+        done: bool = False,
+        completion_date: Optional[str] = None,
+        creation_date: Optional[str] = None,
+        description: Optional[str] = None,
+    ) -> None:
+        self.priority = priority
+        # the dates and description, everything after the priority
+        self.text = text
+        self.done = done
+        self.completion_date = completion_date
+        self.creation_date = creation_date
+        self.description: str = text if description is None else description
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TodoTxtTodo):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
 
     def __hash__(self) -> int:
         return hash(self.text)
 
+    @property
+    def projects(self) -> List[str]:
+        """
+        >>> TodoTxtTodo.parse_line("(A) call mom +family @phone").projects
+        ['family']
+        """
+        return PROJECT.findall(self.description)
+
+    @property
+    def contexts(self) -> List[str]:
+        """
+        >>> TodoTxtTodo.parse_line("(A) call mom +family @phone").contexts
+        ['phone']
+        """
+        return CONTEXT.findall(self.description)
+
+    @property
+    def calcurse_line(self) -> str:
+        """
+        >>> TodoTxtTodo(priority="(A)", text="some todo").calcurse_line
+        '[1] some todo'
+        >>> TodoTxtTodo(priority="", text="some other todo (A)").calcurse_line
+        '[0] some other todo (A)'
+        >>> TodoTxtTodo.parse_line("x (C) 2021-01-02 not important todo").calcurse_line
+        '[-7] 2021-01-02 not important todo'
+        """
+        return CALCURSE_PREFIXES[self.done, self.priority] + self.text
+
     def convert(self) -> "CalcurseTodo":
         """
         >>> TodoTxtTodo(priority="(A)", text="some todo").convert()
-        CalcurseTodo(priority=1, text='some todo')
-        >>> TodoTxtTodo(priority="", text="some other todo (A)").convert()
-        CalcurseTodo(priority=0, text='some other todo (A)')
-        >>> TodoTxtTodo(priority="(C)", text="not important todo").convert()
-        CalcurseTodo(priority=7, text='not important todo')
-        """
-        priority: int = {
-            "(A)": 1,
-            "(B)": 4,
-            "(C)": 7,
-        }.get(self.priority, 0)
-        return CalcurseTodo(priority, self.text)
+        CalcurseTodo(priority=1, text='some todo', completed=False)
+        >>> TodoTxtTodo(priority="(C)", text="not important todo", done=True).convert()
+        CalcurseTodo(priority=7, text='not important todo', completed=True)
+        """
+        return CalcurseTodo(
+            TODOTXT_TO_CALCURSE.get(self.priority, 0), self.text, self.done
+        )
 
     @classmethod
     def parse_line(cls, line: str) -> "TodoTxtTodo":
         """
-        Parse a todo.txt line, parse out the priority
+        Parse a todo.txt line
 
         >>> TodoTxtTodo.parse_line("(A) some todo")
-        TodoTxtTodo(priority='(A)', text='some todo')
-        >>> TodoTxtTodo.parse_line("not important")
-        TodoTxtTodo(priority='', text='not important')
+        TodoTxtTodo(priority='(A)', text='some todo', done=False, completion_date=None, creation_date=None, description='some todo')
+        >>> TodoTxtTodo.parse_line("(D) 2021-01-01 not important").description
+        '(D) 2021-01-01 not important'
+        >>> TodoTxtTodo.parse_line("x (B) 2021-01-02 2021-01-01 finished +project")
+        TodoTxtTodo(priority='(B)', text='2021-01-02 2021-01-01 finished +project', done=True, completion_date='2021-01-02', creation_date='2021-01-01', description='finished +project')
+        >>> TodoTxtTodo.parse_line("2021-01-01 2021-02-01 due").description
+        '2021-02-01 due'
+        >>> TodoTxtTodo.parse_line("").line
+        ''
         """
-        prio, text = re.match(r"^(\([ABC]\))?(.*)", line.strip()).groups()  # type: ignore[union-attr]
-        if prio is None:
-            prio = ""
-        return cls(priority=prio, text=text.strip())
+        for _, todo in parse_todotxt(line):
+            return todo
+        return cls("", "")
 
     @property
     def line(self) -> str:
         """Convert the todotxt data back to a line"""
-        if self.priority == "":
-            return self.text
-        else:
-            return f"{self.priority} {self.text}"
+        line = self.text
+        if self.priority != "":
+            line = f"{self.priority} {line}"
+        if self.done:
+            line = f"x {line}"
+        return line
 
 
 # parses, converts and reconstructs the CalcurseTodo format
-@dataclass
 class CalcurseTodo:
-    priority: int
-    text: str
+    __slots__ = ("priority", "text", "completed")
+
+    def __init__(self, priority: int, text: str, completed: bool = False) -> None:
+        self.priority = priority
+        self.text = text
+        self.completed = completed
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CalcurseTodo):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
 
     def __hash__(self) -> int:
         return hash(self.text)
 
+    @property
+    def todotxt_line(self) -> str:
+        """
+        >>> CalcurseTodo(priority=0, text="something basic").todotxt_line
+        'something basic'
+        >>> CalcurseTodo(priority=3, text="important!!", completed=True).todotxt_line
+        'x (A) important!!'
+        """
+        priority = calcurse_to_todotxt_priority(self.priority)
+        line = f"{priority} {self.text}" if priority else self.text
+        return f"x {line}" if self.completed else line
+
     def convert(self) -> "TodoTxtTodo":
         """
-        >>> CalcurseTodo(priority=0, text="something basic").convert()
-        TodoTxtTodo(priority='', text='something basic')
-        >>> CalcurseTodo(priority=3, text="important!!").convert()
-        TodoTxtTodo(priority='(A)', text='important!!')
-        """
-        priority = ""
-        if self.priority == 0:
-            pass
-        elif self.priority < 4:
-            priority = "(A)"
-        elif self.priority < 7:
-            priority = "(B)"
-        else:
-            priority = "(C)"
-        return TodoTxtTodo(priority=priority, text=self.text)
+        >>> CalcurseTodo(priority=0, text="something basic").convert().line
+        'something basic'
+        >>> CalcurseTodo(priority=5, text="2021-01-01 important!!").convert().creation_date
+        '2021-01-01'
+        """
+        return TodoTxtTodo.parse_line(self.todotxt_line)
 
     @classmethod
     def parse_line(cls, line: str) -> "CalcurseTodo":
         """
-        Parse a calcurse line, parse out the priority
+        Parse a calcurse line, parse out the priority; calcurse
+        marks completed todos with a negative priority
 
         >>> CalcurseTodo.parse_line('[1] most important todo')
-        CalcurseTodo(priority=1, text='most important todo')
+        CalcurseTodo(priority=1, text='most important todo', completed=False)
+        >>> CalcurseTodo.parse_line('[-0] done')
+        CalcurseTodo(priority=0, text='done', completed=True)
         """
-        prio, text = re.match(r"^(\[\d+\])(.*)", line.strip()).groups()  # type: ignore[union-attr]
-        return cls(priority=int(prio.strip("[]")), text=text.strip())
+        for todo in parse_calcurse(line):
+            return todo
+        raise ValueError(f"Could not parse calcurse todo {line!r}")
 
     @property
     def line(self) -> str:
-        return f"[{self.priority}] {self.text}"
+        return f"[{'-' if self.completed else ''}{self.priority}] {self.text}"
+
+
+def parse_todotxt(buf: str) -> Iterator[Tuple[str, TodoTxtTodo]]:
+    """
+    Parse all the todos in the contents of a todo.txt file in a single pass,
+    yields the (stripped) line and the parsed todo. Blank lines are skipped
+
+    >>> [(line, todo.description) for line, todo in parse_todotxt("(A) a\\n\\n  x b \\r\\nc")]
+    [('(A) a', 'a'), ('x b', 'b'), ('c', 'c')]
+    """
+    todo, priorities = TodoTxtTodo, TODOTXT_PRIORITIES
+    for line, done, priority, text, date1, date2, description in TODOTXT_LINE.findall(
+        buf
+    ):
+        if line[-1:].isspace():
+            line, text, description = line.rstrip(), text.rstrip(), description.rstrip()
+        if not line:
+            continue
+        if done:
+            yield line, todo(
+                priorities[priority],
+                text,
+                True,
+                date1 or None,
+                date2 or None,
+                description,
+            )
+        elif date2:
+            # only completed todos have two dates, so the second is part of the description
+            yield line, todo(
+                priorities[priority],
+                text,
+                False,
+                None,
+                date1,
+                text[text.index(date2, len(date1)) :],
+            )
+        else:
+            yield line, todo(
+                priorities[priority], text, False, None, date1 or None, description
+            )
+
+
+def parse_calcurse(buf: str) -> Iterator[CalcurseTodo]:
+    """
+    Parse all the todos in the contents of a calcurse todo file in a single pass
+
+    >>> list(parse_calcurse("[1] a\\n\\n[-4]>2bc634d750ed006c6908c49251939c21c6bd5113 b \\n"))
+    [CalcurseTodo(priority=1, text='a', completed=False), CalcurseTodo(priority=4, text='b', completed=True)]
+    """
+    for completed, priority, text in CALCURSE_LINE.findall(buf):
+        yield CalcurseTodo(int(priority), text.rstrip(), completed == "-")
 
 
 class todotxt_ext(Extension):
+    files = frozenset({"todo"})
+    state_files = frozenset({"todotxt_snapshot.json"})
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.state_dir / "todotxt_snapshot.json"
+
+    def input_keys(self) -> Dict[str, Any]:
+        keys = super().input_keys()
+        todo_file = self._find_todo_file()
+        keys["todo.txt"] = (
+            None if todo_file is None else [str(todo_file), stat_key(todo_file)]
+        )
+        return keys
+
     def pre_load(self) -> None:
         """
         Replace the calcurse todos with my todo.txt file contents
@@ -112,48 +300,105 @@ class todotxt_ext(Extension):
         if todo_file is None:
             self.logger.warning("Could not find todo.txt file in expected locations")
             return
-        # read in todo.txt items
-        todos: List[TodoTxtTodo] = list(self._read_todotxt_file(todo_file))
-        # convert to calcurse format
-        calcurse_todos: List[CalcurseTodo] = list(map(lambda t: t.convert(), todos))
-        # write to calcurse file
-        with open(self.config.calcurse_dir / "todo", "w") as calcurse_todof:
-            for cl in calcurse_todos:
-                calcurse_todof.write("{}\n".format(cl.line))
+        snapshot = TodoSnapshot(self.snapshot_path)
+        snapshot.set_todo_file(todo_file)
+        # read in todo.txt items, and convert to calcurse format
+        with self.metrics.timer("read"):
+            buf = todo_file.read_text()
+        calcurse_lines: List[str] = []
+        base: Base = {}
+        with self.metrics.timer("convert"):
+            for line, todo in parse_todotxt(buf):
+                calcurse_lines.append(todo.calcurse_line)
+                # save what was loaded into calcurse, for post_save to diff against
+                base.setdefault(todo_key(todo.description), (line, todo.line))
+        self.metrics.count("todos", len(calcurse_lines))
+        # write to calcurse file, if anything changed
+        with self.metrics.timer("write"):
+            text = "".join("{}\n".format(cl) for cl in calcurse_lines)
+            if write_if_changed(self.config.calcurse_dir / "todo", text):
+                self.metrics.count("bytes_written", len(text.encode()))
+            snapshot.base = base
+            snapshot.save()
 
     def post_save(self) -> None:
         """
-        After calcurse has saved, read the calcurse todo file, and compare that with my todo.txt file
-        If there are any items in calcurse that I added that aren't in my todo.txt, add it to my todo.txt file
+        After calcurse has saved, read the calcurse todo file, and compare that with the snapshot
+        of my todo.txt file saved in pre_load. Any todos added, removed, completed or with changed
+        priorities in calcurse are applied to my todo.txt file, unless that todo was also changed
+        in todo.txt since the snapshot
+
+        If there's no snapshot, any todos in calcurse that aren't in my todo.txt are added to it
         """
-        # read the calcurse todos
-        calcurse_todos: List[CalcurseTodo] = list(
-            self._read_calcurse_file(self.config.calcurse_dir / "todo")
-        )
         todo_file: Optional[Path] = self._find_todo_file()
         if todo_file is None:
             self.logger.warning("Could not find todo.txt file in expected locations")
             return
-        # read in todo.txt items, save a set of the text descriptions, so we can compare
-        # to the newly saved calcurse todos.
-        todos: List[TodoTxtTodo] = list(self._read_todotxt_file(todo_file))
-        todo_text: Set[str] = set(map(lambda t: t.text, todos))
-        # convert the calcurse todos to todotxt todos, so we can see if any were added
-        converted_todos: List[TodoTxtTodo] = list(
-            map(lambda t: t.convert(), calcurse_todos)
-        )
-        new_todos = [c for c in converted_todos if c.text not in todo_text]
-        # write back to todo.txt file, if there are any new todos
-        if new_todos:
-            todos.extend(new_todos)
-            with open(todo_file, "w") as todotxt_f:
-                for td in todos:
-                    todotxt_f.write("{}\n".format(td.line))
+        # read the calcurse todos, converted to todotxt lines
+        ours: Dict[str, str] = {}
+        with self.metrics.timer("read"):
+            for ct in parse_calcurse((self.config.calcurse_dir / "todo").read_text()):
+                td = ct.convert()
+                ours.setdefault(todo_key(td.description), td.line)
+            snapshot = TodoSnapshot.load(self.snapshot_path, todo_file)
+        if snapshot is None:
+            snapshot = TodoSnapshot(self.snapshot_path)
+        changes = diff(snapshot.base, ours)
+        self.metrics.count("todos", len(ours))
+        self.metrics.count("changes", len(changes))
+        if not changes:
+            return
+
+        base: Base
+        if snapshot.todo_file_unchanged() and all(
+            new is not None and snapshot.base.get(key, (None, None))[0] is None
+            for key, new in changes.items()
+        ):
+            # todo.txt hasn't changed since the snapshot, and todos were only
+            # added in calcurse, so they can be appended without reading todo.txt
+            appended = [new for new in changes.values() if new is not None]
+            with self.metrics.timer("write"):
+                append_lines(todo_file, appended)
+            self.metrics.count("appended", len(appended))
+            base = dict(snapshot.base)
+            for key, new in changes.items():
+                base[key] = (new, new)
+        else:
+            lines: List[str] = []
+            keys: List[str] = []
+            with self.metrics.timer("merge"):
+                for line, todo in parse_todotxt(todo_file.read_text()):
+                    lines.append(line)
+                    keys.append(todo_key(todo.description))
+                result = merge(lines, keys, snapshot.base, changes)
+            for key in result.conflicts:
+                self.logger.warning(
+                    f"'{key}' was changed in calcurse and todo.txt, keeping the todo.txt version"
+                )
+            self.metrics.count("conflicts", len(result.conflicts))
+            self.metrics.count("appended", len(result.appended))
+            with self.metrics.timer("write"):
+                if result.modified:
+                    write_if_changed(
+                        todo_file, "".join("{}\n".format(line) for line in result.lines)
+                    )
+                elif result.appended:
+                    append_lines(todo_file, result.appended)
+            base = {}
+            for key, line in zip(result.keys, result.lines):
+                base.setdefault(key, (line, None))
+            for key, line in ours.items():
+                base[key] = (base.get(key, (None, None))[0], line)
+        snapshot.base = base
+        snapshot.set_todo_file(todo_file)
+        snapshot.save()
 
     @staticmethod
-    @lru_cache(1)
     def _find_todo_file() -> Optional[Path]:
         """
+        Not cached, so long-running processes (the daemon, --watch) find a
+        todo.txt which was created or moved after they started
+
         Resolution order:
             - $TODOTXT_FILE
             - $TODO_DIR/todo.txt
@@ -177,13 +422,3 @@ class todotxt_ext(Extension):
                 if os.path.exists(path_str):
                     return Path(path_str)
         return None
-
-    @staticmethod
-    def _read_todotxt_file(path: Path) -> Iterator["TodoTxtTodo"]:
-        for line in yield_lines(path):
-            yield TodoTxtTodo.parse_line(line)
-
-    @staticmethod
-    def _read_calcurse_file(path: Path) -> Iterator["CalcurseTodo"]:
-        for line in yield_lines(path):
-            yield CalcurseTodo.parse_line(line)
@@ -1,5 +1,37 @@
+import os
+import json
+import mmap
+import stat
+import hashlib
+import tempfile
 from pathlib import Path
-from typing import Iterator
+from itertools import islice
+from typing import (
+    Iterable,
+    Iterator,
+    Any,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 def yield_lines(path: Path) -> Iterator[str]:
@@ -9,3 +41,244 @@ def yield_lines(path: Path) -> Iterator[str]:
             lstr = line.strip()
             if len(lstr) > 0:
                 yield lstr
+
+
+def _decode_lines(view: memoryview, into: List[str]) -> None:
+    for line in str(view, "utf-8").splitlines():
+        lstr = line.strip()
+        if len(lstr) > 0:
+            into.append(lstr)
+
+
+def read_lines_without_suffix(path: Path, suffix: bytes) -> Tuple[List[str], str]:
+    """
+    Returns the non empty (stripped) lines from a file which don't end
+    with suffix, and the SHA1 of the entire file
+
+    This memory maps the file and searches for the suffix at the bytes level,
+    so lines ending with the suffix are never decoded, and runs of other lines
+    are decoded together instead of line by line
+
+    >>> import tempfile
+    >>> d = Path(tempfile.mkdtemp())
+    >>> _ = (d / "apts").write_bytes(b"a\\nb [gcal]\\n\\n [gcal] c \\nd [gcal]  \\ne")
+    >>> read_lines_without_suffix(d / "apts", b"[gcal]")[0]
+    ['a', '[gcal] c', 'e']
+    >>> _ = (d / "empty").write_bytes(b"")
+    >>> read_lines_without_suffix(d / "empty", b"[gcal]")
+    ([], 'da39a3ee5e6b4b0d3255bfef95601890afd80709')
+    """
+    kept: List[str] = []
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return kept, hashlib.sha1(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sha1 = hashlib.sha1(mm).hexdigest()
+            view = memoryview(mm)
+            try:
+                # start of the current run of lines to keep
+                region = 0
+                size = len(mm)
+                find, rfind = mm.find, mm.rfind
+                pos = find(suffix)
+                while pos != -1:
+                    after = pos + len(suffix)
+                    # only a match if the suffix is at the end of the line
+                    if after < size and mm[after] == 10:
+                        line_end = after
+                    else:
+                        line_end = find(b"\n", after)
+                        if line_end == -1:
+                            line_end = size
+                        if view[after:line_end].tobytes().strip():
+                            pos = find(suffix, after)
+                            continue
+                    line_start = rfind(b"\n", region, pos) + 1 or region
+                    if line_start > region:
+                        _decode_lines(view[region:line_start], kept)
+                    region = line_end + 1
+                    pos = find(suffix, region)
+                _decode_lines(view[region:], kept)
+            finally:
+                view.release()
+    return kept, sha1
+
+
+def _has_contents(path: Path, data: bytes, chunk_size: int = 1 << 16) -> bool:
+    """Check if the file at path contains exactly 'data', comparing in chunks"""
+    view = memoryview(data)
+    with path.open("rb") as f:
+        for offset in range(0, len(data), chunk_size):
+            if f.read(chunk_size) != view[offset : offset + chunk_size]:
+                return False
+        return f.read(1) == b""
+
+
+def write_if_changed(path: Path, text: str) -> bool:
+    """
+    Write text to path, unless the file already has the same contents
+
+    The file is written to a temporary file in the same directory, synced
+    and then renamed over the original, so readers (i.e. calcurse) never see
+    a partially written file, even if this is killed. If path is a symlink,
+    the file it points to is replaced
+
+    Returns True if the file was written
+
+    >>> import tempfile
+    >>> d = Path(tempfile.mkdtemp())
+    >>> write_if_changed(d / "f", "a\\n"), write_if_changed(d / "f", "a\\n"), write_if_changed(d / "f", "b\\n")
+    (True, False, True)
+    >>> (d / "f").read_text()
+    'b\\n'
+    """
+    target = Path(os.path.realpath(path))
+    data = text.encode()
+    try:
+        st = target.stat()
+    except FileNotFoundError:
+        mode = 0o644
+    else:
+        if st.st_size == len(data) and _has_contents(target, data):
+            return False
+        mode = stat.S_IMODE(st.st_mode)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+def append_lines(path: Path, lines: List[str]) -> None:
+    """
+    Append lines to the end of a file in place, adding a
+    newline first if the file doesn't end with one
+
+    >>> import tempfile
+    >>> d = Path(tempfile.mkdtemp())
+    >>> _ = (d / "f").write_text("a")
+    >>> append_lines(d / "f", ["b", "c"])
+    >>> (d / "f").read_text()
+    'a\\nb\\nc\\n'
+    """
+    with open(path, "ab+") as f:
+        prefix = b""
+        if os.fstat(f.fileno()).st_size > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                prefix = b"\n"
+        f.write(prefix + "".join(f"{line}\n" for line in lines).encode())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _skip_whitespace(buf: str, pos: int) -> int:
+    while pos < len(buf) and buf[pos].isspace():
+        pos += 1
+    return pos
+
+
+def iter_json_array_raw(
+    fp: TextIO, chunk_size: int = 1 << 16
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Incrementally parse a top-level JSON array, yielding the text and the
+    value of each item as soon as it has been read, instead of loading the entire file
+
+    >>> import io
+    >>> list(iter_json_array_raw(io.StringIO('[{"a": 1}, {"b": [2, 3]}, 45]'), chunk_size=4))
+    [('{"a": 1}', {'a': 1}), ('{"b": [2, 3]}', {'b': [2, 3]}), ('45', 45)]
+    >>> list(iter_json_array_raw(io.StringIO(' [ ] ')))
+    []
+    """
+    decoder = json.JSONDecoder()
+    buf = fp.read(chunk_size)
+    eof = len(buf) == 0
+    pos = _skip_whitespace(buf, 0)
+    if pos >= len(buf) or buf[pos] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    while True:
+        pos = _skip_whitespace(buf, pos)
+        # need more data to decode the next item
+        if pos >= len(buf) and not eof:
+            chunk = fp.read(chunk_size)
+            eof = len(chunk) == 0
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+            nxt = _skip_whitespace(buf, end)
+        except json.JSONDecodeError:
+            nxt = len(buf)
+        # if this failed, or the item isn't followed by a delimiter (e.g. a
+        # number that continues in the next chunk), read more and retry
+        if nxt >= len(buf) or buf[nxt] not in ",]":
+            if eof:
+                raise ValueError("Invalid or truncated JSON array")
+            chunk = fp.read(chunk_size)
+            eof = len(chunk) == 0
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        yield buf[pos:end], item
+        pos = nxt + 1 if buf[nxt] == "," else nxt
+
+
+def iter_json_array(fp: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    >>> import io
+    >>> list(iter_json_array(io.StringIO('[{"a": 1}, {"b": [2, 3]}, 45]'), chunk_size=4))
+    [{'a': 1}, {'b': [2, 3]}, 45]
+    """
+    for _, item in iter_json_array_raw(fp, chunk_size):
+        yield item
+
+
+def yield_json_raw(path: Union[str, Path]) -> Iterator[Tuple[str, Optional[Any]]]:
+    """
+    Stream the text of each item from a file which is either a JSON array,
+    or newline-delimited JSON (one item per line)
+
+    Items in an array have to be decoded to find where they end, so those are
+    yielded with their value; lines in newline-delimited JSON are yielded
+    with None, so they're only decoded if the caller needs the value
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as f:
+    ...     _ = f.write('{"a": 1}\\n\\n{"b": 2}\\n')
+    ...     f.flush()
+    ...     list(yield_json_raw(f.name))
+    [('{"a": 1}', None), ('{"b": 2}', None)]
+    """
+    with open(path, "r") as f:
+        first = ""
+        while first == "" or first.isspace():
+            first = f.read(1)
+            if first == "":
+                return
+        f.seek(0)
+        if first == "[":
+            yield from iter_json_array_raw(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line, None
+
+
+def yield_json(path: Union[str, Path]) -> Iterator[Any]:
+    """
+    Stream items from a file which is either a JSON array, or
+    newline-delimited JSON (one item per line)
+    """
+    for text, item in yield_json_raw(path):
+        yield json.loads(text) if item is None else item
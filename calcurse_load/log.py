@@ -4,21 +4,33 @@ from tempfile import gettempdir
 
 from typing import Optional
 
-from logzero import setup_logger  # type: ignore[import]
-
 DEFAULT_LEVEL = logging.INFO
 
 logpath = os.path.join(gettempdir(), "calcurse_load.log")
 
+# the handlers for this are set up lazily by get_logger/setup, so
+# importing this doesn't import logzero or open the log file
+logger = logging.getLogger(__package__)
+
+_configured = False
+
 
 # logzero handles adding handling/modifying levels fine
 # can be imported/configured multiple times
 def setup(level: Optional[int] = None) -> logging.Logger:
+    global _configured
+    from logzero import setup_logger  # type: ignore[import]
+
     chosen_level = level or int(os.environ.get("CALCURSE_LOAD_LOGS", DEFAULT_LEVEL))
     lgr: logging.Logger = setup_logger(
         name=__package__, level=chosen_level, disableStderrLogger=True, logfile=logpath
     )
+    _configured = True
     return lgr
 
 
-logger = setup()
+def get_logger() -> logging.Logger:
+    """Returns the logger, setting it up the first time this is called"""
+    if not _configured:
+        setup()
+    return logger
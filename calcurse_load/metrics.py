@@ -0,0 +1,226 @@
+"""
+Timers and counters for the extensions, and a history of runs
+
+If $CALCURSE_LOAD_METRICS is set, each pre-load/post-save run (see
+Extension.run) appends a line to $CALCURSE_LOAD_DIR/metrics.jsonl, with how long it took, the time spent in
+each step the extension timed (e.g. read/convert/write) and any counters
+it recorded (e.g. events, notes written, bytes written). 'calcurse_load --stats'
+summarizes the history
+
+If $CALCURSE_LOAD_PROFILE is set to a directory, each run is also profiled
+with cProfile, and the stats are written to that directory
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, TYPE_CHECKING
+
+from .log import get_logger
+
+if TYPE_CHECKING:
+    from .ext.abstract import Extension
+
+Json = Dict[str, Any]
+
+METRICS_FILE = "metrics.jsonl"
+PROFILE_ENV = "CALCURSE_LOAD_PROFILE"
+# the history is only recorded if this is set, the hooks block calcurse starting
+METRICS_ENV = "CALCURSE_LOAD_METRICS"
+
+# once the history is larger than this, the oldest half is removed
+MAX_BYTES = 512 * 1024
+
+
+class Metrics:
+    """
+    >>> m = Metrics()
+    >>> with m.timer("read"):
+    ...     pass
+    >>> m.count("events", 5)
+    >>> m.count("events")
+    >>> list(m.timers), m.counters
+    (['read'], {'events': 6})
+    """
+
+    def __init__(self) -> None:
+        # step name -> seconds
+        self.timers: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Time a step, if a step is timed more than once, the times are added"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timers[name] = self.timers.get(name, 0.0) + elapsed
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self) -> None:
+        self.timers.clear()
+        self.counters.clear()
+
+
+_lock = threading.Lock()
+
+
+def append_record(path: Path, record: Json, max_bytes: int = MAX_BYTES) -> None:
+    """
+    Append a record to the history, removing the oldest half of
+    the records if the file is larger than max_bytes. Failing to write
+    it (e.g. a full or read-only disk) is ignored, so it never fails a hook
+
+    >>> import tempfile
+    >>> p = Path(tempfile.mkdtemp()) / METRICS_FILE
+    >>> for i in range(10):
+    ...     append_record(p, {"i": i}, max_bytes=50)
+    >>> [r["i"] for r in read_records(p)]
+    [6, 7, 8, 9]
+    >>> append_record(p.parent / "missing" / METRICS_FILE, {"i": 10})
+    """
+    line = json.dumps(record) + "\n"
+    with _lock:
+        try:
+            with open(path, "a") as f:
+                f.write(line)
+                size = f.tell()
+            if size > max_bytes:
+                with open(path) as f:
+                    lines = f.readlines()
+                tmp = path.with_name(path.name + ".tmp")
+                with open(tmp, "w") as f:
+                    f.writelines(lines[len(lines) // 2 :])
+                os.replace(tmp, path)
+        except OSError as e:
+            get_logger().debug(f"Could not write metrics to {path}: {e}")
+
+
+def read_records(path: Path) -> Iterator[Json]:
+    """Read the history, skipping any corrupt lines"""
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    yield record
+    except FileNotFoundError:
+        return
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def summarize(records: Iterable[Json]) -> str:
+    """
+    Aggregate the history for each extension/phase
+
+    >>> print(summarize([
+    ...     {"extension": "gcal_ext", "phase": "pre-load", "ok": True, "total": 0.5,
+    ...      "timers": {"read": 0.2}, "counters": {"events": 10}},
+    ...     {"extension": "gcal_ext", "phase": "pre-load", "ok": False, "total": 1.5,
+    ...      "timers": {"read": 0.4}, "counters": {"events": 20}},
+    ... ]))
+    gcal_ext pre-load: 2 runs, 1 failed
+      total                 median     1000.0ms  max     1500.0ms
+      read                  median      300.0ms  max      400.0ms
+      events                mean         15.0    max         20
+    """
+    groups: Dict[str, List[Json]] = {}
+    for record in records:
+        key = f"{record.get('extension')} {record.get('phase')}"
+        groups.setdefault(key, []).append(record)
+    if not groups:
+        return "No runs recorded"
+    out: List[str] = []
+    for key, runs in groups.items():
+        failed = sum(1 for r in runs if not r.get("ok"))
+        out.append(f"{key}: {len(runs)} runs, {failed} failed")
+        timers: Dict[str, List[float]] = {"total": [r.get("total", 0.0) for r in runs]}
+        counters: Dict[str, List[int]] = {}
+        for r in runs:
+            for name, secs in r.get("timers", {}).items():
+                timers.setdefault(name, []).append(secs)
+            for name, n in r.get("counters", {}).items():
+                counters.setdefault(name, []).append(n)
+        for name, times in timers.items():
+            out.append(
+                f"  {name:<20}  median {_median(times) * 1000:>10.1f}ms  max {max(times) * 1000:>10.1f}ms"
+            )
+        for name, counts in counters.items():
+            out.append(
+                f"  {name:<20}  mean   {sum(counts) / len(counts):>10.1f}    max {max(counts):>10}"
+            )
+    return "\n".join(out)
+
+
+def run_phase(ext: "Extension", phase: str) -> None:
+    """
+    Run the pre-load/post-save action (or a staged pre-load) for the extension,
+    and if METRICS_ENV is set, append how long it took and its timers/counters to the history
+    """
+    funcs = {
+        "pre-load": ext.pre_load_or_swap,
+        "post-save": ext.post_save,
+        # building pre-load in the background, see calcurse_load.staging
+        "stage": ext.pre_load,
+    }
+    assert phase in funcs, f"Unknown phase {phase}"
+    func = funcs[phase]
+    name = type(ext).__name__
+    ext.metrics.reset()
+
+    profiler = None
+    profile_dir = os.environ.get(PROFILE_ENV, "")
+    if profile_dir:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active (another extension in a different thread)
+            get_logger().warning(f"Could not profile {name}, already profiling")
+            profiler = None
+
+    started = time.time()
+    start = time.perf_counter()
+    ok = False
+    try:
+        func()
+        ok = True
+    finally:
+        total = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+            profiler.dump_stats(
+                os.path.join(profile_dir, f"{name}-{phase}-{stamp}.prof")
+            )
+        if os.environ.get(METRICS_ENV):
+            record = {
+                "time": round(started, 3),
+                "extension": name,
+                "phase": phase,
+                "ok": ok,
+                "total": round(total, 6),
+                "timers": {k: round(v, 6) for k, v in ext.metrics.timers.items()},
+                "counters": dict(ext.metrics.counters),
+            }
+            append_record(ext.config.calcurse_load_dir / METRICS_FILE, record)
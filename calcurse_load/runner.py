@@ -0,0 +1,138 @@
+"""
+Runs extensions concurrently, serialising extensions which modify the same files
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TYPE_CHECKING,
+)
+
+from .ext.abstract import Extension
+from .ext.all import enabled_extension_names
+from .log import get_logger
+
+if TYPE_CHECKING:
+    from .calcurse import Configuration
+
+Json = Dict[str, Any]
+
+ExtensionLoader = Callable[[str], Extension]
+
+PHASES = ("pre-load", "post-save")
+
+
+def conflict_groups(extensions: Sequence[Extension]) -> List[List[Extension]]:
+    """
+    Split the extensions into groups which can run concurrently. Extensions
+    in the same group modify some of the same files, so run in the order given
+
+    >>> class A(Extension):
+    ...     pre_load = post_save = lambda self: None
+    >>> class Apts(A): files = frozenset({"apts", "notes"})
+    >>> class Todo(A): files = frozenset({"todo"})
+    >>> class Notes(A): files = frozenset({"notes"})
+    >>> class Unknown(A): pass
+    >>> names = lambda groups: [[e.__class__.__name__ for e in g] for g in groups]
+    >>> names(conflict_groups([Apts(None), Todo(None), Notes(None)]))
+    [['Apts', 'Notes'], ['Todo']]
+    >>> names(conflict_groups([Apts(None), Todo(None), Unknown(None)]))
+    [['Apts', 'Todo', 'Unknown']]
+    """
+    # each group is (files modified, None if unknown; indices of extensions)
+    groups: List[List[int]] = []
+    group_files: List[Optional[Set[str]]] = []
+    for i, ext in enumerate(extensions):
+        files: Optional[Set[str]] = None if ext.files is None else set(ext.files)
+        members = [i]
+        keep_groups: List[List[int]] = []
+        keep_files: List[Optional[Set[str]]] = []
+        for gmembers, gfiles in zip(groups, group_files):
+            if files is None or gfiles is None or files & gfiles:
+                members.extend(gmembers)
+                files = None if files is None or gfiles is None else files | gfiles
+            else:
+                keep_groups.append(gmembers)
+                keep_files.append(gfiles)
+        groups = keep_groups + [sorted(members)]
+        group_files = keep_files + [files]
+    groups.sort(key=lambda g: g[0])
+    return [[extensions[i] for i in g] for g in groups]
+
+
+def _run_group(group: List[Extension], phase: str) -> None:
+    for ext in group:
+        ext.run(phase)
+
+
+def run_concurrently(extensions: Sequence[Extension], phase: str) -> None:
+    """
+    Run the pre-load/post-save action ('phase') for each extension,
+    running independent extensions in separate threads. If any
+    fail, the first exception is re-raised once all have finished
+    """
+    assert phase in PHASES, f"Unknown phase {phase}"
+    groups = conflict_groups(extensions)
+    if len(groups) <= 1:
+        for group in groups:
+            _run_group(group, phase)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        futures = [pool.submit(_run_group, group, phase) for group in groups]
+    for future in futures:
+        future.result()
+
+
+def run_enabled(
+    config: "Configuration", load_extension: ExtensionLoader, phase: str
+) -> None:
+    """Run the pre-load/post-save action for all enabled extensions"""
+    names = enabled_extension_names(config)
+    run_concurrently([load_extension(name) for name in names], phase)
+
+
+@contextmanager
+def _on_path(cwd: str) -> Iterator[None]:
+    """Add the client's directory to the path, so relative custom extensions can be imported"""
+    sys.path.insert(0, cwd)
+    try:
+        yield
+    finally:
+        sys.path.remove(cwd)
+
+
+def run_request(request: Json, load_extension: ExtensionLoader) -> Json:
+    """
+    Run a request from the client/daemon, like:
+        {"pre_load": ["gcal"], "post_save": [], "all_enabled": null, "cwd": "..."}
+    and return {"ok": true} or {"ok": false, "error": "..."}
+    """
+    try:
+        with _on_path(request.get("cwd") or os.getcwd()):
+            pre_load: List[Extension] = [load_extension(n) for n in request["pre_load"]]
+            post_save: List[Extension] = [
+                load_extension(n) for n in request["post_save"]
+            ]
+            for ext in pre_load:
+                ext.run("pre-load")
+            for ext in post_save:
+                ext.run("post-save")
+            if request.get("all_enabled") is not None:
+                from .calcurse import get_configuration
+
+                run_enabled(get_configuration(), load_extension, request["all_enabled"])
+    except Exception as e:
+        get_logger().exception(f"Error running request {request}")
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {"ok": True}
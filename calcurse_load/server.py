@@ -0,0 +1,125 @@
+"""
+A long-running daemon which runs the extensions for the hooks, so each hook
+doesn't have to start a new python process and re-import everything
+
+Requests are a single line of JSON, like:
+    {"pre_load": ["gcal", "todotxt"], "post_save": [], "all_enabled": null, "cwd": "...", "env": {...}}
+and the response is {"ok": true} or {"ok": false, "error": "..."}. The
+request is run with the client's environment (see client.request_env)
+"""
+
+import os
+import json
+import time
+import signal
+import socket
+import threading
+import socketserver
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .client import request_env, socket_path, send_request
+from .ext.all import forget_loaded
+from .log import get_logger
+from .runner import ExtensionLoader, run_request
+
+Json = Dict[str, Any]
+
+
+@contextmanager
+def _client_env(env: Optional[Dict[str, str]]) -> Iterator[None]:
+    """
+    Replace the variables the client sends (see client.request_env)
+    with the client's while running its request
+
+    >>> os.environ["CALCURSE_LOAD_A"] = "daemon"
+    >>> with _client_env({"CALCURSE_LOAD_A": "client", "CALCURSE_LOAD_B": "client"}):
+    ...     os.environ["CALCURSE_LOAD_A"], os.environ["CALCURSE_LOAD_B"]
+    ('client', 'client')
+    >>> os.environ.pop("CALCURSE_LOAD_A"), "CALCURSE_LOAD_B" in os.environ
+    ('daemon', False)
+    """
+    if env is None:
+        yield
+        return
+    saved = request_env(os.environ)
+    _replace_env(saved, env)
+    try:
+        yield
+    finally:
+        _replace_env(env, saved)
+
+
+def _replace_env(old: Dict[str, str], new: Dict[str, str]) -> None:
+    for k in old.keys() - new.keys():
+        del os.environ[k]
+    os.environ.update(new)
+    if old.get("TZ") != new.get("TZ"):
+        time.tzset()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "Server"
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response: Json = {"ok": False, "error": f"Invalid request: {e}"}
+        else:
+            # calcurse runs one hook at a time anyways, but run requests
+            # serially in case multiple calcurse instances are open
+            with self.server.lock, _client_env(request.get("env")):
+                # the configuration/todo.txt may have changed since the last request
+                forget_loaded()
+                response = run_request(request, self.server.load_extension)
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, load_extension: ExtensionLoader) -> None:
+        self.load_extension = load_extension
+        self.lock = threading.Lock()
+        super().__init__(path, _Handler)
+
+
+def _remove_stale_socket(path: str) -> None:
+    if not os.path.exists(path):
+        return
+    try:
+        send_request({"pre_load": [], "post_save": []}, path=path)
+    except socket.timeout:
+        raise RuntimeError(f"calcurse_load daemon at {path} isn't responding")
+    except OSError:
+        os.unlink(path)
+    else:
+        raise RuntimeError(f"calcurse_load daemon is already running at {path}")
+
+
+def serve(load_extension: ExtensionLoader, path: str = "") -> None:
+    path = path or socket_path()
+    _remove_stale_socket(path)
+    old_umask = os.umask(0o077)
+    try:
+        server = Server(path, load_extension)
+    finally:
+        os.umask(old_umask)
+
+    def _shutdown(signum: int, frame: Any) -> None:
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    get_logger().info(f"Listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
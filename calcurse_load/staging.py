@@ -0,0 +1,313 @@
+"""
+Builds the output of pre-load in the background, so the pre-load hook only has to swap it in
+
+'calcurse_load --watch' polls the inputs of each extension (see
+Extension.input_keys: e.g. the gcal JSON exports, the todo.txt file and the
+calcurse files), and when any change, runs its pre-load into a staging
+directory ($CALCURSE_LOAD_DIR/staging/<extension>), against copies of the
+calcurse files and the extension's state files. Notes are named by their
+hash, so they're written to the calcurse notes directory directly
+
+When the pre-load hook runs, if the inputs are the same as when the staged
+output was built, the staged files are renamed over the calcurse files and
+state files, else pre-load runs as usual. Nothing calcurse or post-save reads
+is replaced until then, so this is safe to run while calcurse is open
+
+>>> import tempfile
+>>> from .calcurse import Configuration
+>>> root = Path(tempfile.mkdtemp())
+>>> class upper_ext(Extension):
+...     files = frozenset({"todo"})
+...     def input_keys(self):
+...         return {"input": stat_key(root / "input")}
+...     def pre_load(self):
+...         (self.config.calcurse_dir / "todo").write_text((root / "input").read_text().upper())
+...     def post_save(self):
+...         pass
+>>> (root / "calcurse").mkdir()
+>>> _ = (root / "input").write_text("[0] a todo\\n")
+>>> ext = upper_ext(Configuration(root / "calcurse", root / "calcurse_load", root / "hooks"))
+>>> stage(ext)["files"], (root / "calcurse" / "todo").exists()
+(['todo'], False)
+>>> swap_staged(ext), (root / "calcurse" / "todo").read_text()
+(True, '[0] A TODO\\n')
+>>> swap_staged(ext)  # nothing staged
+False
+>>> _ = stage(ext)
+>>> _ = (root / "input").write_text("[0] another todo\\n")
+>>> swap_staged(ext)  # staged from an older todo
+False
+"""
+
+import os
+import json
+import time
+import errno
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+
+from .ext.abstract import Extension
+from .ext.manifest import stat_key
+from .log import get_logger
+
+Json = Dict[str, Any]
+
+STAGING_DIR = "staging"
+RECORD_FILE = "staged.json"
+
+# how often 'calcurse_load --watch' checks the inputs, in seconds
+INTERVAL_ENV = "CALCURSE_LOAD_WATCH_INTERVAL"
+DEFAULT_INTERVAL = 2.0
+
+# copied into the staging directory for each build, pre-load reads these
+# (e.g. gcal keeps the non-gcal appointments, and the notes the todos use)
+CALCURSE_FILES = ("apts", "todo")
+
+
+def watch_interval() -> float:
+    """
+    >>> os.environ[INTERVAL_ENV] = "0.5"
+    >>> watch_interval()
+    0.5
+    >>> del os.environ[INTERVAL_ENV]
+    >>> watch_interval()
+    2.0
+    """
+    try:
+        interval = float(os.environ[INTERVAL_ENV])
+    except (KeyError, ValueError):
+        return DEFAULT_INTERVAL
+    return interval if interval > 0 else DEFAULT_INTERVAL
+
+
+def staging_dir(ext: Extension) -> Path:
+    return ext.config.calcurse_load_dir / STAGING_DIR / type(ext).__name__
+
+
+def input_keys(ext: Extension) -> Json:
+    """The extension's input keys, as they compare after being saved as JSON"""
+    keys: Json = json.loads(json.dumps(ext.input_keys()))
+    return keys
+
+
+def _read_record(root: Path) -> Optional[Json]:
+    try:
+        record = json.loads((root / RECORD_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+    return record if isinstance(record, dict) else None
+
+
+@contextmanager
+def _locked(root: Path, blocking: bool) -> Iterator[bool]:
+    """Lock the staging directory, yields False if not blocking and it's already locked"""
+    import fcntl
+
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / "lock", "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    # the files in state directories (e.g. the gcal event cache) are only
+    # ever replaced by renaming over them, so a hard link is as good as a copy
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _copy(src: Path, dst: Path) -> None:
+    """
+    Copy src (a file or directory) to dst keeping its modification
+    time, or remove dst if src doesn't exist
+    """
+    if src.is_dir():
+        _remove(dst)
+        shutil.copytree(src, dst, copy_function=_link_or_copy)
+        return
+    try:
+        shutil.copy2(src, dst)
+    except FileNotFoundError:
+        _remove(dst)
+
+
+def _move_dir(src: Path, dst: Path) -> None:
+    """
+    Replace the directory dst with src
+
+    >>> import tempfile
+    >>> root = Path(tempfile.mkdtemp())
+    >>> for d, name in (("live", "old"), ("staged", "new")):
+    ...     (root / d).mkdir()
+    ...     _ = (root / d / name).write_text(name)
+    >>> _move_dir(root / "staged", root / "live")
+    >>> sorted(p.name for p in root.iterdir()), os.listdir(root / "live")
+    (['live'], ['new'])
+    """
+    old = dst.with_name(f".{dst.name}.old")
+    _remove(old)
+    if dst.exists():
+        os.rename(dst, old)
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            if old.exists():
+                os.rename(old, dst)
+            raise
+        # the staging directory is on a different filesystem
+        shutil.copytree(src, dst)
+        shutil.rmtree(src)
+    _remove(old)
+
+
+def _move(src: Path, dst: Path) -> None:
+    """Rename src over dst (or the file dst links to)"""
+    if src.is_dir():
+        _move_dir(src, dst)
+        return
+    target = Path(os.path.realpath(dst))
+    try:
+        os.replace(src, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # the staging directory is on a different filesystem
+        tmp = target.with_name(f".{target.name}.staged")
+        shutil.copy2(src, tmp)
+        os.replace(tmp, target)
+        os.unlink(src)
+
+
+def stage(ext: Extension) -> Json:
+    """
+    Run the extension's pre-load in its staging directory, returns the record of
+    the inputs it was built from and the calcurse files it changed
+    """
+    assert ext.files is not None, f"{ext} could modify any file, so can't be staged"
+    root = staging_dir(ext)
+    calcurse_dir, state_dir = root / "calcurse", root / "state"
+    with _locked(root, blocking=True):
+        # before copying, so if anything changes while building, it's not swapped in
+        inputs = input_keys(ext)
+        try:
+            (root / RECORD_FILE).unlink()
+        except FileNotFoundError:
+            pass
+        calcurse_dir.mkdir(exist_ok=True)
+        state_dir.mkdir(exist_ok=True)
+        notes = calcurse_dir / "notes"
+        if "notes" in ext.files and not notes.is_symlink():
+            live_notes = ext.config.calcurse_dir / "notes"
+            live_notes.mkdir(parents=True, exist_ok=True)
+            notes.symlink_to(os.path.abspath(live_notes))
+        for name in CALCURSE_FILES:
+            _copy(ext.config.calcurse_dir / name, calcurse_dir / name)
+        for name in ext.state_files:
+            _copy(ext.state_dir / name, state_dir / name)
+        outputs = sorted(name for name in ext.files if name != "notes")
+        before = {name: stat_key(calcurse_dir / name) for name in outputs}
+
+        staged = type(ext)(config=ext.config._replace(calcurse_dir=calcurse_dir))
+        staged.staged_state_dir = state_dir
+        staged.live_calcurse_dir = ext.config.calcurse_dir
+        staged.run("stage")
+
+        record: Json = {
+            "inputs": inputs,
+            "files": [n for n in outputs if stat_key(calcurse_dir / n) != before[n]],
+        }
+        tmp = root / f"{RECORD_FILE}.tmp"
+        tmp.write_text(json.dumps(record))
+        os.replace(tmp, root / RECORD_FILE)
+    return record
+
+
+def swap_staged(ext: Extension) -> bool:
+    """
+    If there's a staged build for the extension and its inputs haven't changed
+    since, rename the staged files into place. Returns whether they were swapped in
+    """
+    root = staging_dir(ext)
+    if ext.files is None or not (root / RECORD_FILE).exists():
+        return False
+    with _locked(root, blocking=False) as locked:
+        # if the watcher is building, pre-load is probably faster than waiting
+        if not locked:
+            return False
+        record = _read_record(root)
+        if record is None or record.get("inputs") != input_keys(ext):
+            return False
+        for name in record["files"]:
+            _move(root / "calcurse" / name, ext.config.calcurse_dir / name)
+        for name in ext.state_files:
+            if (root / "state" / name).exists():
+                _move(root / "state" / name, ext.state_dir / name)
+        (root / RECORD_FILE).unlink()
+    return True
+
+
+def watch(
+    extensions: Sequence[Extension],
+    interval: float,
+    iterations: Optional[int] = None,
+) -> None:
+    """
+    Check the inputs of each extension every interval seconds, and stage
+    a new build for any which changed. Runs forever, unless iterations is given
+    """
+    logger = get_logger()
+    stageable: List[Extension] = []
+    for ext in extensions:
+        if ext.files is None:
+            logger.warning(f"{ext} could modify any file, not staging it")
+        else:
+            stageable.append(ext)
+    # inputs of the last build, a restarted watcher doesn't rebuild what's already staged
+    built: Dict[str, Optional[Json]] = {}
+    for ext in stageable:
+        record = _read_record(staging_dir(ext))
+        built[type(ext).__name__] = None if record is None else record.get("inputs")
+    failed: Set[str] = set()
+    n = 0
+    while iterations is None or n < iterations:
+        if n:
+            time.sleep(interval)
+        n += 1
+        for ext in stageable:
+            name = type(ext).__name__
+            keys = input_keys(ext)
+            # rebuilt after being swapped in, even if the swap didn't change any inputs
+            staged = (staging_dir(ext) / RECORD_FILE).exists() or name in failed
+            if keys == built[name] and staged:
+                continue
+            logger.info(f"{name}: inputs changed, staging pre-load")
+            try:
+                built[name] = stage(ext)["inputs"]
+                failed.discard(name)
+            except Exception:
+                # don't retry until the inputs change again
+                logger.exception(f"{name}: staging pre-load failed")
+                built[name] = keys
+                failed.add(name)
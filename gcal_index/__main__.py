@@ -2,13 +2,40 @@ import sys
 import os
 import json
 import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from itertools import chain
-from typing import Iterator, Any, Dict, Optional, Union, List, TypedDict
+from typing import (
+    Iterator,
+    Any,
+    Dict,
+    Optional,
+    Union,
+    List,
+    NamedTuple,
+    Sequence,
+    TypedDict,
+)
 from datetime import date, timedelta, datetime
 
 from lxml import html  # type: ignore[import]
 from gcsa.event import Event, Attendee  # type: ignore[import]
 from gcsa.google_calendar import GoogleCalendar  # type: ignore[import]
+from gcsa.serializers.event_serializer import EventSerializer  # type: ignore[import]
+
+from .description_cache import DescriptionCache
+from .binary import BINARY_FORMAT, write_binary
+from .export import write_events, write_export
+from .sync import (
+    EVENT_LIST_FIELDS,
+    MAX_PAGE_SIZE,
+    SyncState,
+    api_list_page,
+    default_data_dir,
+    default_state_dir,
+    load_sync_state,
+    save_sync_state,
+    sync_events,
+)
 
 home = os.path.expanduser("~")
 
@@ -32,6 +59,12 @@ class GcalAppointmentData(TypedDict):
     recurrence: List[str]
     attendees: List[AttendeeDict]
     event_link: Any
+    # the timezone a recurring event repeats in (None for all-day events)
+    timezone: Optional[str]
+    # set on moved/cancelled occurrences of a recurring event (a cancelled
+    # occurrence has no start), and when it was originally scheduled
+    recurring_event_id: Optional[str]
+    original_start: Optional[int]
 
 
 ATTENDEE_KEYS = ["email", "response_status"]
@@ -56,10 +89,28 @@ def n_days(days: Union[int, str]) -> date:
     return date.today() + timedelta(days=int(days))
 
 
+# shared between threads when exporting multiple calendars,
+# main() sets the path to persist this between runs
+description_cache = DescriptionCache()
+
+
 def _parse_html_description(htmlstr: Optional[str]) -> Json:
-    data: Dict[str, Union[str, None, List[str]]] = {"text": None, "links": []}
+    """
+    >>> _parse_html_description("  no markup here ")
+    {'text': 'no markup here', 'links': []}
+    >>> _parse_html_description('see <a href="https://example.com">this</a>')
+    {'text': 'see\\nthis', 'links': ['https://example.com']}
+    """
     if htmlstr is None:
-        return data
+        return {"text": None, "links": []}
+    # fast path, plain text descriptions don't need to be parsed
+    if "<" not in htmlstr and "&" not in htmlstr and "\r" not in htmlstr:
+        return {"text": htmlstr.strip(), "links": []}
+    return description_cache.get(htmlstr, _parse_html)
+
+
+def _parse_html(htmlstr: str) -> Json:
+    data: Dict[str, Union[str, None, List[str]]] = {"text": None, "links": []}
     root: html.HtmlElement = html.fromstring(htmlstr)
     # filter all 'a' elements, get the link values, chain them together and remove items with no links
     data["links"] = list(
@@ -84,6 +135,27 @@ def _serialize_dateish(d: Optional[Union[date, datetime]]) -> Optional[int]:
         return int(datetime.combine(d, datetime.min.time()).timestamp())
 
 
+def _parse_original_start(data: Optional[Json]) -> Optional[int]:
+    """
+    >>> _parse_original_start({"dateTime": "2021-01-11T15:00:00Z"})
+    1610377200
+    >>> _parse_original_start({"date": "2021-01-11"}) == _serialize_dateish(date(2021, 1, 11))
+    True
+    >>> _parse_original_start(None) is None
+    True
+    """
+    if not data:
+        return None
+    if "dateTime" in data:
+        # fromisoformat doesn't accept a 'Z' suffix before python 3.11
+        return _serialize_dateish(
+            datetime.fromisoformat(data["dateTime"].replace("Z", "+00:00"))
+        )
+    if "date" in data:
+        return _serialize_dateish(date.fromisoformat(data["date"]))
+    return None
+
+
 def _parse_attendies(
     e: Union[Attendee, str, List[Attendee], List[str]]
 ) -> List[AttendeeDict]:
@@ -113,16 +185,116 @@ def event_to_dict(e: Event) -> GcalAppointmentData:
         "recurrence": e.recurrence,
         "attendees": _parse_attendies(e.attendees),
         "event_link": e.other.get("htmlLink"),
+        "timezone": e.timezone if isinstance(e.start, datetime) else None,
+        "recurring_event_id": e.recurring_event_id,
+        "original_start": _parse_original_start(e.other.get("originalStartTime")),
     }
 
 
 # get events from 1900 to now + args.end_days
 def get_events(cal: GoogleCalendar, end_days: int) -> Iterator[Event]:
-    yield from cal.get_events(date(1900, 1, 1), n_days(end_days))
+    # pages are requested as the events are consumed
+    yield from cal.get_events(
+        date(1900, 1, 1),
+        n_days(end_days),
+        fields=EVENT_LIST_FIELDS,
+        maxResults=MAX_PAGE_SIZE,
+    )
+
+
+def events_in_range(state: SyncState, end_days: int) -> List[GcalAppointmentData]:
+    """
+    Sync tokens can't be combined with a time range, so filter the
+    synced events to the same range as a non-incremental export
+    """
+    lower = _serialize_dateish(date(1900, 1, 1))
+    upper = _serialize_dateish(n_days(end_days))
+    assert lower is not None and upper is not None
+    return sorted(
+        (
+            e
+            for e in state["events"].values()
+            if e["start"] is None or lower <= e["start"] <= upper
+        ),
+        key=lambda e: e["start"] or 0,
+    )
+
+
+class ExportJob(NamedTuple):
+    email: str
+    calendar: str
+    credential_file: str
+
+
+def load_config(path: str, default_credential_file: str) -> List[ExportJob]:
+    """
+    Load the accounts/calendars to export from a JSON config file, like:
+
+    [{"email": "...", "calendars": ["primary", "..."], "credential_file": "..."}]
+
+    'calendars' defaults to the primary calendar, and 'credential_file' to --credential-file
+    """
+    with open(path) as f:
+        accounts: List[Json] = json.load(f)
+    jobs: List[ExportJob] = []
+    for account in accounts:
+        cred = os.path.expanduser(
+            account.get("credential_file", default_credential_file)
+        )
+        for calendar in account.get("calendars", ["primary"]):
+            jobs.append(ExportJob(account["email"], calendar, cred))
+    return jobs
+
+
+def export_events(
+    cal: GoogleCalendar, job: ExportJob, end_days: int, incremental: bool
+) -> Iterator[GcalAppointmentData]:
+    if incremental:
+        state_file = os.path.join(
+            default_state_dir(), f"{job.email}-{job.calendar}.json"
+        )
+        state = sync_events(
+            api_list_page(cal),
+            job.calendar,
+            load_sync_state(state_file),
+            convert=lambda item: event_to_dict(EventSerializer.to_object(item)),
+        )
+        save_sync_state(state_file, state)
+        return iter(events_in_range(state, end_days))
+    else:
+        return map(event_to_dict, get_events(cal, end_days))
+
+
+def export_filename(job: ExportJob, fmt: str) -> str:
+    """
+    >>> export_filename(ExportJob("me@gmail.com", "primary", "creds.json"), "json")
+    'me@gmail.com-primary.json'
+    >>> export_filename(ExportJob("me@gmail.com", "a/b", "creds.json"), "ndjson")
+    'me@gmail.com-a_b.ndjson'
+    """
+    calendar = job.calendar.replace(os.sep, "_")
+    return f"{job.email}-{calendar}.{fmt}"
+
+
+def export_to_file(
+    cal: GoogleCalendar,
+    job: ExportJob,
+    output_dir: str,
+    end_days: int,
+    fmt: str,
+    incremental: bool,
+) -> str:
+    """
+    Stream the export to a temporary file in the output directory, and rename
+    it once its complete, so readers never see a partially written export
+    """
+    target = os.path.join(output_dir, export_filename(job, fmt))
+    write_export(export_events(cal, job, end_days, incremental), target, fmt)
+    return target
 
 
 @click.command()
-@click.option("--email", help="Google Email to export", required=True)
+@click.option("--email", help="Google Email to export")
 @click.option(
     "--credential-file",
     help="Google credential file",
@@ -138,21 +310,150 @@ def get_events(cal: GoogleCalendar, end_days: int) -> Iterator[Event]:
 )
 @click.option(
     "--calendar",
-    help="Specify which calendar to export from",
-    default="primary",
+    help="Specify which calendar to export from, can be passed multiple times",
+    default=["primary"],
+    multiple=True,
+    show_default=True,
+)
+@click.option(
+    "--ndjson",
+    help="Print newline-delimited JSON (one event per line) instead of a JSON array",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--binary",
+    help="Write the compact binary format the calcurse_load gcal extension reads (see gcal_index.binary) instead of JSON",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--incremental",
+    help="Only request events which changed since the last export, using a sync token saved in the calcurse_load data directory",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--config",
+    "config_file",
+    help="JSON file listing the emails/calendars to export",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--output-dir",
+    help="Write one export per calendar to this directory, instead of printing to STDOUT. Required when exporting multiple calendars",
+    type=click.Path(file_okay=False),
+)
+@click.option(
+    "--to-calcurse-load",
+    help="Write the exports to the directory the calcurse_load gcal extension reads ($CALCURSE_LOAD_DIR/gcal), like --output-dir",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--workers",
+    help="Number of calendars to export concurrently",
+    default=4,
+    type=int,
     show_default=True,
 )
-def main(email: str, credential_file: str, end_days: int, calendar: str) -> None:
+def main(
+    email: Optional[str],
+    credential_file: str,
+    end_days: int,
+    calendar: Sequence[str],
+    ndjson: bool,
+    binary: bool,
+    incremental: bool,
+    config_file: Optional[str],
+    output_dir: Optional[str],
+    to_calcurse_load: bool,
+    workers: int,
+) -> None:
     """
     Export Google Calendar events
     """
-    if not os.path.exists(credential_file):
-        print(
-            f"Credential file at {credential_file} doesn't exist. Put it there or provide --credential-file"
-        )
+    if ndjson and binary:
+        print("Provide only one of --ndjson and --binary", file=sys.stderr)
+        sys.exit(1)
+    fmt = BINARY_FORMAT if binary else "ndjson" if ndjson else "json"
+    if to_calcurse_load:
+        output_dir = os.path.join(default_data_dir(), "gcal")
+    jobs: List[ExportJob] = []
+    if email is not None:
+        jobs.extend(ExportJob(email, c, credential_file) for c in calendar)
+    if config_file is not None:
+        jobs.extend(load_config(config_file, credential_file))
+    if not jobs:
+        print("Provide an --email or a --config file", file=sys.stderr)
+        sys.exit(1)
+    for job in jobs:
+        if not os.path.exists(job.credential_file):
+            print(
+                f"Credential file at {job.credential_file} doesn't exist. Put it there or provide --credential-file"
+            )
+            sys.exit(1)
+
+    description_cache.path = os.path.join(default_state_dir(), "descriptions.json")
+    description_cache.load()
+    try:
+        _export(jobs, end_days, fmt, incremental, output_dir, workers)
+    finally:
+        description_cache.save()
+
+
+def _export(
+    jobs: List[ExportJob],
+    end_days: int,
+    fmt: str,
+    incremental: bool,
+    output_dir: Optional[str],
+    workers: int,
+) -> None:
+    if output_dir is None:
+        if len(jobs) > 1:
+            print(
+                "Provide an --output-dir to export multiple calendars", file=sys.stderr
+            )
+            sys.exit(1)
+        job = jobs[0]
+        cal = create_calendar(job.email, job.credential_file, job.calendar)
+        events = export_events(cal, job, end_days, incremental)
+        if fmt == BINARY_FORMAT:
+            write_binary(events, sys.stdout.buffer)
+        else:
+            write_events(events, sys.stdout, ndjson=fmt == "ndjson")
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    # authenticate serially, since that may prompt/write the token file
+    calendars = [
+        (job, create_calendar(job.email, job.credential_file, job.calendar))
+        for job in jobs
+    ]
+    failed = False
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(
+                export_to_file, cal, job, output_dir, end_days, fmt, incremental
+            ): job
+            for job, cal in calendars
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                target = future.result()
+            except Exception as e:
+                failed = True
+                print(
+                    f"Failed to export {job.email} {job.calendar}: {e}", file=sys.stderr
+                )
+            else:
+                print(
+                    f"Exported {job.email} {job.calendar} to {target}", file=sys.stderr
+                )
+    if failed:
         sys.exit(1)
-    cal = create_calendar(email, credential_file, calendar)
-    print(json.dumps(list(map(event_to_dict, get_events(cal, end_days)))))
 
 
 if __name__ == "__main__":
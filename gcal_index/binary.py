@@ -0,0 +1,353 @@
+"""
+A compact binary export format, which is smaller and faster to load than JSON
+
+Summaries, attendee emails, links and the like repeat across events, so each
+distinct string is stored once, in a string table at the end of the file, and
+records refer to strings by their index. Each record starts with a fixed-width
+header (the length of the record, the start/end/original start and a
+fingerprint of the event), so a reader can mmap the file and skip records
+(e.g. outside some time range, or which it already converted) without decoding them
+
+Layout, with all integers little-endian:
+
+    MAGIC
+    records, each RECORD_HEADER followed by u32s: the number of description links,
+        recurrence lines and attendees, then the indexes of the strings: the
+        STRING_FIELDS, the description text, the links, the recurrence lines
+        and the attendees (email, response_status)
+    string offsets, u64 * (number of strings + 1), into the string data. The
+        first string is empty, its index (NO_STRING) is used for None
+    string data, UTF-8
+    FOOTER: the position of the string offsets, the number of strings, MAGIC
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    TYPE_CHECKING,
+    cast,
+)
+
+if TYPE_CHECKING:
+    from .__main__ import GcalAppointmentData
+
+Json = Dict[str, Any]
+
+# also the file extension
+BINARY_FORMAT = "gcalbin"
+
+MAGIC = b"GCALBIN1"
+# (length of the string indexes, start, end, original start, fingerprint)
+RECORD_HEADER = struct.Struct("<IqqqQ")
+# (position of the string offsets, number of strings, MAGIC)
+FOOTER = struct.Struct("<QQ8s")
+
+# None, for the integer/string fields
+NO_INT = -(2**63)
+NO_STRING = 0
+# number of u32s before the string indexes, and the number of single strings
+COUNTS = 3
+SINGLE_STRINGS = 7
+
+STRING_FIELDS = (
+    "summary",
+    "event_id",
+    "location",
+    "event_link",
+    "timezone",
+    "recurring_event_id",
+)
+
+_SWAP = sys.byteorder != "little"
+
+
+def _int(value: Optional[int]) -> int:
+    return NO_INT if value is None else value
+
+
+def normalize(event: Mapping[str, Any]) -> Json:
+    """
+    The event as it's decoded from the binary format: with every key (older
+    exports don't have some), in the same order
+
+    >>> normalize({"summary": "ev", "start": 1, "end": None, "event_id": "1"})["description"]
+    {'text': None, 'links': []}
+    """
+    description = event.get("description") or {}
+    return {
+        "summary": event.get("summary"),
+        "start": event.get("start"),
+        "end": event.get("end"),
+        "event_id": event.get("event_id"),
+        "description": {
+            "text": description.get("text"),
+            "links": list(description.get("links") or []),
+        },
+        "location": event.get("location"),
+        "recurrence": list(event.get("recurrence") or []),
+        "attendees": [
+            {"email": a.get("email"), "response_status": a.get("response_status")}
+            for a in event.get("attendees") or []
+        ],
+        "event_link": event.get("event_link"),
+        "timezone": event.get("timezone"),
+        "recurring_event_id": event.get("recurring_event_id"),
+        "original_start": event.get("original_start"),
+    }
+
+
+def event_fingerprint(event: Json) -> int:
+    """A 64-bit hash of a normalized event, changes if anything in the event does"""
+    text = json.dumps(event)
+    return int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], "big")
+
+
+class StringTable:
+    """
+    >>> strings = StringTable()
+    >>> strings.ref("a"), strings.ref("bc"), strings.ref("a"), strings.ref(None)
+    (1, 2, 1, 0)
+    >>> bytes(strings.data), list(strings.offsets)
+    (b'abc', [0, 0, 1, 3])
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.data = bytearray()
+        # starting with NO_STRING
+        self.offsets = array("Q", [0, 0])
+
+    def ref(self, value: Optional[str]) -> int:
+        if value is None:
+            return NO_STRING
+        i = self.ids.get(value)
+        if i is None:
+            if not isinstance(value, str):
+                raise TypeError(f"Expected a string, got {value!r}")
+            i = self.ids[value] = len(self.offsets) - 1
+            self.data += value.encode()
+            self.offsets.append(len(self.data))
+        return i
+
+
+def encode_event(event: Mapping[str, Any], strings: StringTable) -> bytes:
+    """Encode an event as a record, adding its strings to the string table"""
+    normalized = normalize(event)
+    ref = strings.ref
+    description = normalized["description"]
+    refs = array(
+        "I",
+        [
+            len(description["links"]),
+            len(normalized["recurrence"]),
+            len(normalized["attendees"]),
+        ],
+    )
+    refs.extend(ref(normalized[f]) for f in STRING_FIELDS)
+    refs.append(ref(description["text"]))
+    refs.extend(ref(link) for link in description["links"])
+    refs.extend(ref(line) for line in normalized["recurrence"])
+    for attendee in normalized["attendees"]:
+        refs.append(ref(attendee["email"]))
+        refs.append(ref(attendee["response_status"]))
+    if _SWAP:
+        refs.byteswap()
+    body = refs.tobytes()
+    header = RECORD_HEADER.pack(
+        len(body),
+        _int(normalized["start"]),
+        _int(normalized["end"]),
+        _int(normalized["original_start"]),
+        event_fingerprint(normalized),
+    )
+    return header + body
+
+
+def write_binary(events: Iterable[Mapping[str, Any]], out: BinaryIO) -> int:
+    """
+    Write each event as soon as it's converted, followed by the string table
+    once all the events are written. Returns the number of events written
+
+    >>> import io
+    >>> out = io.BytesIO()
+    >>> events = [{"summary": "standup", "start": 10, "end": 20, "event_id": str(i),
+    ...     "attendees": [{"email": "me@example.com", "response_status": "accepted"}]}
+    ...     for i in range(3)]
+    >>> write_binary(iter(events), out)
+    3
+    >>> out.getvalue().count(b"me@example.com")
+    1
+    """
+    strings = StringTable()
+    out.write(MAGIC)
+    position = len(MAGIC)
+    written = 0
+    for event in events:
+        record = encode_event(event, strings)
+        out.write(record)
+        position += len(record)
+        written += 1
+    offsets = strings.offsets
+    if _SWAP:
+        offsets.byteswap()
+    out.write(offsets.tobytes())
+    out.write(strings.data)
+    out.write(FOOTER.pack(position, len(strings.offsets) - 1, MAGIC))
+    return written
+
+
+class Record(NamedTuple):
+    start: Optional[int]
+    end: Optional[int]
+    original_start: Optional[int]
+    fingerprint: int
+    # where the string indexes are in the file, and their length in bytes
+    offset: int
+    length: int
+
+
+class BinaryExport:
+    """
+    A memory mapped binary export. Records are read from their fixed-width
+    headers, and only decoded into events when asked for
+
+    >>> import tempfile
+    >>> events = [
+    ...     {"summary": "a", "start": 10, "end": None, "event_id": "1", "description": {"text": "notes", "links": []},
+    ...      "location": None, "recurrence": ["RRULE:FREQ=DAILY"], "attendees": [], "event_link": None},
+    ...     {"summary": "b", "start": None, "end": None, "event_id": "2", "recurring_event_id": "1", "original_start": 20}]
+    >>> with tempfile.NamedTemporaryFile(suffix=".gcalbin") as f:
+    ...     write_binary(events, f)
+    ...     f.flush()
+    ...     with BinaryExport(f.name) as export:
+    ...         records = list(export.records())
+    ...         decoded = [export.decode(r) for r in records]
+    2
+    >>> [(r.start, r.original_start) for r in records]
+    [(10, None), (None, 20)]
+    >>> decoded == [normalize(e) for e in events]
+    True
+    >>> records[0].fingerprint == event_fingerprint(normalize(events[0]))
+    True
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < len(MAGIC) + FOOTER.size:
+                raise ValueError(f"{path} is not a binary gcal export")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        strings_at, count, magic = FOOTER.unpack_from(self._map, size - FOOTER.size)
+        if self._map[: len(MAGIC)] != MAGIC or magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a binary gcal export")
+        self._records_end = strings_at
+        self._offsets = array("Q")
+        self._offsets.frombytes(self._map[strings_at : strings_at + 8 * (count + 1)])
+        if _SWAP:
+            self._offsets.byteswap()
+        self._data_start = strings_at + 8 * (count + 1)
+        # decoded when the first record is, so reading only the headers is fast
+        self._strings: Optional[List[Optional[str]]] = None
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "BinaryExport":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @property
+    def strings(self) -> List[Optional[str]]:
+        if self._strings is None:
+            offsets = self._offsets
+            data = self._map[self._data_start : self._data_start + offsets[-1]]
+            strings: List[Optional[str]] = [
+                data[start:end].decode() for start, end in zip(offsets, offsets[1:])
+            ]
+            strings[NO_STRING] = None
+            self._strings = strings
+        return self._strings
+
+    def records(self) -> Iterator[Record]:
+        unpack = RECORD_HEADER.unpack_from
+        new = tuple.__new__
+        header_size = RECORD_HEADER.size
+        position = len(MAGIC)
+        while position < self._records_end:
+            length, start, end, original_start, fp = unpack(self._map, position)
+            position += header_size
+            # tuple.__new__ skips the (python) NamedTuple constructor
+            yield new(
+                Record,
+                (
+                    None if start == NO_INT else start,
+                    None if end == NO_INT else end,
+                    None if original_start == NO_INT else original_start,
+                    fp,
+                    position,
+                    length,
+                ),
+            )
+            position += length
+
+    def decode(self, record: Record) -> "GcalAppointmentData":
+        refs = array("I")
+        refs.frombytes(self._map[record.offset : record.offset + record.length])
+        if _SWAP:
+            refs.byteswap()
+        n_links, n_recurrence = refs[0], refs[1]
+        indexes = refs[COUNTS:]
+        strings = self.strings
+        values = [strings[i] for i in indexes]
+        summary, event_id, location, event_link, tz, recurring_event_id, text = values[
+            :SINGLE_STRINGS
+        ]
+        links_end = SINGLE_STRINGS + n_links
+        recurrence_end = links_end + n_recurrence
+        links = values[SINGLE_STRINGS:links_end]
+        recurrence = values[links_end:recurrence_end]
+        attendees = [
+            {"email": email, "response_status": status}
+            for email, status in zip(
+                values[recurrence_end::2], values[recurrence_end + 1 :: 2]
+            )
+        ]
+        event: Json = {
+            "summary": summary,
+            "start": record.start,
+            "end": record.end,
+            "event_id": event_id,
+            "description": {"text": text, "links": links},
+            "location": location,
+            "recurrence": recurrence,
+            "attendees": attendees,
+            "event_link": event_link,
+            "timezone": tz,
+            "recurring_event_id": recurring_event_id,
+            "original_start": record.original_start,
+        }
+        return cast("GcalAppointmentData", event)
+
+
+def read_binary(path: str) -> Iterator["GcalAppointmentData"]:
+    """Decode every event in a binary export"""
+    with BinaryExport(path) as export:
+        for record in export.records():
+            yield export.decode(record)
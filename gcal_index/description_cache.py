@@ -0,0 +1,94 @@
+"""
+A size-bounded LRU cache of parsed HTML descriptions, keyed by
+a hash of the raw HTML, which can be persisted between exports
+
+Recurring events share identical descriptions, and most descriptions
+don't change between exports, so this avoids re-parsing them with lxml
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+Json = Dict[str, Any]
+
+CACHE_VERSION = 1
+
+
+class DescriptionCache:
+    """
+    >>> calls = []
+    >>> def parse(html):
+    ...     calls.append(html)
+    ...     return {"text": html.upper(), "links": []}
+    >>> cache = DescriptionCache(max_entries=2)
+    >>> cache.get("<b>a</b>", parse)["text"], cache.get("<b>a</b>", parse)["text"]
+    ('<B>A</B>', '<B>A</B>')
+    >>> len(calls)
+    1
+    >>> _ = cache.get("<b>b</b>", parse), cache.get("<b>c</b>", parse)
+    >>> len(cache)
+    2
+    >>> _ = cache.get("<b>a</b>", parse)  # was evicted, so is parsed again
+    >>> len(calls)
+    4
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 50_000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Json]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return
+        with self._lock:
+            self._entries = OrderedDict(data["entries"])
+            self._evict()
+
+    def save(self) -> None:
+        if self.path is None or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp, "w") as f:
+                json.dump({"version": CACHE_VERSION, "entries": self._entries}, f)
+            self._dirty = False
+        os.replace(tmp, self.path)
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, htmlstr: str, parse: Callable[[str], Json]) -> Json:
+        """
+        Return the parsed description for this HTML, calling 'parse' if it isn't cached
+        """
+        key = hashlib.sha1(htmlstr.encode()).hexdigest()
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        data = parse(htmlstr)
+        with self._lock:
+            self._entries[key] = data
+            self._dirty = True
+            self._evict()
+        return data
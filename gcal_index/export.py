@@ -0,0 +1,97 @@
+"""
+Writes exports as the events are converted, so only one event
+(not the whole list, or the whole serialized string) is in memory at a time
+"""
+
+import os
+import json
+import tempfile
+from typing import Iterator, TextIO, TYPE_CHECKING
+
+from .binary import BINARY_FORMAT, write_binary
+
+if TYPE_CHECKING:
+    from .__main__ import GcalAppointmentData
+
+# also the file extensions
+FORMATS = ("json", "ndjson", BINARY_FORMAT)
+
+
+def write_events(
+    events: Iterator["GcalAppointmentData"], out: TextIO, ndjson: bool
+) -> int:
+    """
+    Write each event as soon as it's converted, as newline-delimited JSON or
+    as the items of a JSON array. Returns the number of events written
+
+    >>> import io
+    >>> out = io.StringIO()
+    >>> write_events(iter([{"summary": "a"}, {"summary": "b"}]), out, ndjson=False)
+    2
+    >>> out.getvalue()
+    '[{"summary": "a"}, {"summary": "b"}]\\n'
+    >>> out = io.StringIO()
+    >>> write_events(iter([{"summary": "a"}, {"summary": "b"}]), out, ndjson=True)
+    2
+    >>> out.getvalue()
+    '{"summary": "a"}\\n{"summary": "b"}\\n'
+    >>> out = io.StringIO()
+    >>> write_events(iter([]), out, ndjson=False), out.getvalue()
+    (0, '[]\\n')
+    """
+    written = 0
+    if ndjson:
+        for event in events:
+            out.write(json.dumps(event))
+            out.write("\n")
+            written += 1
+        return written
+    # the same output as json.dumps(list(events))
+    out.write("[")
+    for event in events:
+        if written:
+            out.write(", ")
+        out.write(json.dumps(event))
+        written += 1
+    out.write("]\n")
+    return written
+
+
+def write_export(events: Iterator["GcalAppointmentData"], target: str, fmt: str) -> int:
+    """
+    Stream the events to a temporary file in the same directory as target (in
+    one of the FORMATS), and rename it to target once it's complete, so readers
+    never see a partially written export. If converting/requesting the events
+    fails, target is left as it was
+
+    >>> d = tempfile.mkdtemp()
+    >>> target = os.path.join(d, "export.ndjson")
+    >>> def fake_calendar():
+    ...     yield {"summary": "a"}
+    ...     yield {"summary": "b"}
+    >>> write_export(fake_calendar(), target, "ndjson")
+    2
+    >>> def failing_calendar():
+    ...     yield {"summary": "c"}
+    ...     raise RuntimeError("rate limited")
+    >>> write_export(failing_calendar(), target, "ndjson")
+    Traceback (most recent call last):
+    ...
+    RuntimeError: rate limited
+    >>> os.listdir(d), open(target).read()
+    (['export.ndjson'], '{"summary": "a"}\\n{"summary": "b"}\\n')
+    """
+    output_dir = os.path.dirname(target) or "."
+    fd, tmp = tempfile.mkstemp(dir=output_dir, prefix=".gcal_index.")
+    try:
+        if fmt == BINARY_FORMAT:
+            with os.fdopen(fd, "wb") as b:
+                written = write_binary(events, b)
+        else:
+            with os.fdopen(fd, "w") as f:
+                written = write_events(events, f, ndjson=fmt == "ndjson")
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return written
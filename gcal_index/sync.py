@@ -0,0 +1,168 @@
+"""
+Incremental export using the Google Calendar sync tokens
+
+The sync token and the previously exported events are saved in the
+calcurse_load data directory, so subsequent runs only request the
+events that were changed or deleted since the last export
+"""
+
+import os
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from gcsa.google_calendar import GoogleCalendar  # type: ignore[import]
+    from .__main__ import GcalAppointmentData
+
+Json = Dict[str, Any]
+
+home = os.path.expanduser("~")
+
+
+def default_data_dir() -> str:
+    """The calcurse_load data directory"""
+    return os.environ.get(
+        "CALCURSE_LOAD_DIR",
+        os.path.join(
+            os.environ.get("XDG_DATA_HOME", os.path.join(home, ".local", "share")),
+            "calcurse_load",
+        ),
+    )
+
+
+def default_state_dir() -> str:
+    return os.path.join(default_data_dir(), "gcal_index")
+
+
+# only request the parts of each event that event_to_dict uses
+EVENT_LIST_FIELDS = (
+    "nextPageToken,nextSyncToken,items(id,status,summary,description,location,"
+    "start,end,recurrence,attendees(email,responseStatus),htmlLink,"
+    "recurringEventId,originalStartTime)"
+)
+# the most events the API returns per page
+MAX_PAGE_SIZE = 2500
+
+
+# bumped when the request parameters change, since a sync
+# token can only be used with the parameters it was created with
+SYNC_VERSION = 2
+
+
+class SyncState(TypedDict):
+    version: int
+    sync_token: Optional[str]
+    events: Dict[str, "GcalAppointmentData"]
+
+
+def empty_sync_state() -> SyncState:
+    return {"version": SYNC_VERSION, "sync_token": None, "events": {}}
+
+
+def load_sync_state(path: str) -> SyncState:
+    try:
+        with open(path) as f:
+            state: SyncState = json.load(f)
+    except (OSError, ValueError):
+        return empty_sync_state()
+    if state.get("version") != SYNC_VERSION:
+        return empty_sync_state()
+    return state
+
+
+def save_sync_state(path: str, state: SyncState) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# takes keyword arguments for the events.list API, returns the response for one page
+ListPage = Callable[..., Json]
+
+
+def api_list_page(cal: "GoogleCalendar") -> ListPage:
+    def _list_page(**kwargs: Any) -> Json:
+        resp: Json = cal.service.events().list(**kwargs).execute()
+        return resp
+
+    return _list_page
+
+
+def _is_gone(e: Exception) -> bool:
+    """The API responds with a 410 if the sync token has expired"""
+    return getattr(getattr(e, "resp", None), "status", None) == 410
+
+
+def _list_changes(
+    list_page: ListPage, calendar_id: str, sync_token: Optional[str]
+) -> Tuple[List[Json], str]:
+    items: List[Json] = []
+    page_token: Optional[str] = None
+    while True:
+        # recurring events aren't expanded, so they can be converted to calcurse recurrences
+        kwargs: Json = {
+            "calendarId": calendar_id,
+            "singleEvents": False,
+            "fields": EVENT_LIST_FIELDS,
+            "maxResults": MAX_PAGE_SIZE,
+        }
+        if sync_token is not None:
+            kwargs["syncToken"] = sync_token
+        if page_token is not None:
+            kwargs["pageToken"] = page_token
+        resp = list_page(**kwargs)
+        items.extend(resp.get("items", []))
+        page_token = resp.get("nextPageToken")
+        if page_token is None:
+            return items, resp["nextSyncToken"]
+
+
+def sync_events(
+    list_page: ListPage,
+    calendar_id: str,
+    state: SyncState,
+    convert: Callable[[Json], "GcalAppointmentData"],
+) -> SyncState:
+    """
+    Request the events which changed since the last sync token, and merge
+    them into the previous set of events. If there is no sync token or it
+    has expired, this does a full sync
+
+    'convert' converts an event resource from the API to the exported format
+
+    Cancelled occurrences of recurring events are kept (they're exceptions
+    to the recurrence), other cancelled events are removed
+
+    >>> pages = {
+    ...     None: {"items": [{"id": "a", "summary": "A", "start": {"date": "2020-01-01"}}], "nextPageToken": "p2"},
+    ...     "p2": {"items": [{"id": "b", "summary": "B", "start": {"date": "2020-01-02"}}], "nextSyncToken": "s1"},
+    ...     "s1": {"items": [{"id": "a", "status": "cancelled"}, {"id": "c", "summary": "C", "start": {"date": "2020-01-03"}},
+    ...         {"id": "c_1", "status": "cancelled", "recurringEventId": "c"}], "nextSyncToken": "s2"},
+    ... }
+    >>> def fake_list_page(**kwargs):
+    ...     return pages[kwargs.get("pageToken", kwargs.get("syncToken"))]
+    >>> convert = lambda item: item.get("summary", "cancelled")
+    >>> state = sync_events(fake_list_page, "primary", empty_sync_state(), convert)
+    >>> state["sync_token"], sorted(state["events"])
+    ('s1', ['a', 'b'])
+    >>> state = sync_events(fake_list_page, "primary", state, convert)
+    >>> state["sync_token"], state["events"]
+    ('s2', {'b': 'B', 'c': 'C', 'c_1': 'cancelled'})
+    """
+    sync_token = state["sync_token"]
+    events = dict(state["events"]) if sync_token is not None else {}
+    try:
+        items, next_token = _list_changes(list_page, calendar_id, sync_token)
+    except Exception as e:
+        if sync_token is None or not _is_gone(e):
+            raise
+        events = {}
+        items, next_token = _list_changes(list_page, calendar_id, None)
+    for item in items:
+        if item.get("status") == "cancelled" and "recurringEventId" not in item:
+            events.pop(item["id"], None)
+        else:
+            events[item["id"]] = convert(item)
+    return {"version": SYNC_VERSION, "sync_token": next_token, "events": events}